@@ -4,20 +4,13 @@
 # --- Імпорти ---
 import asyncio
 import datetime
-import json
 import logging
 import mimetypes
-import re
 import random
-import tempfile
 import time
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, BinaryIO, Awaitable, Callable, Dict, List, Optional, Set, Tuple
 
-import aiosqlite
-import google.generativeai as genai
-from google.generativeai.types import HarmBlockThreshold, HarmCategory
-from PIL import Image, UnidentifiedImageError
 
 from aiogram import Bot, Dispatcher, Router, F
 from aiogram.enums import ChatAction, ParseMode
@@ -25,6 +18,7 @@ from aiogram.exceptions import TelegramAPIError, TelegramBadRequest, TelegramFor
 from aiogram.filters import Command
 from aiogram.types import (
 	Message,
+	ChatMemberUpdated,
 	ChatMemberAdministrator,
 	ChatMemberOwner,
 	ChatMemberMember,
@@ -33,146 +27,161 @@ from aiogram.types import (
 
 # --- Модулі ---
 import config
-from config import GEMINI_API_KEY, SUPPORTED_IMAGE_FORMATS
+from config import SUPPORTED_IMAGE_FORMATS
+from background import spawn
+from lazy_imports import lazy_import
+from log_setup import bind_log_context
+from md_render import escape_text, render_markdown_v2, truncate_markdown
+from image_cache import image_cache_key, init_image_cache, get_cached_description, store_description
+from user_queue import CoalescingQueue, KeyedLocks
+from prompts import prompt_registry
+from sessions import session_registry
+from state_store import state_store
+from maintenance import format_db_stats, get_db_stats, maintenance_enabled, maintenance_running, run_maintenance, stop_maintenance
+from usage import init_usage, record_usage, get_quota_status, get_top_consumers
+from gemini_client import (
+	GeminiBusyError,
+	GeminiTimeoutError,
+	generate_content,
+	send_chat_message,
+	stream_chat_message,
+)
+from chat_history import (
+	DB_NAME,
+	DEFAULT_TOKEN_BUDGET,
+	HISTORY_TOKEN_BUDGET,
+	init_db as init_history_db,
+	close_db as close_history_db,
+	get_history_window,
+	get_messages_for_summary,
+	save_summary_to_db,
+	save_user_history_to_db,
+	append_messages_to_db,
+	delete_user_history_from_db,
+)
 from waifu import waifu_cmd, waifu_router
 
-# --- Додатковий блок для telegramify_markdown ---
-try:
-	import telegramify_markdown
-	TELEGRAMIFY_MARKDOWN_AVAILABLE = True
-except ImportError:
-	TELEGRAMIFY_MARKDOWN_AVAILABLE = False
-	logging.warning("Бібліотека 'telegramify_markdown' не знайдена. Функції екранування Markdown будуть працювати в обмеженому режимі.")
+# --- Pillow імпортується при першому фото або у warm_up ---
+Image = lazy_import("PIL.Image")
 
-# --- Налаштування логування ---
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# --- Логування (налаштовується в log_setup) ---
 logger = logging.getLogger("yuki.image_analyzer")
-logger.setLevel(logging.INFO)
-
-# --- Ім'я файлу бази даних для історії чатів (одна база для всіх) ---
-DB_NAME = 'yuki_chat_history.db'
 
 # --- Функція для завантаження системного промпта з JSON файлу ---
 def load_system_prompt(file_name: str, key_name: str, default_message: str) -> str:
 	"""
-	Завантажує системний промпт з вказаного JSON файлу за вказаним ключем.
+	Повертає системний промпт з вказаного JSON файлу за вказаним ключем.
+	Файл розбирається один раз і кешується в prompt_registry; перечитується лише після змін.
 	Якщо файл не знайдено, JSON некоректний або ключ відсутній/порожній, повертає default_message.
 	"""
-	prompt_content = ""
-	try:
-		with open(file_name, 'r', encoding='utf-8') as f:
-			prompts_data = json.load(f)
-			prompt_content = prompts_data.get(key_name)
-
-			if isinstance(prompt_content, list):
-				prompt_content = "".join(prompt_content)
-			elif not isinstance(prompt_content, str):
-				prompt_content = ""
-
-			if not prompt_content:
-				logger.error(f"Не вдалося завантажити '%s' з %s. Значення відсутнє або порожнє.", key_name, file_name)
-				prompt_content = default_message
-	except FileNotFoundError:
-		logger.error(f"Файл '%s' не знайдено. Переконайтеся, що він існує і шлях правильний.", file_name)
-		prompt_content = default_message
-	except json.JSONDecodeError as e:
-		logger.error(f"Помилка декодування JSON у '%s'. Перевірте синтаксис файлу. Деталі: %s", file_name, e)
-		prompt_content = default_message
-	except Exception as e:
-		logger.error(f"Невідома помилка при завантаженні промпта з '%s': %s", file_name, e)
-		prompt_content = default_message
-	return prompt_content
+	return prompt_registry.get(file_name, key_name, default_message)
 
 # --- Конфігурація Gemini ---
 MAX_LENGTH = 2048
 
-genai.configure(api_key=config.GEMINI_API_KEY)
-
-gemini_model = genai.GenerativeModel(
-	"gemini-2.0-flash",
-	generation_config={
-		"temperature": 0.9,
-		"top_p": 1,
-		"top_k": 1,
-		"max_output_tokens": 2048,
-	},
-	safety_settings=[
-		{"category": HarmCategory.HARM_CATEGORY_HARASSMENT, "threshold": HarmBlockThreshold.BLOCK_NONE},
-		{"category": HarmCategory.HARM_CATEGORY_HATE_SPEECH, "threshold": HarmBlockThreshold.BLOCK_NONE},
-		{"category": HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT, "threshold": HarmBlockThreshold.BLOCK_NONE},
-		{"category": HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT, "threshold": HarmBlockThreshold.BLOCK_NONE},
-	]
-)
+# --- Потокові відповіді: увімкнення та мінімальний інтервал між редагуваннями (сек) ---
+GEMINI_STREAMING = getattr(config, "GEMINI_STREAMING", True)
+STREAM_EDIT_INTERVAL = getattr(config, "STREAM_EDIT_INTERVAL", 1.0)
+WAIFU_MARKER = "[CALL_WAIFU_COMMAND]"
 
-# --- Глобальні змінні для керування сесіями Gemini ---
-active_users = set()
+# --- Максимальна сторона зображення (px), що надсилається в Gemini ---
+IMAGE_MAX_EDGE = getattr(config, "IMAGE_MAX_EDGE", 1536)
 
-# --- Налаштування бази даних SQLite ---
+# --- Ініціалізація бази даних ---
 async def init_db():
-	"""Ініціалізує базу даних, створюючи таблицю для історії чатів з полем user_role."""
-	try:
-		async with aiosqlite.connect(DB_NAME) as db:
-			await db.execute('''
-				CREATE TABLE IF NOT EXISTS chat_histories (
-					user_id INTEGER PRIMARY KEY,
-					history TEXT,
-					user_role TEXT DEFAULT 'REGULAR'
-				)
-			''')
-			await db.commit()
-			logger.info(f"База даних '%s' ініціалізована успішно з полем user_role.", DB_NAME)
-	except aiosqlite.Error as e:
-		logger.error(f"Помилка ініціалізації бази даних '%s': %s", DB_NAME, e)
-
-# --- Отримання історії користувача з бази даних ---
-async def get_user_history_from_db(user_id: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
-	"""Завантажує історію чату та роль для конкретного користувача з бази даних."""
-	try:
-		async with aiosqlite.connect(DB_NAME) as db:
-			cursor = await db.execute(
-				"SELECT history, user_role FROM chat_histories WHERE user_id = ?", (user_id,)
-			)
-			result = await cursor.fetchone()
-			if result:
-				history_str, user_role = result
-				try:
-					history = json.loads(history_str)
-					logger.info(f"Історія та роль '{user_role}' для користувача {user_id} завантажені з '{DB_NAME}'.")
-					return history, user_role
-				except json.JSONDecodeError as e:
-					logger.error(f"Помилка декодування історії JSON для користувача {user_id} у '{DB_NAME}': {e}. Історія буде скинута.")
-					return [], None
-			logger.info(f"Історія для користувача {user_id} відсутня у '{DB_NAME}'.")
-			return [], None
-	except aiosqlite.Error as e:
-		logger.error(f"Помилка при завантаженні історії для користувача {user_id} з '{DB_NAME}': {e}")
-		return [], None
-
-# --- Збереження історії користувача в базу даних ---
-async def save_user_history_to_db(user_id: int, history: List[Dict[str, Any]], user_role: str):
-	"""Зберігає історію чату та роль для конкретного користувача в базу даних."""
+	"""Відкриває пул з'єднань і створює таблиці історії чатів, кешу описів зображень, обліку токенів, сесій та стану розмов."""
+	await init_history_db()
+	await init_image_cache()
+	await init_usage()
+	await session_registry.open()
+	await state_store.open()
+
+async def close_db():
+	"""Зупиняє обслуговування бази, закриває сховища сесій і стану та пул з'єднань з базою даних."""
+	await stop_maintenance()
+	await session_registry.close()
+	await state_store.close()
+	await close_history_db()
+
+# --- Склеювання швидких повідомлень одного користувача (сек) ---
+YUKI_COALESCE_WINDOW = getattr(config, "YUKI_COALESCE_WINDOW", 1.5)
+YUKI_COALESCE_MAX_WAIT = getattr(config, "YUKI_COALESCE_MAX_WAIT", 5.0)
+
+# --- Глобальні змінні для керування сесіями Gemini ---
+history_locks = KeyedLocks()
+
+# --- Фонове стиснення старої частини історії в підсумок ---
+SUMMARY_PROMPT = (
+	"Ти ведеш стислий конспект розмови між Yuki та користувачем. "
+	"Онови підсумок, додавши до нього нові репліки. Збережи факти про користувача, "
+	"домовленості, імена, уподобання та незавершені теми. Пиши від третьої особи, "
+	"українською, не більше 12 речень.\n\n"
+	"Попередній підсумок:\n{previous_summary}\n\n"
+	"Нові репліки:\n{transcript}"
+)
+
+compaction_in_progress: Set[int] = set()
+
+# --- Денні квоти токенів: м'яка — попередження раз на день, жорстка — відмова ---
+SOFT_QUOTA_NOTICE = "\n\n🌸 Ми сьогодні вже багато поговорили — скоро Юкі доведеться відпочити до завтра."
+HARD_QUOTA_REPLY = "🌙 На сьогодні Юкі вже дуже втомилась від розмов... Повертайся завтра, я чекатиму 💖"
+soft_quota_warned: Set[Tuple[int, str]] = set()
+
+def quota_day() -> str:
+	return datetime.date.today().isoformat()
+
+def quota_role(user_id: int) -> str:
+	return 'TENZO' if user_id == config.TENZO_USER_ID else 'REGULAR'
+
+async def hard_quota_exceeded(user_id: int) -> bool:
+	"""Чи вичерпав користувач жорстку денну квоту — перед будь-яким платним викликом Gemini від його імені."""
+	return (await get_quota_status(user_id, quota_role(user_id))).hard_exceeded
+
+def mark_soft_quota_warned(user_id: int):
+	global soft_quota_warned
+	today = quota_day()
+	soft_quota_warned = {key for key in soft_quota_warned if key[1] == today}
+	soft_quota_warned.add((user_id, today))
+
+def schedule_history_compaction(user_id: int, until_seq: int):
+	"""Запускає фонове стиснення історії, якщо для цього користувача воно ще не виконується."""
+	if user_id in compaction_in_progress:
+		return
+	compaction_in_progress.add(user_id)
+	spawn(compact_history(user_id, until_seq), name=f"compact-history-{user_id}")
+
+async def compact_history(user_id: int, until_seq: int):
+	"""
+	Стискає повідомлення до `until_seq` разом із попереднім підсумком в один новий підсумок.
+	Довгу нестиснуту частину (наприклад, після міграції) обробляє порціями від найстаріших.
+	"""
 	try:
-		async with aiosqlite.connect(DB_NAME) as db:
-			history_json = json.dumps(history, ensure_ascii=False)
-			await db.execute(
-				"INSERT OR REPLACE INTO chat_histories (user_id, history, user_role) VALUES (?, ?, ?)",
-				(user_id, history_json, user_role)
+		while True:
+			# Підсумок теж витрачає токени користувача — після жорсткої квоти не стискаємо
+			if await hard_quota_exceeded(user_id):
+				logger.info("Стиснення історії користувача %d відкладено: вичерпано денну квоту.", user_id)
+				return
+			previous_summary, messages, last_seq = await get_messages_for_summary(user_id, until_seq)
+			if not messages:
+				return
+
+			transcript = "\n".join(
+				f"{'Користувач' if msg['role'] == 'user' else 'Yuki'}: {' '.join(str(part) for part in msg['parts'])}"
+				for msg in messages
 			)
-			await db.commit()
-			logger.info(f"Історія та роль '{user_role}' для користувача {user_id} збережена в '{DB_NAME}'.")
-	except aiosqlite.Error as e:
-		logger.error(f"Помилка при збереженні історії для користувача {user_id} у '{DB_NAME}': {e}")
-
-# --- Видалення історії користувача з бази даних ---
-async def delete_user_history_from_db(user_id: int):
-	"""Видаляє історію чату для конкретного користувача з бази даних."""
-	try:
-		async with aiosqlite.connect(DB_NAME) as db:
-			await db.execute("DELETE FROM chat_histories WHERE user_id = ?", (user_id,))
-			await db.commit()
-			logger.info(f"Історія для користувача {user_id} видалена з '{DB_NAME}'.")
-	except aiosqlite.Error as e:
-		logger.error(f"Помилка при видаленні історії для користувача {user_id}: {e}")
+			prompt = SUMMARY_PROMPT.format(previous_summary=previous_summary or "(ще немає)", transcript=transcript)
+			response = await generate_content(prompt)
+			await record_usage(user_id, response)
+			summary = (response.text or "").strip()
+			if not summary or not await save_summary_to_db(user_id, summary, last_seq):
+				return
+			logger.info("Історію користувача %d стиснуто до seq=%d (%d повідомлень).", user_id, last_seq, len(messages))
+			if last_seq >= until_seq:
+				return
+	except Exception as e:
+		logger.warning("Не вдалося стиснути історію користувача %d: %s", user_id, e)
+	finally:
+		compaction_in_progress.discard(user_id)
 
 # --- Допоміжна функція для видалення повідомлень ---
 async def delete_message_after_delay(message: Message, delay: int = 3):
@@ -189,14 +198,36 @@ async def delete_message_after_delay(message: Message, delay: int = 3):
 		)
 
 # --- Функції для взаємодії з Gemini ---
-async def get_gemini_response(user_id: int, text: str, image: Image.Image = None) -> str:
+async def get_gemini_response(
+	user_id: int,
+	text: str,
+	image: "Image.Image" = None,
+	on_chunk: Optional[Callable[[str], Awaitable[None]]] = None,
+	image_description: Optional[str] = None,
+	description_cache_key: Optional[str] = None
+) -> str:
 	"""
 	Отримує відповідь від Gemini, використовуючи історію чату для конкретного користувача.
 	Динамічно вибирає системний промпт залежно від user_id та зберігає/використовує user_role.
-	Додано підтримку аналізу зображень.
+	Додано підтримку аналізу зображень: або саме зображення (image), або його готовий опис
+	з кешу (image_description), який також зберігається в історії. Для нового зображення
+	модель у тій самій відповіді дописує його опис: він замінює зображення в історії
+	і зберігається в кеші під description_cache_key.
+	Якщо передано on_chunk, відповідь генерується потоково, а on_chunk отримує весь текст, накопичений на цей момент.
+	Читання історії, запит і запис відповіді виконуються під замком користувача,
+	тож паралельні запити одного користувача не перезаписують ходи один одного.
 	"""
-	history, stored_role = await get_user_history_from_db(user_id)
-
+	async with history_locks.get(user_id):
+		return await _get_gemini_response_locked(user_id, text, image, on_chunk, image_description, description_cache_key)
+
+async def _get_gemini_response_locked(
+	user_id: int,
+	text: str,
+	image: "Optional[Image.Image]",
+	on_chunk: Optional[Callable[[str], Awaitable[None]]],
+	image_description: Optional[str],
+	description_cache_key: Optional[str]
+) -> str:
 	if user_id == config.TENZO_USER_ID:
 		desired_role = 'TENZO'
 		current_system_prompt = load_system_prompt(
@@ -214,6 +245,14 @@ async def get_gemini_response(user_id: int, text: str, image: Image.Image = None
 		)
 		initial_model_response = "Зрозуміла. Я готова допомогти"
 
+	quota = await get_quota_status(user_id, desired_role)
+	if quota.hard_exceeded:
+		logger.warning("Користувач %d вичерпав денну квоту токенів (%d/%d).", user_id, quota.used, quota.hard_limit)
+		return HARD_QUOTA_REPLY
+
+	window = await get_history_window(user_id, HISTORY_TOKEN_BUDGET.get(desired_role, DEFAULT_TOKEN_BUDGET))
+	history, stored_role = window.history, window.role
+
 	current_time_for_initial_prompt = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 	current_system_prompt = current_system_prompt.format(current_time=current_time_for_initial_prompt)
 
@@ -228,26 +267,56 @@ async def get_gemini_response(user_id: int, text: str, image: Image.Image = None
 		]
 		await save_user_history_to_db(user_id, history, desired_role)
 	else:
-		logger.info(
+		logger.debug(
 			"Використовується збережена історія для користувача %d з роллю '%s'.",
 			user_id, stored_role
 		)
-
-	chat_session = gemini_model.start_chat(history=history)
+		if window.compact_until_seq is not None:
+			schedule_history_compaction(user_id, window.compact_until_seq)
+		# Системний промпт береться з реєстру, тож правки файлу діють і для наявних історій
+		history[0] = {"role": "user", "parts": [current_system_prompt]}
+
+	if image_description:
+		image_part = image_history_part(image_description)
+		content = f"{text}\n{image_part}" if text else image_part
+		user_turn = {"role": "user", "parts": [text, image_part]}
+	elif image:
+		content = [text, image, IMAGE_DESCRIPTION_REQUEST]
+		user_turn = {"role": "user", "parts": [text, "IMAGE_PLACEHOLDER"]}
+	else:
+		content = text
+		user_turn = {"role": "user", "parts": [text]}
 
 	try:
-		if image:
-			response_obj = chat_session.send_message([text, image])
-			history.append({"role": "user", "parts": [text, "IMAGE_PLACEHOLDER"]})
+		if on_chunk is None:
+			response_obj = await send_chat_message(history, content)
+			response_text = response_obj.text
 		else:
-			response_obj = chat_session.send_message(text)
-			history.append({"role": "user", "parts": [text]})
-
-		history.append({"role": "model", "parts": [response_obj.text]})
-		await save_user_history_to_db(user_id, history, desired_role)
-
-		if response_obj and hasattr(response_obj, 'text') and response_obj.text:
-			return response_obj.text
+			stream = stream_chat_message(history, content)
+			response_text = ""
+			async for piece in stream:
+				response_text += piece
+				await on_chunk(split_image_description(response_text)[0] if image is not None else response_text)
+			response_obj = stream.response
+
+		await record_usage(user_id, response_obj, desired_role)
+
+		if image is not None:
+			response_text, described = split_image_description(response_text)
+			if described:
+				user_turn = {"role": "user", "parts": [text, image_history_part(described)]}
+				if description_cache_key:
+					await store_description(description_cache_key, described)
+
+		if response_text:
+			# Історія записується один раз, коли відповідь (або потік) повністю завершена
+			model_turn = {"role": "model", "parts": [response_text]}
+			await append_messages_to_db(user_id, [user_turn, model_turn], desired_role)
+			if quota.soft_exceeded and (user_id, quota_day()) not in soft_quota_warned:
+				mark_soft_quota_warned(user_id)
+				logger.info("Користувач %d перевищив м'яку квоту токенів (%d/%d).", user_id, quota.used, quota.soft_limit)
+				return response_text + SOFT_QUOTA_NOTICE
+			return response_text
 		else:
 			if hasattr(response_obj, 'prompt_feedback') and response_obj.prompt_feedback.block_reason:
 				block_reason = response_obj.prompt_feedback.block_reason
@@ -261,6 +330,12 @@ async def get_gemini_response(user_id: int, text: str, image: Image.Image = None
 				)
 			else:
 				return "Вибач, я не змогла згенерувати відповідь. Спробуй ще раз."
+	except GeminiBusyError as e:
+		logger.warning("Черга Gemini переповнена для користувача %d: %s", user_id, e)
+		return "🌸 Юкі зараз відповідає багатьом одразу... Напиши мені ще раз за хвилинку 💖"
+	except GeminiTimeoutError as e:
+		logger.warning("Тайм-аут Gemini для користувача %d (роль '%s'): %s", user_id, desired_role, e)
+		return "⏳ Юкі задумалась надто надовго і не встигла відповісти. Спробуй ще раз."
 	except Exception as e:
 		tab_error_str = str(e)
 		if "SERVICE_DISABLED" in tab_error_str or "generativelanguage.googleapis.com" in tab_error_str:
@@ -292,8 +367,7 @@ async def get_gemini_handler(message: Message):
 	except Exception as e:
 		logger.warning(f"Не вдалося видалити /get_yuki від %d: %s", user_id, e)
 
-	if user_id not in active_users:
-		active_users.add(user_id)
+	if await session_registry.activate(user_id):
 		logger.info(f"Користувач %d активував сесію Gemini.", user_id)
 		await message.answer("✅ Привіт! Я готова допомогти. Я твоя Юкі. Запитай мене.")
 	else:
@@ -308,8 +382,7 @@ async def sleep_gemini_handler(message: Message):
 	except Exception as e:
 		logger.warning(f"Не вдалося видалити /sleep від %d: %s", user_id, e)
 
-	if user_id in active_users:
-		active_users.discard(user_id)
+	if await session_registry.deactivate(user_id):
 		logger.info(f"Користувач %d завершив сесію Gemini.", user_id)
 		reply = await message.answer("📴 Сесію Yuki завершено. Щоб увімкнути знову — надішли /get_yuki.")
 		await delete_message_after_delay(reply)
@@ -331,6 +404,60 @@ async def reset_gemini_handler(message: Message):
 	reply = await message.answer("✅ Історію Юкі для тебе скинуто. Вона розпочне діалог знову відповідно до твоєї поточної ролі (Тензо/звичайний користувач).")
 	await delete_message_after_delay(reply)
 
+# --- Звіт про використання токенів (лише для Тензо) ---
+@yuki_router.message(Command("yuki_usage"))
+async def usage_report_handler(message: Message):
+	if message.from_user.id != config.TENZO_USER_ID:
+		return
+
+	days = 1
+	parts = (message.text or "").split()
+	if len(parts) > 1 and parts[1].isdigit():
+		days = max(1, min(int(parts[1]), 90))
+
+	rows = await get_top_consumers(days, limit=10)
+	if not rows:
+		await message.answer("📊 За цей період запитів до Gemini не було.")
+		return
+
+	lines = [f"📊 Топ користувачів Gemini за {days} дн.:"]
+	for i, row in enumerate(rows, 1):
+		lines.append(
+			f"{i}. {row.user_id} ({row.role or '—'}): {row.total_tokens:,} токенів, "
+			f"{row.requests} запитів (вхід {row.prompt_tokens:,} / вихід {row.completion_tokens:,} / кеш {row.cached_tokens:,})"
+		)
+	await message.answer("\n".join(lines), parse_mode=None)
+
+# --- Розмір бази та обслуговування (лише для Тензо): /yuki_db — статистика, /yuki_db run — обслуговування зараз ---
+@yuki_router.message(Command("yuki_db"))
+async def db_report_handler(message: Message):
+	if message.from_user.id != config.TENZO_USER_ID:
+		return
+
+	parts = (message.text or "").split()
+	if len(parts) > 1 and parts[1] == "run":
+		if not maintenance_enabled():
+			# Запуск тут міг би перетнутися з VACUUM воркера 0 — його замок не бачимо з іншого процесу
+			await message.answer("🚫 Обслуговування бази виконує лише воркер 0 (за розкладом MAINTENANCE_HOUR), а цей чат обробляє інший воркер.", parse_mode=None)
+			return
+		if maintenance_running():
+			await message.answer("⏳ Обслуговування бази вже виконується.")
+			return
+		await message.answer("🧹 Запускаю обслуговування бази…")
+		spawn(run_maintenance_for(message), name="db-maintenance-manual")
+		return
+
+	await message.answer(format_db_stats(await get_db_stats()), parse_mode=None)
+
+async def run_maintenance_for(message: Message):
+	try:
+		report = await run_maintenance()
+	except Exception as e:
+		logger.error("Помилка обслуговування бази на запит: %s", e, exc_info=True)
+		await message.answer(f"😵 Обслуговування бази завершилось з помилкою: {e}", parse_mode=None)
+		return
+	await message.answer(f"✅ {report.describe()}\n\n{format_db_stats(await get_db_stats())}", parse_mode=None)
+
 # --- Асинхронний обробник ---
 @yuki_router.message(F.text)
 async def handle_gemini_message(message: Message, bot: Bot):
@@ -338,40 +465,81 @@ async def handle_gemini_message(message: Message, bot: Bot):
 	chat_id = message.chat.id
 	message_id = message.message_id
 	user_text = message.text
+	bind_log_context(handler="yuki")
 
-	logger.info(f"[UID={user_id}][CID={chat_id}] Отримано повідомлення ID={message_id}: '{user_text[:50]}...'")
-
-	if user_id not in active_users:
-		logger.info(f"[UID={user_id}] Сесія Gemini неактивна.")
+	if not await session_registry.is_active(user_id):
+		logger.debug("Сесія Gemini неактивна, повідомлення %d пропущено.", message_id)
 		return
 
+	logger.info("Отримано повідомлення ID=%d.", message_id)
+	logger.debug("Текст повідомлення %d: %.50s", message_id, user_text)
+
 	await bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
-	logger.info(f"[CID={chat_id}] Статус 'друкує...' надіслано.")
+
+	# Повідомлення, надіслані поспіль, обробляються по черзі й склеюються в один хід
+	yuki_message_queue.submit((chat_id, user_id), message)
+
+async def process_gemini_batch(key: Tuple[int, int], messages: List[Message]):
+	"""Обробляє пачку повідомлень одного користувача в одному чаті як один хід Gemini."""
+	chat_id, user_id = key
+	message = messages[-1]
+	bot = message.bot
+	user_text = "\n".join(m.text for m in messages)
+	started = time.perf_counter()
+	bind_log_context(uid=user_id, cid=chat_id, handler="yuki")
+	if len(messages) > 1:
+		logger.info("Склеєно %d повідомлень в один запит.", len(messages))
+
+	if not await session_registry.is_active(user_id):
+		return
 
 	current_time_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 	augmented_user_text = f"Поточна дата і час: {current_time_str}. {user_text}"
-	logger.info(f"[UID={user_id}] Додано актуальний час до повідомлення користувача: '{augmented_user_text[:50]}...'")
 
+	stream_reply = StreamingReply(bot, chat_id) if GEMINI_STREAMING else None
 	try:
-		ai_response = await get_gemini_response(user_id, augmented_user_text)
+		ai_response = await get_gemini_response(
+			user_id,
+			augmented_user_text,
+			on_chunk=stream_reply.update if stream_reply else None
+		)
 	except Exception as e:
-		logger.error(f"[UID={user_id}] Помилка у get_gemini_response: {e}", exc_info=True)
+		logger.error("Помилка у get_gemini_response: %s", e, exc_info=True)
+		if stream_reply:
+			await stream_reply.finish()
 		await message.answer("😵 Вибач, я не змогла відповісти на твоє повідомлення.")
 		return
 
-	if "[CALL_WAIFU_COMMAND]" in ai_response:
-		logger.info(f"[UID={user_id}] Виявлено [CALL_WAIFU_COMMAND], виконую waifu_cmd.")
+	if WAIFU_MARKER in ai_response:
+		logger.info("Виявлено [CALL_WAIFU_COMMAND], виконую waifu_cmd.")
+		if stream_reply:
+			await stream_reply.discard()
 		await handle_waifu_command(bot, message)
 		return
 
-	raw_response = safe_truncate_markdown(ai_response, 8000)
-	logger.info(f"[UID={user_id}] Надсилаю відповідь AI.")
+	if stream_reply and stream_reply.started:
+		if ai_response.startswith(stream_reply.raw_text):
+			await stream_reply.finish(ai_response)
+			logger.info("Потокову відповідь AI завершено.", extra={"latency": round(time.perf_counter() - started, 3)})
+			return
+		# Потік обірвався помилкою: залишити вже показаний текст і окремо надіслати повідомлення про помилку
+		await stream_reply.finish()
+
+	raw_response = truncate_markdown(ai_response, 8000)
 	await send_long_message(
 		bot=bot,
 		chat_id=chat_id,
 		raw_text=raw_response,
 		parse_mode=ParseMode.MARKDOWN_V2
 	)
+	logger.info("Відповідь AI надіслано.", extra={"latency": round(time.perf_counter() - started, 3)})
+
+yuki_message_queue: CoalescingQueue[Message] = CoalescingQueue(
+	process_gemini_batch,
+	debounce=YUKI_COALESCE_WINDOW,
+	max_wait=YUKI_COALESCE_MAX_WAIT,
+	name="yuki-turn"
+)
 
 async def handle_waifu_command(bot: Bot, message: Message):
 	user_id = message.from_user.id
@@ -397,67 +565,9 @@ async def handle_waifu_command(bot: Bot, message: Message):
 		logger.error(f"[UID={user_id}] Помилка у waifu_cmd: {e}", exc_info=True)
 		await message.answer("😥 Вибач, але зараз я не можу надіслати фото.")
 
-# --- Функції екранування та балансування Markdown ---
-def escape_md_v2_safe(text: str) -> str:
-	"""
-	Безпечне екранування MarkdownV2.
-	Використовує telegramify_markdown, якщо доступний, інакше - ручне екранування.
-	Це забезпечує максимальну стійкість до невідомих або небезпечних символів.
-	"""
-	if TELEGRAMIFY_MARKDOWN_AVAILABLE:
-		try:
-			return telegramify_markdown.markdownify(
-				text,
-				max_line_length=None,
-				normalize_whitespace=False,
-				latex_escape=True
-			)
-		except Exception as e:
-			logger.error(f"Помилка при використанні telegramify_markdown, fallback до ручного екранування: {e}")
-			pass
-
-	escape_chars = r"\_*[]()~`>#+-=|{}.!$"
-	return re.sub(f"([{re.escape(escape_chars)}])", r"\\\1", text)
-
-
-def balance_markdown(text: str) -> str:
-	"""
-	Балансує незакриті MarkdownV2 блоки для уникнення помилок парсингу.
-	Перевіряє: `**`, `__`, `~~`, `||`, `$$`, ```.
-	"""
-
-	tags_to_balance = {
-		"```": "```",
-		"**": "**",
-		"__": "__",
-		"~~": "~~",
-		"||": "||",
-		"$$": "$$"
-	}
-
-	balanced_text = text
-	for open_tag, close_tag in tags_to_balance.items():
-		if balanced_text.count(open_tag) % 2 != 0:
-			balanced_text += close_tag
-	return balanced_text
-
-def safe_truncate_markdown(text: str, max_length: int) -> str:
-	"""
-	Безпечне обрізання повідомлення без розриву MarkdownV2.
-	Обрізає текст до заданої довжини, додаючи суфікс,
-	і намагається збалансувати будь-які відкриті MarkdownV2 теги.
-	"""
-	if len(text) <= max_length:
-		return balance_markdown(text)
-
-	suffix = "\n\n... (відповідь обрізана)"
-	truncated = text[:max_length - len(suffix)]
-
-	truncated = balance_markdown(truncated)
-
-	return truncated + suffix
-
 # --- Надсилання довгих повідомлень у Telegram з автоматичним захистом ---
+PART_HEADER_RESERVE = 16  # місце під заголовок частини "*1/3*"
+
 async def send_long_message(
 	bot: Bot,
 	chat_id: int,
@@ -467,109 +577,260 @@ async def send_long_message(
 ):
 	"""
 	Надсилає довгі повідомлення, гарантовано захищаючи від усіх markdown помилок.
-	Автоматично розбиває повідомлення на частини, якщо воно перевищує MAX_LENGTH.
+	Сирий текст Gemini один раз рендериться у валідний MarkdownV2 (md_render) і
+	ділиться на частини до MAX_LENGTH лише по безпечних межах.
+	Темп надсилання частин задає send_scheduler (ліміти Telegram на чат і на бота).
 	"""
-	processed_text = escape_md_v2_safe(raw_text)
-	processed_text = balance_markdown(processed_text)
+	parts = render_markdown_v2(raw_text, MAX_LENGTH - PART_HEADER_RESERVE)
+
+	for i, part in enumerate(parts):
+		prefix = f"*{i+1}/{len(parts)}*\n" if len(parts) > 1 else ""
 
-	if len(processed_text) <= MAX_LENGTH:
 		try:
-			await bot.send_message(chat_id, processed_text, parse_mode=parse_mode)
+			await bot.send_message(chat_id, prefix + part.text, parse_mode=parse_mode)
 		except Exception as e:
-			logger.error(f"Помилка при відправці короткого повідомлення: {e}")
+			logger.error(f"Помилка при відправці частини повідомлення ({i+1}/{len(parts)}): {e}")
 			if fallback_to_plain:
-				logger.warning(f"Відправка повідомлення як Plain Text через помилку MarkdownV2: {e}")
-				await bot.send_message(chat_id, raw_text)
+				logger.warning(f"Відправка частини повідомлення як Plain Text через помилку MarkdownV2: {e}")
+				await bot.send_message(chat_id, part.plain, parse_mode=None)
 			else:
 				raise e
-		return
 
-	parts = []
-	current_part = ""
-	in_code_block = False
-	lines = processed_text.split("\n")
+# --- Потокове надсилання відповіді з поступовим редагуванням повідомлення ---
+def _strip_partial_marker(text: str) -> str:
+	"""Прибирає з кінця тексту незавершений маркер [CALL_WAIFU_COMMAND], що ще генерується."""
+	for size in range(len(WAIFU_MARKER) - 1, 0, -1):
+		if text.endswith(WAIFU_MARKER[:size]):
+			return text[:-size]
+	return text
 
-	for line in lines:
-		line_with_newline = line + "\n"
-
-		if "```" in line:
-			in_code_block = not in_code_block
-
-		if len(current_part) + len(line_with_newline) > MAX_LENGTH:
+class StreamingReply:
+	"""
+	Показує відповідь Gemini в міру генерації: перший шматок надсилається одразу,
+	далі те саме повідомлення редагується не частіше, ніж раз на `edit_interval` секунд.
+	Коли текст перевищує MAX_LENGTH, поточне повідомлення фіналізується і продовження
+	йде в нове (відкритий блок коду переноситься).
+	"""
 
-			if in_code_block and not current_part.strip().endswith("```"):
-				current_part += "```\n"
-				parts.append(current_part)
-				current_part = "```\n" + line_with_newline
+	def __init__(self, bot: Bot, chat_id: int, edit_interval: float = STREAM_EDIT_INTERVAL):
+		self.bot = bot
+		self.chat_id = chat_id
+		self.edit_interval = edit_interval
+		self.raw_text = ""
+		self.message_ids: List[int] = []
+		self._current_id: Optional[int] = None
+		self._offset = 0
+		self._prefix = ""
+		self._shown = ""
+		self._last_flush = 0.0
+		self._lock = asyncio.Lock()
+
+	@property
+	def started(self) -> bool:
+		return bool(self.message_ids)
+
+	async def update(self, raw_text: str):
+		"""Приймає весь накопичений текст; надсилає/редагує повідомлення з обмеженням частоти."""
+		self.raw_text = raw_text.replace(WAIFU_MARKER, "")
+		if WAIFU_MARKER in raw_text:
+			return
+		if self.started and time.monotonic() - self._last_flush < self.edit_interval:
+			return
+		await self._flush(final=False)
+
+	async def finish(self, raw_text: Optional[str] = None):
+		"""Фінальне оновлення: показує весь текст без урахування обмеження частоти."""
+		if raw_text is not None:
+			self.raw_text = raw_text.replace(WAIFU_MARKER, "")
+		if self.started:
+			await self._flush(final=True)
+
+	async def discard(self):
+		"""Видаляє всі вже надіслані частини (наприклад, якщо відповідь виявилась командою)."""
+		async with self._lock:
+			for msg_id in self.message_ids:
+				try:
+					await self.bot.delete_message(chat_id=self.chat_id, message_id=msg_id)
+				except TelegramAPIError as e:
+					logger.warning("Не вдалося видалити потокове повідомлення %d: %s", msg_id, e)
+			self.message_ids.clear()
+			self._current_id = None
+
+	async def _flush(self, final: bool):
+		async with self._lock:
+			while True:
+				segment = self._prefix + self.raw_text[self._offset:]
+				if not final:
+					segment = _strip_partial_marker(segment)
+				parts = render_markdown_v2(segment, MAX_LENGTH)
+				if len(parts) <= 1:
+					if parts:
+						await self._show(parts[0].text, parts[0].plain)
+					break
+
+				# Перша частина заповнена — фіналізувати її і продовжити в новому повідомленні
+				head = parts[0]
+				await self._show(head.text, head.plain)
+				self._current_id = None
+				self._shown = ""
+				self._offset += head.end - len(self._prefix)
+				self._prefix = f"```{head.open_code}\n" if head.open_code is not None else ""
+			self._last_flush = time.monotonic()
+
+	async def _show(self, rendered: str, plain: str):
+		if not plain.strip() or (self._current_id and rendered == self._shown):
+			return
+		try:
+			await self._send_or_edit(rendered, ParseMode.MARKDOWN_V2)
+		except TelegramBadRequest as e:
+			if "message is not modified" in str(e):
+				pass
 			else:
-				parts.append(current_part)
-				current_part = line_with_newline
+				logger.warning(f"Потокове повідомлення не пройшло як MarkdownV2, надсилаю Plain Text: {e}")
+				try:
+					await self._send_or_edit(plain, None)
+				except TelegramAPIError as plain_error:
+					logger.error(f"Не вдалося оновити потокове повідомлення: {plain_error}")
+					return
+		except TelegramAPIError as e:
+			logger.error(f"Не вдалося оновити потокове повідомлення: {e}")
+			return
+		self._shown = rendered
+
+	async def _send_or_edit(self, text: str, parse_mode: Optional[str]):
+		if self._current_id is None:
+			sent = await self.bot.send_message(self.chat_id, text, parse_mode=parse_mode)
+			self._current_id = sent.message_id
+			self.message_ids.append(sent.message_id)
 		else:
-			current_part += line_with_newline
-
-	if current_part:
-
-		if in_code_block and not current_part.strip().endswith("```"):
-			current_part += "```\n"
-		parts.append(current_part)
-
-	for i, part in enumerate(parts):
-
-		prefix = f"*{i+1}/{len(parts)}*\n" if len(parts) > 1 else ""
-
-		final_part = escape_md_v2_safe(prefix) + part
-		final_part = balance_markdown(final_part)
+			await self.bot.edit_message_text(
+				text,
+				chat_id=self.chat_id,
+				message_id=self._current_id,
+				parse_mode=parse_mode
+			)
 
-		if len(final_part) > MAX_LENGTH:
-			final_part = safe_truncate_markdown(final_part, MAX_LENGTH)
+# --- Декодування зображень у пам'яті ---
+def decode_image(data: BinaryIO, max_edge: int = IMAGE_MAX_EDGE) -> "Image.Image":
+	"""
+	Декодує зображення прямо з буфера (без тимчасового файлу) і зменшує його так,
+	щоб більша сторона не перевищувала max_edge. Для JPEG використовується draft-режим,
+	тож велике фото декодується одразу в зменшеному масштабі.
+	Блокуюча функція: викликати через asyncio.to_thread.
+	"""
+	with Image.open(data) as img:
+		img.draft("RGB", (max_edge, max_edge))
+		rgb = img.convert("RGB")
+	if max(rgb.size) > max_edge:
+		rgb.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+	return rgb
+
+# --- Опис зображень і кеш описів ---
+IMAGE_DESCRIBE_PROMPT = (
+	"Опиши українською, що зображено на картинці (до 8 речень): об'єкти, людей, дії, емоції, "
+	"стиль і контекст (фото, мем, скриншот, аніме-арт). Якщо на зображенні є текст — наведи його дослівно. "
+	"Тільки опис, без оцінок і звертань до користувача."
+)
 
-		try:
-			await bot.send_message(chat_id, final_part, parse_mode=parse_mode)
-		except Exception as e:
-			logger.error(f"Помилка при відправці частини повідомлення ({i+1}/{len(parts)}): {e}")
-			if fallback_to_plain:
-				logger.warning(f"Відправка частини повідомлення як Plain Text через помилку MarkdownV2: {e}")
+# Опис для кешу модель дописує в тій самій відповіді (один запит із зображенням замість двох):
+# після маркера, який відрізається від тексту для користувача
+IMAGE_DESCRIPTION_MARKER = "[[IMAGE_DESCRIPTION]]"
+IMAGE_DESCRIPTION_REQUEST = (
+	f"[Службова інструкція: спершу відповідай користувачу як зазвичай. Потім з нового рядка напиши "
+	f"{IMAGE_DESCRIPTION_MARKER} і після нього опис зображення. {IMAGE_DESCRIBE_PROMPT} "
+	f"Користувач цього опису не побачить.]"
+)
 
-				await bot.send_message(chat_id, part)
-			else:
-				raise e
-			continue
-		await asyncio.sleep(0.4)
+def split_image_description(text: str) -> Tuple[str, Optional[str]]:
+	"""Відокремлює опис зображення (після IMAGE_DESCRIPTION_MARKER) від відповіді користувачу."""
+	reply, marker, description = text.partition(IMAGE_DESCRIPTION_MARKER)
+	if not marker:
+		return text, None
+	return reply.rstrip(), description.strip() or None
+
+def image_history_part(description: str) -> str:
+	"""Як зображення зберігається в історії: текстовим описом замість самої картинки."""
+	return f"[Користувач надіслав зображення. Опис зображення: {description}]"
+
+def photo_cache_key(message: Message) -> str:
+	"""Ключ кешу для найбільшого розміру фото з урахуванням промпта опису (опис від ролі не залежить)."""
+	return image_cache_key(message.photo[-1].file_unique_id, IMAGE_DESCRIBE_PROMPT)
+
+async def get_cached_photo_description(message: Message) -> Optional[str]:
+	"""Повертає збережений опис фото (без завантаження файлу), якщо воно вже аналізувалось."""
+	return await get_cached_description(photo_cache_key(message))
+
+# --- Перевірка прав бота (кеш: chat_id -> (може писати, час перевірки)) ---
+CHAT_PERMISSION_TTL = getattr(config, "CHAT_PERMISSION_TTL", 600)
+CHAT_PERMISSION_MAX_ENTRIES = 10000
+chat_permissions: Dict[int, Tuple[bool, float]] = {}
+
+def remember_chat_permission(chat_id: int, allowed: bool):
+	"""Кешує права бота в чаті; при переповненні прибирає прострочені записи (або все, як usage._today_totals)."""
+	global chat_permissions
+	now = time.monotonic()
+	if len(chat_permissions) >= CHAT_PERMISSION_MAX_ENTRIES:
+		chat_permissions = {key: value for key, value in chat_permissions.items() if now - value[1] < CHAT_PERMISSION_TTL}
+		if len(chat_permissions) >= CHAT_PERMISSION_MAX_ENTRIES:
+			chat_permissions.clear()
+	chat_permissions[chat_id] = (allowed, now)
+
+def member_can_send(member) -> bool:
+	"""Чи може учасник (бот) з таким статусом надсилати повідомлення."""
+	if isinstance(member, (ChatMemberAdministrator, ChatMemberOwner, ChatMemberMember)):
+		return True
+	if isinstance(member, ChatMemberRestricted):
+		return member.can_send_messages is True
+	return False
 
-# --- Перевірка прав бота ---
 async def can_bot_send_messages(message: Message) -> bool:
 	"""
 	Перевіряє, чи має бот права на надсилання повідомлень у поточному чаті.
+	Результат кешується на CHAT_PERMISSION_TTL секунд і оновлюється одразу
+	при отриманні my_chat_member, тож get_chat_member викликається рідко.
 	"""
+	chat_id = message.chat.id
+	cached = chat_permissions.get(chat_id)
+	if cached is not None and time.monotonic() - cached[1] < CHAT_PERMISSION_TTL:
+		return cached[0]
+
 	try:
-		member = await message.bot.get_chat_member(message.chat.id, message.bot.id)
-		if isinstance(member, (ChatMemberAdministrator, ChatMemberOwner, ChatMemberMember)):
-			return True
-		if isinstance(member, ChatMemberRestricted):
-			return member.can_send_messages is True
+		member = await message.bot.get_chat_member(chat_id, message.bot.id)
+		allowed = member_can_send(member)
 	except TelegramForbiddenError:
-		logger.warning(f"Бот не може надсилати повідомлення в чаті {message.chat.id}: доступ заборонено.")
-		return False
+		logger.warning(f"Бот не може надсилати повідомлення в чаті {chat_id}: доступ заборонено.")
+		allowed = False
 	except Exception as e:
-		logger.error(f"Невідома помилка при перевірці прав бота в чаті {message.chat.id}: {e}")
+		logger.error(f"Невідома помилка при перевірці прав бота в чаті {chat_id}: {e}")
 		return False
-	return False
+	remember_chat_permission(chat_id, allowed)
+	return allowed
+
+@yuki_router.my_chat_member()
+async def on_bot_membership_changed(update: ChatMemberUpdated):
+	"""Оновлює кеш прав, коли бота додають, обмежують, підвищують або видаляють з чату."""
+	allowed = member_can_send(update.new_chat_member)
+	remember_chat_permission(update.chat.id, allowed)
+	logger.info(
+		f"[PERMISSION] Статус бота в чаті {update.chat.id}: {update.new_chat_member.status} "
+		f"(може писати: {allowed})"
+	)
 
 # --- УНІВЕРСАЛЬНИЙ ОБРОБНИК ПОВІДОМЛЕНЬ ---
 @yuki_router.message()
 async def universal_fallback_handler(message: Message, bot: Bot):
-	tmp_path = None
 	user_id = message.from_user.id
 	username = message.from_user.username or str(user_id)
 	chat_id = message.chat.id
-	is_active = user_id in active_users
+	is_active = await session_registry.is_active(user_id)
+	bind_log_context(handler="yuki_fallback")
 
 	if not is_active:
-		logger.info(f"[Fallback] Проігноровано повідомлення від неактивного користувача @{username}.")
+		logger.debug("[Fallback] Проігноровано повідомлення від неактивного користувача @%s.", username)
 		return
 
 	if message.text and message.text.startswith("/"):
-		logger.info(f"[Fallback] Проігнорована нерозпізнана команда від @{username}: '{message.text}'")
+		logger.debug("[Fallback] Проігнорована нерозпізнана команда від @%s: %.50s", username, message.text)
 		return
 
 	if not await can_bot_send_messages(message):
@@ -584,7 +845,17 @@ async def universal_fallback_handler(message: Message, bot: Bot):
 	start_time = time.perf_counter()
 
 	try:
-		if message.photo:
+		# Фото — це ще й фоновий запит опису для кешу, тож квоту перевіряємо до будь-якого виклику Gemini
+		if message.photo and await hard_quota_exceeded(user_id):
+			logger.warning("Користувач %d вичерпав денну квоту токенів, фото не аналізується.", user_id)
+			await message.reply(HARD_QUOTA_REPLY, parse_mode=None)
+			return
+
+		if message.photo and (cached_description := await get_cached_photo_description(message)):
+			logger.info(f"[Image Cache] Опис фото взято з кешу для @{username}.")
+			ai_response = await get_gemini_response(user_id, "", image_description=cached_description)
+
+		elif message.photo:
 			photo = message.photo[-1]
 			file = await message.bot.get_file(photo.file_id)
 
@@ -606,23 +877,19 @@ async def universal_fallback_handler(message: Message, bot: Bot):
 				return
 
 			photo_bytes = await message.bot.download_file(file.file_path)
-			with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as tmp:
-				tmp.write(photo_bytes.read())
-				tmp_path = tmp.name
 
 			try:
-				with Image.open(tmp_path) as img:
-					img = img.convert("RGB")
-					img_copy = img.copy()
-			except UnidentifiedImageError:
+				image = await asyncio.to_thread(decode_image, photo_bytes)
+			except (Image.UnidentifiedImageError, OSError):
 				response_text_to_user = "Неможливо відкрити зображення. Можливо, воно пошкоджене."
 				await message.reply(response_text_to_user)
 				return
 
-			ai_response = await get_gemini_response(user_id, "", image=img_copy)
+			# Опис для історії та кешу модель повертає разом з відповіддю — без окремого запиту
+			ai_response = await get_gemini_response(user_id, "", image=image, description_cache_key=photo_cache_key(message))
 
 		elif message.text:
-			logger.info(f"[Universal Handler] Отримано текстове повідомлення від @{username}: '{message.text}'")
+			logger.debug("[Universal Handler] Текстове повідомлення від @%s: %.50s", username, message.text)
 			ai_response = await get_gemini_response(user_id, message.text)
 
 		else:
@@ -642,33 +909,26 @@ async def universal_fallback_handler(message: Message, bot: Bot):
 				await message.reply("Юкі розгубилась і нічого не сказала... 🥺 Спробуй ще раз?")
 				return
 
-			escaped_response = escape_md_v2_safe(safe_truncate_markdown(response_text_to_user, 8000))
-
 			await send_long_message(
 				bot=bot,
 				chat_id=chat_id,
-				raw_text=escaped_response,
+				raw_text=truncate_markdown(response_text_to_user, 8000),
 				parse_mode=ParseMode.MARKDOWN_V2
 			)
 		else:
 			response_text_to_user = "Юкі не змогла згенерувати відповідь. Спробуй ще раз."
-			await message.reply(escape_md_v2_safe(response_text_to_user), parse_mode=ParseMode.MARKDOWN_V2)
+			await message.reply(escape_text(response_text_to_user), parse_mode=ParseMode.MARKDOWN_V2)
 
 	except TelegramBadRequest as e:
 		logger.warning(f"[TelegramError] {e}")
 		response_text_to_user = "Ой, виникла проблема з відправкою відповіді Telegram. Спробую ще раз пізніше."
-		await message.reply(escape_md_v2_safe(response_text_to_user), parse_mode=ParseMode.MARKDOWN_V2)
+		await message.reply(escape_text(response_text_to_user), parse_mode=ParseMode.MARKDOWN_V2)
 
 	except Exception as e:
 		logger.exception(f"[UNIVERSAL_HANDLER_ERROR] Помилка при обробці повідомлення від @{username}: {e}")
 		response_text_to_user = "Вибач, виникла неочікувана помилка. Спробуй ще раз пізніше."
-		await message.reply(escape_md_v2_safe(response_text_to_user), parse_mode=ParseMode.MARKDOWN_V2)
+		await message.reply(escape_text(response_text_to_user), parse_mode=ParseMode.MARKDOWN_V2)
 
 	finally:
 		duration = time.perf_counter() - start_time
-		logger.info(f"[Timing] Аналіз повідомлення від @{username} зайняв {duration:.2f} сек.")
-		if tmp_path:
-			try:
-				Path(tmp_path).unlink(missing_ok=True)
-			except Exception as e:
-				logger.warning(f"[CLEANUP] Не вдалося видалити тимчасовий файл: {e}")
+		logger.info("[Timing] Аналіз повідомлення від @%s зайняв %.2f сек.", username, duration, extra={"latency": round(duration, 3)})
@@ -0,0 +1,28 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import asyncio
+import logging
+from typing import Coroutine, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+# --- Сильні посилання на фонові задачі (інакше asyncio може зібрати їх GC) ---
+background_tasks: Set[asyncio.Task] = set()
+
+def _on_task_done(task: asyncio.Task):
+	background_tasks.discard(task)
+	if task.cancelled():
+		return
+	exc = task.exception()
+	if exc is not None:
+		logger.error("Фонова задача '%s' завершилась з помилкою: %s", task.get_name(), exc, exc_info=exc)
+
+# --- Запуск фонової задачі з відстеженням ---
+def spawn(coro: Coroutine, name: Optional[str] = None) -> asyncio.Task:
+	"""Запускає корутину як фонову задачу, зберігає посилання на неї та логує помилки."""
+	task = asyncio.create_task(coro, name=name)
+	background_tasks.add(task)
+	task.add_done_callback(_on_task_done)
+	return task
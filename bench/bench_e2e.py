@@ -0,0 +1,534 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+"""
+Наскрізний офлайн-бенчмарк: синтетичні апдейти подаються в справжній Dispatcher (main.dp)
+через dp.feed_update. Мережі не потрібно:
+	* Bot API — сесія бота, що записує кожен виклик і відповідає правдоподібним результатом;
+	* Gemini — фейковий gRPC-сервер з bench/fake_gemini.py з заданою затримкою;
+	* GitHub, modules.json та waifu.pics — локальний HTTP-сервер в окремому потоці
+	  (magic.py ходить у мережу синхронним requests, тож сервер не може жити в циклі подій бота).
+
+Запуск з кореня репозиторію:
+	python bench/bench_e2e.py [--users 20] [--rounds 10] [--gemini-latency 0.2]
+	python bench/bench_e2e.py --scenarios chat,photo --rounds 50
+
+Виводить апдейтів/сек та p50/p95/p99 затримки для кожної команди (/get_yuki, чат з Yuki,
+аналіз фото, /modules з гортанням, /waifu, /magisk) і мікробенчмарки send_long_message
+та запису/читання історії. Затримка команди — від feed_update до останнього виклику Bot API,
+яким завершується відповідь (для чату з Yuki — до SendMessage з відповіддю, бо хід
+обробляється у фоновій черзі).
+
+Бот працює в тимчасовій теці з власною базою; косметичні паузи magic (2 і 1.5 сек)
+за замовчуванням пропускаються (--keep-delays — залишити).
+"""
+
+# --- Імпорти ---
+import argparse
+import asyncio
+import collections
+import io
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+import typing
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from aiohttp import web  # noqa: E402
+from aiogram import Bot  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.methods import GetChatMember, GetFile, GetMe, TelegramMethod  # noqa: E402
+from aiogram.types import Message, Update  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from fake_gemini import FakeGemini, start_server  # noqa: E402
+
+BOT_TOKEN = "123456:BENCH-bench-BENCH-bench-BENCH-bench"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Yuki", "username": "yuki_bench_bot"}
+WAIFU_PASSWORD = "bench"
+SCENARIOS = ("chat", "photo", "modules", "waifu", "magisk")
+FIRST_USER_ID = 10_000
+
+# --- Синтетичний config.py ---
+def install_config(gemini_port: int, args: argparse.Namespace):
+	"""Підміняє модуль config до імпорту бота: фейковий Gemini, без лімітів надсилання, тихі логи."""
+	config = types.ModuleType("config")
+	config.__dict__.update(
+		BOT_TOKEN=BOT_TOKEN,
+		GEMINI_API_KEY="fake",
+		TENZO_USER_ID=1,
+		WAIFU_PASSWORD=WAIFU_PASSWORD,
+		WAIFU_TIMEOUT=300,
+		WAIFU_FOLDER="waifu",
+		SUPPORTED_IMAGE_FORMATS=(".jpg", ".jpeg", ".png", ".webp"),
+		GEMINI_BACKENDS=[{"api_key": "fake", "model": "gemini-2.0-flash", "endpoint": f"127.0.0.1:{gemini_port}"}],
+		GEMINI_MAX_CONCURRENCY=args.gemini_concurrency,
+		GEMINI_STREAMING=False,
+		YUKI_COALESCE_WINDOW=args.coalesce_window,
+		SEND_GLOBAL_RATE=1e9,
+		SEND_GLOBAL_BURST=10**9,
+		SEND_PRIVATE_RATE=1e9,
+		SEND_PRIVATE_BURST=10**9,
+		SEND_GROUP_RATE=1e9,
+		SEND_GROUP_BURST=10**9,
+		LOG_LEVEL="WARNING",
+		LOG_LEVELS={"yt_dlp": "CRITICAL", "aiogram": "ERROR"},
+	)
+	sys.modules["config"] = config
+
+# --- Заглушки GitHub, modules.json та waifu.pics ---
+class StubHttpServer:
+	"""aiohttp-сервер у власному потоці та циклі подій."""
+
+	def __init__(self, modules: int = 60, asset_size: int = 2 * 1024 * 1024):
+		self.asset = os.urandom(asset_size)
+		self.modules = modules
+		self.hits: collections.Counter = collections.Counter()
+		self.port = 0
+		self._ready = threading.Event()
+		self._loop: Optional[asyncio.AbstractEventLoop] = None
+		self._stop: Optional[asyncio.Event] = None
+		self._thread = threading.Thread(target=lambda: asyncio.run(self._serve()), name="stub-http", daemon=True)
+
+	@property
+	def base_url(self) -> str:
+		return f"http://127.0.0.1:{self.port}"
+
+	def start(self) -> str:
+		self._thread.start()
+		self._ready.wait(10)
+		return self.base_url
+
+	def stop(self):
+		if self._loop is not None:
+			self._loop.call_soon_threadsafe(self._stop.set)
+		self._thread.join(10)
+
+	def _app(self) -> web.Application:
+		async def latest_release(request: web.Request) -> web.Response:
+			self.hits["release"] += 1
+			name = f"{request.match_info['repo']}-v28.1.apk"
+			return web.json_response({
+				"tag_name": "v28.1",
+				"assets": [{"name": name, "browser_download_url": f"{self.base_url}/download/{name}"}],
+			})
+
+		async def download(request: web.Request) -> web.Response:
+			self.hits["download"] += 1
+			return web.Response(body=self.asset, content_type="application/octet-stream")
+
+		async def modules_json(request: web.Request) -> web.Response:
+			self.hits["modules"] += 1
+			return web.json_response({"modules": [
+				{
+					"id": f"bench_module_{i}",
+					"stars": (i * 37) % 500,
+					"notes_url": f"{self.base_url}/notes/{i}",
+					"zip_url": f"{self.base_url}/download/module_{i}.zip",
+				}
+				for i in range(self.modules)
+			]})
+
+		async def waifu(request: web.Request) -> web.Response:
+			self.hits["waifu"] += 1
+			return web.json_response({"url": "https://i.waifu.pics/bench.png"})
+
+		app = web.Application()
+		app.router.add_get("/repos/{owner}/{repo}/releases/latest", latest_release)
+		app.router.add_get("/download/{name}", download)
+		app.router.add_get("/modules.json", modules_json)
+		app.router.add_get("/sfw/waifu", waifu)
+		return app
+
+	async def _serve(self):
+		self._loop = asyncio.get_running_loop()
+		self._stop = asyncio.Event()
+		runner = web.AppRunner(self._app(), access_log=None)
+		await runner.setup()
+		site = web.TCPSite(runner, "127.0.0.1", 0)
+		await site.start()
+		self.port = runner.addresses[0][1]
+		self._ready.set()
+		await self._stop.wait()
+		await runner.cleanup()
+
+# --- Сесія бота без мережі ---
+class RecordingSession(BaseSession):
+	"""
+	Записує кожен запит до Bot API і відповідає правдоподібним результатом, розібраним
+	тим самим шляхом, що й справжня відповідь Telegram (check_response).
+	"""
+
+	def __init__(self, photo: bytes):
+		super().__init__()
+		self.photo = photo
+		self.calls: collections.Counter = collections.Counter()
+		self.last_message_ids: Dict[Any, int] = {}
+		self._message_ids = itertools.count(1000)
+		self._waiters: Dict[Tuple[Any, str], List[asyncio.Future]] = collections.defaultdict(list)
+
+	def expect(self, chat_id: int, method_name: str) -> asyncio.Future:
+		"""Future, що завершиться при наступному виклику `method_name` для чату `chat_id`."""
+		future = asyncio.get_running_loop().create_future()
+		self._waiters[(chat_id, method_name)].append(future)
+		return future
+
+	def _result(self, method: TelegramMethod, chat_id: Any) -> Any:
+		if isinstance(method, GetFile):
+			return {
+				"file_id": method.file_id,
+				"file_unique_id": method.file_id,
+				"file_size": len(self.photo),
+				"file_path": f"photos/{method.file_id}.jpg",
+			}
+		if isinstance(method, GetChatMember):
+			return {"status": "member", "user": BOT_USER}
+		if isinstance(method, GetMe):
+			return BOT_USER
+		returning = method.__returning__
+		if returning is Message or Message in typing.get_args(returning):
+			message_id = self.last_message_ids[chat_id] = next(self._message_ids)
+			return {
+				"message_id": message_id,
+				"date": int(time.time()),
+				"chat": {"id": chat_id, "type": "private"},
+				"from": BOT_USER,
+				"text": getattr(method, "text", None) or "",
+			}
+		return True
+
+	async def make_request(self, bot: Bot, method: TelegramMethod, timeout: Optional[int] = None) -> Any:
+		name = type(method).__name__
+		chat_id = getattr(method, "chat_id", None)
+		self.calls[name] += 1
+		content = json.dumps({"ok": True, "result": self._result(method, chat_id)})
+		response = self.check_response(bot, method, 200, content)
+		for future in self._waiters.pop((chat_id, name), ()):
+			if not future.done():
+				future.set_result(None)
+		return response.result
+
+	async def stream_content(
+		self,
+		url: str,
+		headers: Optional[Dict[str, Any]] = None,
+		timeout: int = 30,
+		chunk_size: int = 65536,
+		raise_for_status: bool = True,
+	) -> AsyncGenerator[bytes, None]:
+		for offset in range(0, len(self.photo), chunk_size):
+			yield self.photo[offset:offset + chunk_size]
+
+	async def close(self):
+		pass
+
+def make_photo(width: int = 2560, height: int = 1920) -> bytes:
+	"""JPEG, схожий на фото з камери телефона (більший за IMAGE_MAX_EDGE)."""
+	image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+	buffer = io.BytesIO()
+	image.save(buffer, "JPEG", quality=90)
+	return buffer.getvalue()
+
+# --- Паузи magic без косметичних затримок ---
+class _NoPauseAsyncio(types.ModuleType):
+	"""asyncio для magic, у якому паузи коротші за 10 сек не чекаються (автоочистка за 15 сек лишається)."""
+
+	def __getattr__(self, name: str) -> Any:
+		return getattr(asyncio, name)
+
+	@staticmethod
+	async def sleep(delay: float, result: Any = None) -> Any:
+		return await asyncio.sleep(0 if delay < 10 else delay, result)
+
+# --- Процентилі та звіт ---
+def percentile(values: List[float], q: float) -> float:
+	ordered = sorted(values)
+	index = min(len(ordered) - 1, max(0, round(q * len(ordered) + 0.5) - 1))
+	return ordered[index]
+
+def print_table(title: str, rows: Dict[str, List[float]], failures: Optional[Dict[str, int]] = None):
+	failures = failures or {}
+	print(f"\n{title}")
+	print(f"  {'':28} {'к-сть':>6} {'помилок':>8} {'p50 мс':>9} {'p95 мс':>9} {'p99 мс':>9}")
+	for label, values in rows.items():
+		if not values:
+			print(f"  {label:28} {0:6} {failures.get(label, 0):8}")
+			continue
+		p50, p95, p99 = (percentile(values, q) * 1000 for q in (0.5, 0.95, 0.99))
+		print(f"  {label:28} {len(values):6} {failures.get(label, 0):8} {p50:9.2f} {p95:9.2f} {p99:9.2f}")
+
+# --- Віртуальні користувачі ---
+class Harness:
+	def __init__(self, dp, bot: Bot, session: RecordingSession, timeout: float):
+		self.dp = dp
+		self.bot = bot
+		self.session = session
+		self.timeout = timeout
+		self.latencies: Dict[str, List[float]] = collections.defaultdict(list)
+		self.failures: Dict[str, int] = collections.Counter()
+		self.updates = 0
+		self._update_ids = itertools.count(1)
+		self._photo_ids = itertools.count(1)
+
+	# --- Синтетичні апдейти ---
+	def _message_payload(self, user_id: int, **content: Any) -> Dict[str, Any]:
+		return {
+			"message_id": next(self._update_ids),
+			"date": int(time.time()),
+			"chat": {"id": user_id, "type": "private", "first_name": f"bench{user_id}"},
+			"from": {"id": user_id, "is_bot": False, "first_name": f"bench{user_id}", "username": f"bench{user_id}"},
+			**content,
+		}
+
+	def _update(self, **payload: Any) -> Update:
+		return Update.model_validate({"update_id": next(self._update_ids), **payload}, context={"bot": self.bot})
+
+	def text(self, user_id: int, text: str) -> Update:
+		return self._update(message=self._message_payload(user_id, text=text))
+
+	def photo(self, user_id: int) -> Update:
+		# Новий file_unique_id на кожен апдейт — щоб вимірювати повний аналіз, а не кеш описів
+		file_id = f"bench-photo-{next(self._photo_ids)}"
+		sizes = [
+			{"file_id": f"{file_id}-s", "file_unique_id": f"{file_id}-s", "width": 320, "height": 240},
+			{"file_id": file_id, "file_unique_id": file_id, "width": 2560, "height": 1920, "file_size": len(self.session.photo)},
+		]
+		return self._update(message=self._message_payload(user_id, photo=sizes))
+
+	def callback(self, user_id: int, data: str, message_id: int) -> Update:
+		return self._update(callback_query={
+			"id": str(next(self._update_ids)),
+			"from": {"id": user_id, "is_bot": False, "first_name": f"bench{user_id}"},
+			"chat_instance": str(user_id),
+			"data": data,
+			"message": {
+				"message_id": message_id,
+				"date": int(time.time()),
+				"chat": {"id": user_id, "type": "private"},
+				"from": BOT_USER,
+				"text": "Сторінка 1",
+			},
+		})
+
+	# --- Подача апдейта та очікування відповіді ---
+	async def feed(self, label: str, user_id: int, update: Update, wait_for: Optional[str] = None):
+		waiter = self.session.expect(user_id, wait_for) if wait_for else None
+		started = time.perf_counter()
+		try:
+			await self.dp.feed_update(self.bot, update)
+			if waiter is not None:
+				await asyncio.wait_for(waiter, self.timeout)
+		except Exception as e:
+			self.failures[label] += 1
+			print(f"  [{label}] користувач {user_id}: {type(e).__name__}: {e}")
+			return
+		finally:
+			self.updates += 1
+		self.latencies[label].append(time.perf_counter() - started)
+
+	# --- Сценарії ---
+	async def run_chat(self, user_id: int, rounds: int):
+		await self.feed("/get_yuki", user_id, self.text(user_id, "/get_yuki"))
+		for i in range(rounds):
+			question = f"Юкі, поясни коротко, як працює root-доступ на Android? Питання №{i}"
+			await self.feed("chat (/get_yuki)", user_id, self.text(user_id, question), wait_for="SendMessage")
+
+	async def run_photo(self, user_id: int, rounds: int):
+		await self.feed("/get_yuki", user_id, self.text(user_id, "/get_yuki"))
+		for _ in range(rounds):
+			await self.feed("photo", user_id, self.photo(user_id))
+
+	async def run_modules(self, user_id: int, rounds: int):
+		for _ in range(rounds):
+			await self.feed("/modules", user_id, self.text(user_id, "/modules"))
+			keyboard_id = self.session.last_message_ids.get(user_id, 1)
+			await self.feed("/modules next_page", user_id, self.callback(user_id, "next_page", keyboard_id))
+
+	async def run_waifu(self, user_id: int, rounds: int):
+		for _ in range(rounds):
+			await self.feed("/waifu", user_id, self.text(user_id, f"/waifu {WAIFU_PASSWORD}"))
+
+	async def run_magisk(self, user_id: int, rounds: int):
+		for _ in range(rounds):
+			await self.feed("/magisk", user_id, self.text(user_id, "/magisk"))
+
+# --- Мікробенчмарки ---
+LONG_REPLY = (
+	"## Як отримати root\n"
+	+ "\n".join(f"{i}. Крок **{i}**: перевір `adb devices` і [документацію](https://example.com/{i}) (важливо!)." for i in range(1, 80))
+	+ "\n```bash\n" + "\n".join(f"fastboot flash boot_{i} magisk_patched.img" for i in range(60)) + "\n```\nГотово!"
+)
+
+async def bench_send_long_message(bot: Bot, iterations: int) -> Dict[str, List[float]]:
+	from ai_router import send_long_message
+
+	samples = {
+		"send_long_message 300 симв.": LONG_REPLY[:300],
+		f"send_long_message {len(LONG_REPLY)} симв.": LONG_REPLY,
+	}
+	results: Dict[str, List[float]] = {}
+	for label, text in samples.items():
+		timings = []
+		for _ in range(iterations):
+			started = time.perf_counter()
+			await send_long_message(bot=bot, chat_id=1, raw_text=text)
+			timings.append(time.perf_counter() - started)
+		results[label] = timings
+	return results
+
+async def bench_history(iterations: int) -> Dict[str, List[float]]:
+	from chat_history import append_messages_to_db, get_history_window
+
+	user_id = 1
+	turn = [
+		{"role": "user", "parts": ["Поточна дата і час: 2025-01-01 12:00:00. Як прошити Magisk на Pixel?"]},
+		{"role": "model", "parts": [LONG_REPLY[:1200]]},
+	]
+	appends, windows = [], []
+	for _ in range(iterations):
+		started = time.perf_counter()
+		await append_messages_to_db(user_id, turn, "REGULAR")
+		appends.append(time.perf_counter() - started)
+		started = time.perf_counter()
+		await get_history_window(user_id, 8000)
+		windows.append(time.perf_counter() - started)
+	return {"append_messages_to_db (хід)": appends, "get_history_window (8000 ток.)": windows}
+
+async def bench_group_stream(bot: Bot, iterations: int) -> Tuple[Dict[str, List[float]], int]:
+	"""
+	Потокова відповідь у групі: "друкує", повідомлення, кілька редагувань і наступне повідомлення.
+	Редагування і статус не витрачають ліміт повідомлень групи, тож друге повідомлення не чекає.
+	Повертає час другого повідомлення і кількість випадків, коли воно було загальмоване.
+	"""
+	from send_scheduler import SEND_EDIT_BURST
+
+	timings, throttled = [], 0
+	for i in range(min(iterations, 20)):
+		chat_id = -1_000_000 - i  # новий груповий чат — повні відра
+		await bot.send_chat_action(chat_id, "typing")
+		sent = await bot.send_message(chat_id, LONG_REPLY[:50])
+		for edit in range(SEND_EDIT_BURST):
+			await bot.edit_message_text(LONG_REPLY[:100 + edit], chat_id=chat_id, message_id=sent.message_id)
+		started = time.perf_counter()
+		await bot.send_message(chat_id, LONG_REPLY[:50])
+		timings.append(time.perf_counter() - started)
+		if timings[-1] > 1.0:
+			throttled += 1
+	return {"група: повідомлення після стріму": timings}, throttled
+
+# --- Запуск ---
+async def run(args: argparse.Namespace) -> int:
+	fake = FakeGemini("ok", latency=args.gemini_latency)
+	gemini_server, gemini_port = await start_server(fake)
+	stub = StubHttpServer()
+	stub_url = stub.start()
+
+	workdir = tempfile.mkdtemp(prefix="yuki-bench-")
+	for name in ("promt_tenzo.json", "promt_user.json"):
+		if os.path.exists(os.path.join(ROOT, name)):
+			shutil.copy(os.path.join(ROOT, name), workdir)
+	previous_cwd = os.getcwd()
+	os.chdir(workdir)
+
+	install_config(gemini_port, args)
+	import main
+	import magic
+	import waifupics
+	from ai_router import close_db, init_db
+	from background import background_tasks
+	from lazy_imports import warm_up
+	from log_setup import stop_logging
+	from metrics import TelegramMetricsMiddleware
+	from send_scheduler import send_scheduler
+
+	magic.GITHUB_API_URL = stub_url
+	magic.JSON_URL = f"{stub_url}/modules.json"
+	waifupics.WAIFU_API_URL = stub_url
+	if not args.keep_delays:
+		magic.asyncio = _NoPauseAsyncio("asyncio")
+
+	session = RecordingSession(make_photo())
+	session.middleware(send_scheduler)
+	session.middleware(TelegramMetricsMiddleware())
+	bot = Bot(token=BOT_TOKEN, session=session)
+	harness = Harness(main.dp, bot, session, timeout=args.timeout)
+
+	failed = 0
+	try:
+		await init_db()
+		# Як у справжньому запуску (dp.startup): важкі залежності вже імпортовані до перших запитів
+		await warm_up()
+		scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+		runners: Dict[str, Callable[[int, int], Awaitable[None]]] = {
+			"chat": harness.run_chat,
+			"photo": harness.run_photo,
+			"modules": harness.run_modules,
+			"waifu": harness.run_waifu,
+			"magisk": harness.run_magisk,
+		}
+		users = [
+			runners[scenarios[i % len(scenarios)]](FIRST_USER_ID + i, args.rounds)
+			for i in range(args.users)
+		]
+
+		print(f"Користувачів: {args.users}, раундів: {args.rounds}, сценарії: {', '.join(scenarios)}, "
+			f"затримка Gemini: {args.gemini_latency} сек")
+		started = time.perf_counter()
+		await asyncio.gather(*users)
+		elapsed = time.perf_counter() - started
+
+		print(f"\nАпдейтів: {harness.updates} за {elapsed:.2f} сек — {harness.updates / elapsed:.1f} апдейтів/сек")
+		print_table("Затримка команд", dict(sorted(harness.latencies.items())), harness.failures)
+
+		micro = await bench_send_long_message(bot, args.micro_iterations)
+		micro.update(await bench_history(args.micro_iterations))
+		group_stream, throttled = await bench_group_stream(bot, args.micro_iterations)
+		micro.update(group_stream)
+		print_table("Мікробенчмарки", micro)
+		if throttled:
+			print(f"\n⚠️ Відповідь у групі загальмована власними редагуваннями: {throttled} раз(ів)")
+
+		print("\nВиклики Bot API: " + ", ".join(f"{name}={count}" for name, count in session.calls.most_common()))
+		print(f"Виклики Gemini: {dict(fake.calls)}; HTTP-заглушки: {dict(stub.hits)}")
+		failed = sum(harness.failures.values()) + throttled
+	finally:
+		for task in list(background_tasks) + list(magic.auto_clear_tasks.values()):
+			task.cancel()
+		await close_db()
+		await gemini_server.stop(None)
+		stub.stop()
+		stop_logging()
+		os.chdir(previous_cwd)
+		shutil.rmtree(workdir, ignore_errors=True)
+	return failed
+
+def main():
+	parser = argparse.ArgumentParser(description="Наскрізний офлайн-бенчмарк бота")
+	parser.add_argument("--users", type=int, default=20, help="скільки віртуальних користувачів працює одночасно")
+	parser.add_argument("--rounds", type=int, default=10, help="скільки разів кожен користувач повторює свій сценарій")
+	parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"через кому: {', '.join(SCENARIOS)}")
+	parser.add_argument("--gemini-latency", type=float, default=0.2, help="затримка фейкового Gemini (сек)")
+	parser.add_argument("--gemini-concurrency", type=int, default=8, help="GEMINI_MAX_CONCURRENCY")
+	parser.add_argument("--coalesce-window", type=float, default=0.0, help="YUKI_COALESCE_WINDOW (сек)")
+	parser.add_argument("--timeout", type=float, default=60.0, help="скільки чекати на відповідь (сек)")
+	parser.add_argument("--micro-iterations", type=int, default=200)
+	parser.add_argument("--keep-delays", action="store_true", help="не пропускати косметичні паузи magic")
+	args = parser.parse_args()
+
+	unknown = set(args.scenarios.split(",")) - set(SCENARIOS)
+	if unknown:
+		parser.error(f"невідомі сценарії: {', '.join(sorted(unknown))}")
+	sys.exit(1 if asyncio.run(run(args)) else 0)
+
+if __name__ == "__main__":
+	main()
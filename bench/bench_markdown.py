@@ -0,0 +1,189 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+"""
+Порівняння старого ланцюжка екранування (telegramify/ручне екранування + balance_markdown +
+safe_truncate_markdown + ручне ділення) з однопрохідним рендерером md_render.
+
+Запуск з кореня репозиторію:
+	python bench/bench_markdown.py [--iterations 200]
+
+Виводить середній час підготовки відповіді та частку частин, які Telegram відхилив би
+як некоректний MarkdownV2 (перевірка спрощеним парсером нижче).
+"""
+
+# --- Імпорти ---
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from md_render import render_markdown_v2, truncate_markdown  # noqa: E402
+
+try:
+	import telegramify_markdown
+except ImportError:
+	telegramify_markdown = None
+
+MAX_LENGTH = 2048
+
+# --- Копія старого ланцюжка з ai_router ---
+def legacy_escape(text: str) -> str:
+	if telegramify_markdown is not None:
+		try:
+			return telegramify_markdown.markdownify(text, max_line_length=None, normalize_whitespace=False, latex_escape=True)
+		except Exception:
+			pass
+	escape_chars = r"\_*[]()~`>#+-=|{}.!$"
+	return re.sub(f"([{re.escape(escape_chars)}])", r"\\\1", text)
+
+def legacy_balance(text: str) -> str:
+	for tag in ("```", "**", "__", "~~", "||", "$$"):
+		if text.count(tag) % 2 != 0:
+			text += tag
+	return text
+
+def legacy_truncate(text: str, max_length: int) -> str:
+	if len(text) <= max_length:
+		return legacy_balance(text)
+	suffix = "\n\n... (відповідь обрізана)"
+	return legacy_balance(text[:max_length - len(suffix)]) + suffix
+
+def legacy_parts(raw_text: str):
+	# Універсальний обробник екранував текст ще до send_long_message, тож ескейп подвійний
+	processed = legacy_balance(legacy_escape(legacy_escape(legacy_truncate(raw_text, 8000))))
+	if len(processed) <= MAX_LENGTH:
+		return [processed]
+	parts, current, in_code = [], "", False
+	for line in processed.split("\n"):
+		line += "\n"
+		if "```" in line:
+			in_code = not in_code
+		if len(current) + len(line) > MAX_LENGTH:
+			if in_code and not current.strip().endswith("```"):
+				parts.append(current + "```\n")
+				current = "```\n" + line
+			else:
+				parts.append(current)
+				current = line
+		else:
+			current += line
+	if current:
+		if in_code and not current.strip().endswith("```"):
+			current += "```\n"
+		parts.append(current)
+	result = []
+	for i, part in enumerate(parts):
+		final = legacy_balance(legacy_escape(f"*{i+1}/{len(parts)}*\n" if len(parts) > 1 else "") + part)
+		if len(final) > MAX_LENGTH:
+			final = legacy_truncate(final, MAX_LENGTH)
+		result.append(final)
+	return result
+
+def new_parts(raw_text: str):
+	parts = render_markdown_v2(truncate_markdown(raw_text, 8000), MAX_LENGTH - 16)
+	return [
+		(f"*{i+1}/{len(parts)}*\n" if len(parts) > 1 else "") + part.text
+		for i, part in enumerate(parts)
+	]
+
+# --- Спрощена перевірка MarkdownV2 (правила з https://core.telegram.org/bots/api#markdownv2-style) ---
+RESERVED = set("_*[]()~`>#+-=|{}.!")
+
+def is_valid_markdown_v2(text: str) -> bool:
+	if len(text) > 4096:
+		return False
+	stack = []
+	i = 0
+	while i < len(text):
+		ch = text[i]
+		if ch == "\\":
+			i += 2
+			continue
+		if text.startswith("```", i):
+			end = text.find("```", i + 3)
+			while end != -1 and text[end - 1] == "\\":
+				end = text.find("```", end + 3)
+			if end == -1:
+				return False
+			i = end + 3
+			continue
+		if ch == "`":
+			end = i + 1
+			while end < len(text) and text[end] != "`":
+				end += 2 if text[end] == "\\" else 1
+			if end >= len(text):
+				return False
+			i = end + 1
+			continue
+		if ch == "[":
+			stack.append("[")
+		elif ch == "]":
+			if not stack or stack[-1] != "[" or not text.startswith("(", i + 1):
+				return False
+			stack.pop()
+			end = i + 2
+			while end < len(text) and text[end] != ")":
+				end += 2 if text[end] == "\\" else 1
+			if end >= len(text):
+				return False
+			i = end + 1
+			continue
+		elif ch == ">" and (i == 0 or text[i - 1] == "\n"):
+			pass
+		elif text.startswith("||", i) or text.startswith("__", i):
+			tag = text[i:i + 2]
+			if stack and stack[-1] == tag:
+				stack.pop()
+			else:
+				stack.append(tag)
+			i += 2
+			continue
+		elif ch in "*_~":
+			if stack and stack[-1] == ch:
+				stack.pop()
+			else:
+				stack.append(ch)
+		elif ch in RESERVED:
+			return False
+		i += 1
+	return not stack
+
+# --- Набір відповідей, схожих на відповіді Gemini ---
+SAMPLES = [
+	"Привіт! Я **Yuki** 😊. Ось що я знайшла:\n\n* перший пункт (з дужками)\n* другий пункт - з дефісом!\n\n1. Крок один.\n2. Крок два.",
+	"## Заголовок\nТекст з `inline_code()` і [посиланням](https://example.com/a_(b)).\n> цитата з *курсивом*\n---\nКінець.",
+	"```python\ndef f(x):\n    return x * 2  # коментар з `бектиком`\n```\nПісля коду: 2 + 2 = 4.",
+	"Непарні маркери: **жирний без кінця, _підкреслення, ~~закреслено та ||спойлер, $$ формула",
+	"Смайлики ^_^ та *зірочки* в тексті, шлях C:\\Users\\yuki\\file_name.txt і email yuki@example.com.",
+	"Список:\n" + "\n".join(f"- пункт {i}: значення {i * 3.5}!" for i in range(120)),
+	"```\n" + "\n".join(f"line {i} = [{i}]" for i in range(400)) + "\n```\nГотово.",
+	"Дуже довгий абзац " * 600,
+]
+
+# --- Запуск ---
+def measure(fn, iterations: int):
+	started = time.perf_counter()
+	for _ in range(iterations):
+		for sample in SAMPLES:
+			fn(sample)
+	elapsed = time.perf_counter() - started
+	parts = [part for sample in SAMPLES for part in fn(sample)]
+	rejected = sum(1 for part in parts if not is_valid_markdown_v2(part))
+	return elapsed / (iterations * len(SAMPLES)), len(parts), rejected
+
+def main():
+	parser = argparse.ArgumentParser(description="Бенчмарк рендерингу MarkdownV2")
+	parser.add_argument("--iterations", type=int, default=200)
+	args = parser.parse_args()
+
+	print(f"telegramify_markdown: {'так' if telegramify_markdown is not None else 'ні (ручне екранування)'}")
+	for name, fn in (("старий ланцюжок", legacy_parts), ("md_render", new_parts)):
+		per_reply, parts, rejected = measure(fn, args.iterations)
+		print(f"{name:16} {per_reply * 1000:8.3f} мс/відповідь   частин: {parts:3}   відхилено: {rejected}/{parts} ({rejected / parts:.0%})")
+
+if __name__ == "__main__":
+	main()
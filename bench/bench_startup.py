@@ -0,0 +1,241 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+"""
+Бенчмарк холодного старту: скільки минає від запуску інтерпретатора до першого обробленого апдейта.
+
+Кожен запуск — окремий процес (як після падіння бота), без мережі:
+	* config — синтетичний модуль, Bot API — сесія, що лише записує виклики;
+	* вимірюються імпорт main, ініціалізація бази, обробка /start через dp.feed_update
+	  і фоновий прогрів важких залежностей (lazy_imports.warm_up);
+	* окремий запуск з `python -X importtime` показує, які модулі найдовше імпортуються.
+
+Запуск з кореня репозиторію:
+	python bench/bench_startup.py [--runs 5] [--top 15]
+	python bench/bench_startup.py --eager   # прогрів до першого апдейта — як при імпорті всього одразу
+"""
+
+# --- Імпорти (лише stdlib: батьківський процес не повинен нічого прогрівати) ---
+import argparse
+import json
+import os
+import re
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from typing import Any, Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_TOKEN = "123456:BENCH-bench-BENCH-bench-BENCH-bench"
+BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Yuki", "username": "yuki_bench_bot"}
+RESULT_PREFIX = "STARTUP_RESULT "
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+# --- Дочірній процес: холодний старт бота ---
+def install_config():
+	config = types.ModuleType("config")
+	config.__dict__.update(
+		BOT_TOKEN=BOT_TOKEN,
+		GEMINI_API_KEY="fake",
+		TENZO_USER_ID=1,
+		WAIFU_PASSWORD="bench",
+		WAIFU_TIMEOUT=300,
+		WAIFU_FOLDER="waifu",
+		SUPPORTED_IMAGE_FORMATS=(".jpg", ".jpeg", ".png", ".webp"),
+		LOG_LEVEL="WARNING",
+	)
+	sys.modules["config"] = config
+
+def child(launched_at: float, eager: bool):
+	timings: Dict[str, float] = {}
+	started = time.perf_counter()
+	sys.path.insert(0, ROOT)
+	install_config()
+
+	import main
+	timings["import_main"] = time.perf_counter() - started
+
+	import asyncio
+	from aiogram import Bot
+	from aiogram.client.session.base import BaseSession
+	from aiogram.methods import GetMe, TelegramMethod
+	from aiogram.types import Update
+
+	from ai_router import close_db
+	from lazy_imports import warm_up
+	from log_setup import stop_logging
+
+	class CountingSession(BaseSession):
+		"""Відповідає на кожен запит Bot API без мережі (повідомлення — з новим message_id)."""
+
+		def __init__(self):
+			super().__init__()
+			self.calls: List[str] = []
+
+		async def make_request(self, bot: Bot, method: TelegramMethod, timeout=None) -> Any:
+			self.calls.append(type(method).__name__)
+			if isinstance(method, GetMe):
+				result: Any = BOT_USER
+			elif getattr(method, "text", None) is not None:
+				result = {
+					"message_id": len(self.calls),
+					"date": int(time.time()),
+					"chat": {"id": method.chat_id, "type": "private"},
+					"from": BOT_USER,
+					"text": method.text,
+				}
+			else:
+				result = True
+			return self.check_response(bot, method, 200, json.dumps({"ok": True, "result": result})).result
+
+		async def stream_content(self, *args, **kwargs):
+			yield b""
+
+		async def close(self):
+			pass
+
+	async def run():
+		session = CountingSession()
+		bot = Bot(token=BOT_TOKEN, session=session)
+		step = time.perf_counter()
+		if not await main.prepare_database():
+			raise RuntimeError("База даних не ініціалізувалась")
+		timings["init_db"] = time.perf_counter() - step
+
+		if eager:
+			step = time.perf_counter()
+			await warm_up()
+			timings["warm_up"] = time.perf_counter() - step
+
+		update = Update.model_validate({
+			"update_id": 1,
+			"message": {
+				"message_id": 1,
+				"date": int(time.time()),
+				"chat": {"id": 10_000, "type": "private", "first_name": "bench"},
+				"from": {"id": 10_000, "is_bot": False, "first_name": "bench"},
+				"text": "/start",
+			},
+		})
+		step = time.perf_counter()
+		await main.dp.feed_update(bot, update)
+		timings["first_update"] = time.perf_counter() - step
+		if "SendMessage" not in session.calls:
+			raise RuntimeError(f"/start не відповів (виклики: {session.calls})")
+		timings["to_first_update"] = time.time() - launched_at
+
+		if not eager:
+			step = time.perf_counter()
+			await warm_up()
+			timings["warm_up"] = time.perf_counter() - step
+		await close_db()
+		stop_logging()
+
+	asyncio.run(run())
+	print(RESULT_PREFIX + json.dumps(timings), flush=True)
+
+# --- Батьківський процес: запуски та звіт ---
+def launch(workdir: str, eager: bool, importtime: bool) -> Tuple[Dict[str, float], str]:
+	command = [sys.executable]
+	if importtime:
+		command += ["-X", "importtime"]
+	command += [os.path.abspath(__file__), "--child"]
+	if eager:
+		command.append("--eager")
+	env = dict(os.environ, BENCH_LAUNCHED_AT=repr(time.time()))
+	completed = subprocess.run(command, cwd=workdir, env=env, capture_output=True, text=True, timeout=300)
+	for line in completed.stdout.splitlines():
+		if line.startswith(RESULT_PREFIX):
+			return json.loads(line[len(RESULT_PREFIX):]), completed.stderr
+	raise RuntimeError(f"Дочірній процес завершився з кодом {completed.returncode}:\n{completed.stderr[-3000:]}")
+
+def parse_importtime(stderr: str) -> List[Tuple[str, int, int, int]]:
+	"""(модуль, власний час мкс, сумарний час мкс, глибина) для кожного рядка -X importtime."""
+	rows = []
+	for line in stderr.splitlines():
+		match = IMPORTTIME_LINE.match(line)
+		if match:
+			self_us, cumulative_us, indent, name = match.groups()
+			rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+	return rows
+
+def print_importtime(rows: List[Tuple[str, int, int, int]], top: int):
+	# -X importtime друкує модуль після всіх його залежностей: піддерево main — рядки перед ним
+	# до попереднього імпорту верхнього рівня; усе верхнього рівня після main — це прогрів
+	main_index = next((i for i, row in enumerate(rows) if row[0] == "main" and row[3] == 0), None)
+	if main_index is None:
+		print("\nУ виводі -X importtime немає main.")
+		return
+	first = max((i + 1 for i in range(main_index) if rows[i][3] == 0), default=0)
+	subtree = rows[first:main_index + 1]
+	print(f"\nimport main (з -X importtime): {rows[main_index][2] / 1000:.0f} мс")
+
+	direct = sorted((row for row in subtree if row[3] == 1), key=lambda row: row[2], reverse=True)
+	print(f"\nПрямі імпорти main — сумарний час (топ {top}):")
+	for name, _, cumulative_us, _ in direct[:top]:
+		print(f"  {name:<60} {cumulative_us / 1000:>9.1f} мс")
+
+	heaviest = sorted(subtree, key=lambda row: row[1], reverse=True)
+	print(f"\nНайдовший власний час імпорту в main (топ {top}):")
+	for name, self_us, _, _ in heaviest[:top]:
+		print(f"  {name:<60} {self_us / 1000:>9.1f} мс")
+
+	deferred = sorted((row for row in rows[main_index + 1:] if row[3] == 0), key=lambda row: row[2], reverse=True)
+	if deferred:
+		print(f"\nВідкладено до прогріву (топ {top}):")
+		for name, _, cumulative_us, _ in deferred[:top]:
+			print(f"  {name:<60} {cumulative_us / 1000:>9.1f} мс")
+
+def parent(args: argparse.Namespace) -> int:
+	workdir = tempfile.mkdtemp(prefix="yuki-startup-")
+	for name in ("promt_tenzo.json", "promt_user.json"):
+		if os.path.exists(os.path.join(ROOT, name)):
+			shutil.copy(os.path.join(ROOT, name), workdir)
+	try:
+		# Перший запуск прогріває кеш байткоду (__pycache__) і не враховується
+		launch(workdir, args.eager, importtime=False)
+		runs = [launch(workdir, args.eager, importtime=False)[0] for _ in range(args.runs)]
+		_, stderr = launch(workdir, args.eager, importtime=True)
+	except (RuntimeError, subprocess.TimeoutExpired) as e:
+		print(f"❌ {e}")
+		return 1
+	finally:
+		shutil.rmtree(workdir, ignore_errors=True)
+
+	mode = "з прогрівом до першого апдейта (--eager)" if args.eager else "прогрів у фоні після першого апдейта"
+	print(f"Запусків: {args.runs}, режим: {mode}")
+	print(f"{'':<36}{'медіана мс':>12}{'мін мс':>10}{'макс мс':>10}")
+	labels = {
+		"to_first_update": "запуск → перший апдейт оброблено",
+		"import_main": "import main",
+		"init_db": "ініціалізація бази",
+		"first_update": "обробка /start",
+		"warm_up": "прогрів важких залежностей",
+	}
+	for key, label in labels.items():
+		values = [run[key] * 1000 for run in runs if key in run]
+		if values:
+			print(f"  {label:<34}{statistics.median(values):>12.1f}{min(values):>10.1f}{max(values):>10.1f}")
+
+	print_importtime(parse_importtime(stderr), args.top)
+	return 0
+
+def main():
+	parser = argparse.ArgumentParser(description="Бенчмарк холодного старту бота (час до першого обробленого апдейта)")
+	parser.add_argument("--runs", type=int, default=5, help="скільки холодних запусків виміряти")
+	parser.add_argument("--top", type=int, default=15, help="скільки найповільніших імпортів показати")
+	parser.add_argument("--eager", action="store_true", help="прогріти важкі залежності до першого апдейта")
+	parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+	args = parser.parse_args()
+
+	if args.child:
+		child(float(os.environ.get("BENCH_LAUNCHED_AT", time.time())), args.eager)
+		return
+	sys.exit(parent(args))
+
+if __name__ == "__main__":
+	main()
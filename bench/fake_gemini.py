@@ -0,0 +1,198 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+"""
+Локальний фейковий сервер Gemini (gRPC GenerativeService без TLS) для перевірки пулу бекендів
+та навантажувальних тестів без справжнього API-ключа.
+
+Запуск окремого сервера:
+	python bench/fake_gemini.py serve --port 50051 --mode ok --latency 0.3
+
+Бекенд у config.py, спрямований на нього:
+	GEMINI_BACKENDS = [{"api_key": "fake", "model": "gemini-2.0-flash", "endpoint": "localhost:50051"}]
+
+Перевірка пулу (кожен бекенд проти власного фейкового сервера):
+	python bench/fake_gemini.py check
+"""
+
+# --- Імпорти ---
+import argparse
+import asyncio
+import collections
+import os
+import sys
+import time
+
+import grpc
+from google.ai import generativelanguage_v1beta as glm
+
+SERVICE = "google.ai.generativelanguage.v1beta.GenerativeService"
+MODES = ("ok", "429", "disabled", "timeout", "error")
+IMAGE_DESCRIPTION_MARKER = "[[IMAGE_DESCRIPTION]]"  # ai_router.IMAGE_DESCRIPTION_MARKER
+
+# --- Фейковий сервіс ---
+class FakeGemini:
+	"""
+	Режими: ok — відповідає луною; 429 — RESOURCE_EXHAUSTED; disabled — PERMISSION_DENIED
+	з SERVICE_DISABLED; timeout — не відповідає; error — UNAVAILABLE.
+	`latency` — затримка перед відповіддю, `chunks` — на скільки шматків ділити потік.
+	"""
+
+	def __init__(self, mode: str = "ok", latency: float = 0.0, chunks: int = 4):
+		self.mode = mode
+		self.latency = latency
+		self.chunks = chunks
+		self.calls = collections.Counter()
+
+	async def _check(self, context, method: str):
+		self.calls[method] += 1
+		await asyncio.sleep(self.latency)
+		if self.mode == "429":
+			await context.abort(grpc.StatusCode.RESOURCE_EXHAUSTED, "Resource has been exhausted (e.g. check quota).")
+		if self.mode == "disabled":
+			await context.abort(
+				grpc.StatusCode.PERMISSION_DENIED,
+				"Generative Language API has not been used in project 0 before or it is disabled. reason: SERVICE_DISABLED"
+			)
+		if self.mode == "error":
+			await context.abort(grpc.StatusCode.UNAVAILABLE, "The service is currently unavailable.")
+		if self.mode == "timeout":
+			await asyncio.sleep(3600)
+
+	@staticmethod
+	def _reply_text(request: glm.GenerateContentRequest) -> str:
+		last = request.contents[-1] if request.contents else None
+		text = " ".join(part.text for part in last.parts if part.text) if last else ""
+		if IMAGE_DESCRIPTION_MARKER in text:
+			# Фото: відповідь і опис зображення для кешу в одному запиті, як просить ai_router
+			return f"[{request.model}] Юкі бачить фото\n{IMAGE_DESCRIPTION_MARKER} Фейковий опис зображення."
+		return f"[{request.model}] Юкі чує: {text[:200]}"
+
+	@staticmethod
+	def _response(text: str, request: glm.GenerateContentRequest, final: bool) -> glm.GenerateContentResponse:
+		return glm.GenerateContentResponse(
+			candidates=[glm.Candidate(
+				content=glm.Content(role="model", parts=[glm.Part(text=text)]),
+				finish_reason=glm.Candidate.FinishReason.STOP if final else glm.Candidate.FinishReason.FINISH_REASON_UNSPECIFIED,
+				index=0,
+			)],
+			usage_metadata=glm.GenerateContentResponse.UsageMetadata(
+				prompt_token_count=sum(len(p.text) // 4 for c in request.contents for p in c.parts),
+				candidates_token_count=len(text) // 4,
+			),
+		)
+
+	async def generate_content(self, request, context):
+		await self._check(context, "GenerateContent")
+		return self._response(self._reply_text(request), request, final=True)
+
+	async def stream_generate_content(self, request, context):
+		await self._check(context, "StreamGenerateContent")
+		text = self._reply_text(request)
+		step = max(1, len(text) // self.chunks)
+		pieces = [text[i:i + step] for i in range(0, len(text), step)]
+		for index, piece in enumerate(pieces):
+			yield self._response(piece, request, final=index == len(pieces) - 1)
+			await asyncio.sleep(self.latency / self.chunks)
+
+	def handler(self) -> grpc.GenericRpcHandler:
+		return grpc.method_handlers_generic_handler(SERVICE, {
+			"GenerateContent": grpc.unary_unary_rpc_method_handler(
+				self.generate_content,
+				request_deserializer=glm.GenerateContentRequest.deserialize,
+				response_serializer=glm.GenerateContentResponse.serialize,
+			),
+			"StreamGenerateContent": grpc.unary_stream_rpc_method_handler(
+				self.stream_generate_content,
+				request_deserializer=glm.GenerateContentRequest.deserialize,
+				response_serializer=glm.GenerateContentResponse.serialize,
+			),
+		})
+
+async def start_server(fake: FakeGemini, port: int = 0):
+	"""Запускає сервер у поточному циклі подій. Повертає (server, port)."""
+	server = grpc.aio.server()
+	server.add_generic_rpc_handlers((fake.handler(),))
+	port = server.add_insecure_port(f"127.0.0.1:{port}")
+	await server.start()
+	return server, port
+
+# --- Перевірка пулу бекендів ---
+async def check_pool(requests: int):
+	sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+	import gemini_client
+	from gemini_client import GeminiBackend, GeminiPool
+
+	gemini_client.GEMINI_ATTEMPT_TIMEOUT = 1.0
+	scenario = [
+		("gemini-2.0-flash", "ok", 2.0, 0),
+		("gemini-2.0-flash", "429", 1.0, 0),
+		("gemini-2.0-flash", "disabled", 1.0, 0),
+		("gemini-2.0-flash", "timeout", 1.0, 0),
+		("gemini-2.0-flash-lite", "ok", 1.0, 1),
+	]
+	servers, fakes, backends = [], [], []
+	for model, mode, weight, tier in scenario:
+		fake = FakeGemini(mode, latency=0.05)
+		server, port = await start_server(fake)
+		servers.append(server)
+		fakes.append(fake)
+		backends.append(GeminiBackend(f"fake-{mode}", model, weight=weight, tier=tier, endpoint=f"127.0.0.1:{port}"))
+	pool = GeminiPool(backends)
+
+	failures = 0
+	started = time.perf_counter()
+	for i in range(requests):
+		try:
+			response = await pool.run(lambda backend: backend.generate([], f"привіт {i}"))
+			assert response.text.startswith("[models/gemini-2.0-flash]"), response.text
+		except Exception as e:
+			failures += 1
+			print(f"запит {i}: {type(e).__name__}: {e}")
+	elapsed = time.perf_counter() - started
+
+	# Основний рівень повністю недоступний — має спрацювати запасна модель
+	for backend in backends:
+		if backend.tier == 0:
+			backend.open_until = time.monotonic() + 60
+	try:
+		fallback = await pool.run(lambda backend: backend.generate([], "запасна"))
+		assert fallback.text.startswith("[models/gemini-2.0-flash-lite]"), fallback.text
+		fallback_text = fallback.text[:40]
+	except Exception as e:
+		failures += 1
+		fallback_text = f"{type(e).__name__}: {e}"
+
+	print(f"{requests} запитів за {elapsed:.2f} сек, помилок: {failures}")
+	print(f"запасна модель: {fallback_text}")
+	for (model, mode, _, _), fake, stats in zip(scenario, fakes, pool.stats()):
+		print(f"  {mode:9} викликів сервера: {sum(fake.calls.values()):3}   {stats}")
+
+	for server in servers:
+		await server.stop(None)
+	return failures
+
+async def serve(port: int, mode: str, latency: float):
+	fake = FakeGemini(mode, latency)
+	server, port = await start_server(fake, port)
+	print(f"Фейковий Gemini ({mode}, затримка {latency} сек) слухає 127.0.0.1:{port}")
+	await server.wait_for_termination()
+
+def main():
+	parser = argparse.ArgumentParser(description="Фейковий сервер Gemini")
+	sub = parser.add_subparsers(dest="command", required=True)
+	serve_parser = sub.add_parser("serve")
+	serve_parser.add_argument("--port", type=int, default=50051)
+	serve_parser.add_argument("--mode", choices=MODES, default="ok")
+	serve_parser.add_argument("--latency", type=float, default=0.3)
+	check_parser = sub.add_parser("check")
+	check_parser.add_argument("--requests", type=int, default=40)
+	args = parser.parse_args()
+
+	if args.command == "serve":
+		asyncio.run(serve(args.port, args.mode, args.latency))
+	else:
+		sys.exit(1 if asyncio.run(check_pool(args.requests)) else 0)
+
+if __name__ == "__main__":
+	main()
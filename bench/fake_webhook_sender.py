@@ -0,0 +1,160 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+"""
+Фейковий відправник Telegram для режиму webhook: надсилає апдейти POST-запитами так само,
+як Telegram (з заголовком X-Telegram-Bot-Api-Secret-Token, по кількох keep-alive з'єднаннях),
+і перевіряє /healthz, /readyz та відмову для неправильного секрету.
+
+Бот у тому ж процесі (webhook.build_webhook_app + main.dp, Bot API підмінено записом викликів):
+	python bench/fake_webhook_sender.py [--updates 500] [--connections 40]
+
+Зовнішній бот, запущений з BOT_MODE = "webhook" (відповіді підуть у справжній Telegram):
+	python bench/fake_webhook_sender.py --url http://127.0.0.1:8080/webhook --secret <WEBHOOK_SECRET>
+"""
+
+# --- Імпорти ---
+import argparse
+import asyncio
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List
+from urllib.parse import urlsplit
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_e2e import BOT_TOKEN, RecordingSession, install_config, make_photo, percentile  # noqa: E402
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+def make_update(update_id: int, user_id: int, text: str) -> Dict[str, Any]:
+	return {
+		"update_id": update_id,
+		"message": {
+			"message_id": update_id,
+			"date": int(time.time()),
+			"chat": {"id": user_id, "type": "private", "first_name": f"sender{user_id}"},
+			"from": {"id": user_id, "is_bot": False, "first_name": f"sender{user_id}"},
+			"text": text,
+		},
+	}
+
+# --- Перевірки ---
+async def check_routes(http: aiohttp.ClientSession, url: str, secret: str) -> List[str]:
+	base = "{0.scheme}://{0.netloc}".format(urlsplit(url))
+	problems = []
+	for path in ("/healthz", "/readyz"):
+		async with http.get(base + path) as response:
+			print(f"GET {path}: {response.status} {await response.text()}")
+			if response.status != 200:
+				problems.append(f"{path} повернув {response.status}")
+
+	async with http.post(url, json=make_update(1, 1, "/start"), headers={SECRET_HEADER: secret + "-wrong"}) as response:
+		print(f"POST з неправильним секретом: {response.status}")
+		if response.status != 401:
+			problems.append(f"неправильний секрет прийнято ({response.status})")
+	return problems
+
+async def send_updates(http: aiohttp.ClientSession, url: str, secret: str, updates: int, connections: int) -> List[float]:
+	"""Надсилає апдейти, не більше `connections` одночасно. Повертає час відповіді сервера на кожен."""
+	timings: List[float] = []
+	failures = 0
+	ids = itertools.count(1000)
+	semaphore = asyncio.Semaphore(connections)
+
+	async def send_one(i: int):
+		nonlocal failures
+		update_id = next(ids)
+		payload = make_update(update_id, 50_000 + i % connections, "/start" if i % 2 else "/ping")
+		async with semaphore:
+			started = time.perf_counter()
+			async with http.post(url, json=payload, headers={SECRET_HEADER: secret}) as response:
+				await response.read()
+				timings.append(time.perf_counter() - started)
+				if response.status != 200:
+					failures += 1
+
+	started = time.perf_counter()
+	await asyncio.gather(*(send_one(i) for i in range(updates)))
+	elapsed = time.perf_counter() - started
+	print(f"Надіслано {updates} апдейтів за {elapsed:.2f} сек ({updates / elapsed:.1f}/сек), не 200: {failures}")
+	p50, p95, p99 = (percentile(timings, q) * 1000 for q in (0.5, 0.95, 0.99))
+	print(f"Відповідь webhook: p50 {p50:.2f} мс, p95 {p95:.2f} мс, p99 {p99:.2f} мс")
+	return timings if not failures else []
+
+# --- Бот у тому ж процесі ---
+async def run_local(args: argparse.Namespace) -> int:
+	workdir = tempfile.mkdtemp(prefix="yuki-webhook-")
+	previous_cwd = os.getcwd()
+	os.chdir(workdir)
+	install_config(gemini_port=1, args=argparse.Namespace(gemini_concurrency=8, coalesce_window=0.0))
+
+	import main
+	from ai_router import close_db, init_db
+	from log_setup import stop_logging
+	from webhook import READY, build_webhook_app, start_webhook_server
+	from aiogram import Bot
+
+	session = RecordingSession(make_photo(64, 64))
+	bot = Bot(token=BOT_TOKEN, session=session)
+	secret = "local-secret"
+	app = build_webhook_app(main.dp, bot, secret)
+	runner = await start_webhook_server(app, "127.0.0.1", 0)
+	url = f"http://127.0.0.1:{runner.addresses[0][1]}/webhook"
+	problems: List[str] = []
+	try:
+		await init_db()
+		app[READY].set()
+		connector = aiohttp.TCPConnector(limit=args.connections)
+		async with aiohttp.ClientSession(connector=connector) as http:
+			problems += await check_routes(http, url, secret)
+			if not await send_updates(http, url, secret, args.updates, args.connections):
+				problems.append("не всі апдейти прийнято")
+
+		# Кожен апдейт (/start або /ping) закінчується одним SendMessage
+		deadline = time.perf_counter() + args.timeout
+		while session.calls["SendMessage"] < args.updates and time.perf_counter() < deadline:
+			await asyncio.sleep(0.05)
+		print(f"Оброблено у фоні: SendMessage={session.calls['SendMessage']} з {args.updates}")
+		if session.calls["SendMessage"] < args.updates:
+			problems.append("не всі апдейти оброблено")
+	finally:
+		await runner.cleanup()
+		await close_db()
+		stop_logging()
+		os.chdir(previous_cwd)
+		shutil.rmtree(workdir, ignore_errors=True)
+
+	for problem in problems:
+		print(f"❌ {problem}")
+	return len(problems)
+
+async def run_remote(args: argparse.Namespace) -> int:
+	async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=args.connections)) as http:
+		problems = await check_routes(http, args.url, args.secret)
+		if not await send_updates(http, args.url, args.secret, args.updates, args.connections):
+			problems.append("не всі апдейти прийнято")
+	for problem in problems:
+		print(f"❌ {problem}")
+	return len(problems)
+
+def main():
+	parser = argparse.ArgumentParser(description="Фейковий відправник апдейтів Telegram для режиму webhook")
+	parser.add_argument("--url", help="адреса webhook зовнішнього бота (без неї бот запускається в цьому процесі)")
+	parser.add_argument("--secret", default="", help="WEBHOOK_SECRET зовнішнього бота")
+	parser.add_argument("--updates", type=int, default=500)
+	parser.add_argument("--connections", type=int, default=40, help="скільки з'єднань тримає відправник")
+	parser.add_argument("--timeout", type=float, default=30.0, help="скільки чекати на фонову обробку (сек)")
+	args = parser.parse_args()
+
+	run = run_remote if args.url else run_local
+	sys.exit(1 if asyncio.run(run(args)) else 0)
+
+if __name__ == "__main__":
+	main()
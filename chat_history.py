@@ -0,0 +1,482 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import json
+import logging
+import time
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
+
+import aiosqlite
+
+import config
+from db_pool import SQLitePool
+
+# --- Додатковий блок для zstandard (необов'язкове стиснення історії) ---
+try:
+	import zstandard
+	ZSTD_AVAILABLE = True
+except ImportError:
+	ZSTD_AVAILABLE = False
+
+logger = logging.getLogger("yuki.chat_history")
+
+# --- Ім'я файлу бази даних для історії чатів (одна база для всіх) ---
+DB_NAME = 'yuki_chat_history.db'
+
+# --- Перші повідомлення історії (системний промпт + відповідь моделі) завжди завантажуються ---
+HISTORY_SEED_MESSAGES = 2
+
+# --- Максимальна кількість останніх повідомлень, що завантажуються з бази ---
+HISTORY_MAX_MESSAGES = getattr(config, "HISTORY_MAX_MESSAGES", 200)
+
+# --- Бюджет токенів на історію для кожної ролі (системний промпт + підсумок + останні повідомлення) ---
+HISTORY_TOKEN_BUDGET = {
+	"TENZO": 24000,
+	"REGULAR": 8000,
+	**getattr(config, "HISTORY_TOKEN_BUDGET", {}),
+}
+DEFAULT_TOKEN_BUDGET = 8000
+
+# --- Яку частку бюджету залишати дослівно після стиснення (решта йде в підсумок) ---
+HISTORY_COMPACT_KEEP_RATIO = getattr(config, "HISTORY_COMPACT_KEEP_RATIO", 0.5)
+
+# --- Стиснення вмісту повідомлень: "zlib", "zstd" (потрібен пакет zstandard) або "none" ---
+HISTORY_COMPRESSION = getattr(config, "HISTORY_COMPRESSION", "zlib")
+HISTORY_COMPRESS_MIN_BYTES = getattr(config, "HISTORY_COMPRESS_MIN_BYTES", 256)  # коротші повідомлення зберігаються текстом
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 9
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# --- Пул з'єднань до бази даних (відкривається в init_db, закривається в close_db) ---
+db_pool = SQLitePool(DB_NAME, readers=getattr(config, "DB_READER_POOL_SIZE", 4))
+
+# --- SQL-запити (однаковий текст дозволяє sqlite3 повторно використовувати підготовлені вирази) ---
+SQL_CREATE_CHAT_USERS = '''
+	CREATE TABLE IF NOT EXISTS chat_users (
+		user_id INTEGER PRIMARY KEY,
+		user_role TEXT DEFAULT 'REGULAR',
+		updated_at REAL
+	)
+'''
+SQL_CREATE_CHAT_MESSAGES = '''
+	CREATE TABLE IF NOT EXISTS chat_messages (
+		user_id INTEGER NOT NULL,
+		seq INTEGER NOT NULL,
+		role TEXT NOT NULL,
+		parts TEXT NOT NULL,
+		created_at REAL NOT NULL,
+		PRIMARY KEY (user_id, seq)
+	) WITHOUT ROWID
+'''
+SQL_CREATE_CHAT_SUMMARIES = '''
+	CREATE TABLE IF NOT EXISTS chat_summaries (
+		user_id INTEGER PRIMARY KEY,
+		summary TEXT NOT NULL,
+		covered_seq INTEGER NOT NULL,
+		updated_at REAL NOT NULL
+	)
+'''
+SQL_CREATE_CHAT_ARCHIVE = '''
+	CREATE TABLE IF NOT EXISTS chat_archive (
+		user_id INTEGER NOT NULL,
+		archived_at REAL NOT NULL,
+		user_role TEXT,
+		last_active REAL,
+		payload BLOB NOT NULL,
+		PRIMARY KEY (user_id, archived_at)
+	) WITHOUT ROWID
+'''
+SQL_CREATE_CHAT_USERS_UPDATED_INDEX = "CREATE INDEX IF NOT EXISTS idx_chat_users_updated_at ON chat_users (updated_at)"
+SQL_LEGACY_TABLE_EXISTS = "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'chat_histories'"
+SQL_SELECT_LEGACY = "SELECT user_id, history, user_role FROM chat_histories"
+SQL_DROP_LEGACY = "DROP TABLE chat_histories"
+
+SQL_SELECT_ROLE = "SELECT user_role FROM chat_users WHERE user_id = ?"
+SQL_UPSERT_ROLE = '''
+	INSERT INTO chat_users (user_id, user_role, updated_at) VALUES (?, ?, ?)
+	ON CONFLICT(user_id) DO UPDATE SET user_role = excluded.user_role, updated_at = excluded.updated_at
+'''
+SQL_SELECT_SEEDS = "SELECT seq, role, parts FROM chat_messages WHERE user_id = ? AND seq < ? ORDER BY seq"
+SQL_SELECT_TAIL = '''
+	SELECT seq, role, parts FROM chat_messages
+	WHERE user_id = ? AND seq > ?
+	ORDER BY seq DESC LIMIT ?
+'''
+SQL_SELECT_RANGE = '''
+	SELECT seq, role, parts FROM chat_messages
+	WHERE user_id = ? AND seq > ? AND seq <= ?
+	ORDER BY seq LIMIT ?
+'''
+SQL_SELECT_SUMMARY = "SELECT summary, covered_seq FROM chat_summaries WHERE user_id = ?"
+SQL_MESSAGE_EXISTS = "SELECT 1 FROM chat_messages WHERE user_id = ? AND seq = ?"
+SQL_UPSERT_SUMMARY = '''
+	INSERT INTO chat_summaries (user_id, summary, covered_seq, updated_at) VALUES (?, ?, ?, ?)
+	ON CONFLICT(user_id) DO UPDATE SET
+		summary = excluded.summary,
+		covered_seq = excluded.covered_seq,
+		updated_at = excluded.updated_at
+	WHERE excluded.covered_seq > chat_summaries.covered_seq
+'''
+SQL_DELETE_SUMMARY = "DELETE FROM chat_summaries WHERE user_id = ?"
+SQL_BEGIN_IMMEDIATE = "BEGIN IMMEDIATE"
+SQL_NEXT_SEQ = "SELECT COALESCE(MAX(seq) + 1, 0) FROM chat_messages WHERE user_id = ?"
+SQL_INSERT_MESSAGE = "INSERT INTO chat_messages (user_id, seq, role, parts, created_at) VALUES (?, ?, ?, ?, ?)"
+SQL_DELETE_MESSAGES = "DELETE FROM chat_messages WHERE user_id = ?"
+SQL_DELETE_USER = "DELETE FROM chat_users WHERE user_id = ?"
+
+SQL_SELECT_IDLE_USERS = "SELECT user_id FROM chat_users WHERE updated_at < ? ORDER BY updated_at LIMIT ?"
+SQL_SELECT_USER_IF_IDLE = "SELECT user_role, updated_at FROM chat_users WHERE user_id = ? AND updated_at < ?"
+SQL_SELECT_ALL_MESSAGES = "SELECT seq, role, parts FROM chat_messages WHERE user_id = ? ORDER BY seq"
+SQL_INSERT_ARCHIVE = "INSERT INTO chat_archive (user_id, archived_at, user_role, last_active, payload) VALUES (?, ?, ?, ?, ?)"
+SQL_SELECT_UNCOMPRESSED_AFTER = '''
+	SELECT user_id, seq, parts FROM chat_messages
+	WHERE (user_id, seq) > (?, ?) AND typeof(parts) = 'text' AND length(parts) >= ?
+	ORDER BY user_id, seq LIMIT ?
+'''
+SQL_UPDATE_PARTS = "UPDATE chat_messages SET parts = ? WHERE user_id = ? AND seq = ?"
+
+# --- Стиснення JSON: короткий лишається текстом, довший стає BLOB (zstd впізнається за магічними байтами) ---
+def _active_compression() -> str:
+	if HISTORY_COMPRESSION == "zstd" and not ZSTD_AVAILABLE:
+		return "zlib"
+	return HISTORY_COMPRESSION
+
+def compress_json(value: Any, min_bytes: int = HISTORY_COMPRESS_MIN_BYTES) -> Union[str, bytes]:
+	text = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+	compression = _active_compression()
+	if compression == "none" or len(text) < min_bytes:
+		return text
+	raw = text.encode("utf-8")
+	if compression == "zstd":
+		packed = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(raw)
+	else:
+		packed = zlib.compress(raw, ZLIB_LEVEL)
+	# Нестисливі дані (наприклад, base64) вигідніше лишити текстом
+	return packed if len(packed) < len(raw) else text
+
+def decompress_json(stored: Union[str, bytes]) -> Any:
+	"""Розбирає значення, збережене compress_json. Пошкоджені дані — ValueError."""
+	if isinstance(stored, str):
+		return json.loads(stored)
+	if stored.startswith(ZSTD_MAGIC):
+		if not ZSTD_AVAILABLE:
+			raise ValueError("історію стиснуто zstd, але пакет zstandard не встановлено")
+		try:
+			raw = zstandard.ZstdDecompressor().decompress(stored)
+		except zstandard.ZstdError as e:
+			raise ValueError(f"пошкоджені дані zstd: {e}") from e
+	else:
+		try:
+			raw = zlib.decompress(stored)
+		except zlib.error as e:
+			raise ValueError(f"пошкоджені дані zlib: {e}") from e
+	return json.loads(raw)
+
+# --- Перетворення повідомлень у рядки таблиці ---
+def _message_rows(user_id: int, first_seq: int, messages: List[Dict[str, Any]], now: float):
+	return [
+		(user_id, first_seq + i, msg["role"], compress_json(msg.get("parts", [])), now)
+		for i, msg in enumerate(messages)
+	]
+
+# --- Розбір рядків таблиці назад у повідомлення ---
+def _decode_rows(rows) -> List[Tuple[int, Dict[str, Any]]]:
+	return [(seq, {"role": role, "parts": decompress_json(parts)}) for seq, role, parts in rows]
+
+# --- Груба оцінка кількості токенів (~4 символи на токен) без звернення до API ---
+def estimate_tokens(message: Dict[str, Any]) -> int:
+	return 4 + sum(len(str(part)) for part in message.get("parts", [])) // 4
+
+# --- Повідомлення, якими підсумок вставляється в історію одразу після системного промпта ---
+def summary_turns(summary: str) -> List[Dict[str, Any]]:
+	return [
+		{"role": "user", "parts": [f"Короткий підсумок нашої попередньої розмови:\n{summary}"]},
+		{"role": "model", "parts": ["Зрозуміла, я пам'ятаю про це."]},
+	]
+
+# --- Вікно історії, підготовлене для запиту до Gemini ---
+class HistoryWindow(NamedTuple):
+	history: List[Dict[str, Any]]
+	role: Optional[str]
+	# Останній seq, до якого (включно) старі повідомлення слід стиснути в підсумок, або None
+	compact_until_seq: Optional[int]
+
+# --- Міграція зі старої таблиці chat_histories (один JSON на користувача) ---
+async def _migrate_legacy_histories(db: aiosqlite.Connection):
+	cursor = await db.execute(SQL_LEGACY_TABLE_EXISTS)
+	exists = await cursor.fetchone()
+	await cursor.close()
+	if not exists:
+		return
+
+	cursor = await db.execute(SQL_SELECT_LEGACY)
+	legacy_rows = await cursor.fetchall()
+	await cursor.close()
+
+	now = time.time()
+	migrated = 0
+	for user_id, history_str, user_role in legacy_rows:
+		try:
+			history = json.loads(history_str) if history_str else []
+		except json.JSONDecodeError as e:
+			logger.warning("Пропущено пошкоджену історію користувача %d під час міграції: %s", user_id, e)
+			continue
+		await db.execute(SQL_UPSERT_ROLE, (user_id, user_role or 'REGULAR', now))
+		await db.execute(SQL_DELETE_MESSAGES, (user_id,))
+		await db.executemany(SQL_INSERT_MESSAGE, _message_rows(user_id, 0, history, now))
+		migrated += 1
+
+	await db.execute(SQL_DROP_LEGACY)
+	logger.info("Мігровано %d історій з chat_histories у chat_messages.", migrated)
+
+# --- Налаштування бази даних SQLite ---
+async def init_db():
+	"""
+	Відкриває пул з'єднань та ініціалізує базу даних: таблиця chat_users (роль)
+	і chat_messages (по рядку на повідомлення). Старі бази з chat_histories мігруються автоматично.
+	"""
+	try:
+		await db_pool.open()
+		async with db_pool.writer() as db:
+			await db.execute(SQL_CREATE_CHAT_USERS)
+			await db.execute(SQL_CREATE_CHAT_MESSAGES)
+			await db.execute(SQL_CREATE_CHAT_SUMMARIES)
+			await db.execute(SQL_CREATE_CHAT_ARCHIVE)
+			await db.execute(SQL_CREATE_CHAT_USERS_UPDATED_INDEX)
+			await _migrate_legacy_histories(db)
+		if HISTORY_COMPRESSION == "zstd" and not ZSTD_AVAILABLE:
+			logger.warning("HISTORY_COMPRESSION = 'zstd', але пакет zstandard не встановлено — використовується zlib.")
+		logger.info("База даних '%s' ініціалізована успішно.", DB_NAME)
+	except aiosqlite.Error as e:
+		logger.error("Помилка ініціалізації бази даних '%s': %s", DB_NAME, e)
+
+# --- Закриття пулу з'єднань ---
+async def close_db():
+	"""Закриває всі з'єднання з базою даних. Викликається з main.shutdown."""
+	await db_pool.close()
+
+# --- Вікно історії в межах бюджету токенів ---
+async def get_history_window(user_id: int, token_budget: int) -> HistoryWindow:
+	"""
+	Збирає історію для Gemini: системний промпт, збережений підсумок старої частини розмови
+	та стільки останніх повідомлень, скільки вміщується в `token_budget`.
+	Якщо нестиснуті повідомлення вже не вміщуються, повертає межу для фонового стиснення.
+	"""
+	try:
+		async with db_pool.reader() as db:
+			cursor = await db.execute(SQL_SELECT_ROLE, (user_id,))
+			role_row = await cursor.fetchone()
+			await cursor.close()
+			if not role_row:
+				return HistoryWindow([], None, None)
+
+			cursor = await db.execute(SQL_SELECT_SEEDS, (user_id, HISTORY_SEED_MESSAGES))
+			seed_rows = await cursor.fetchall()
+			await cursor.close()
+
+			cursor = await db.execute(SQL_SELECT_SUMMARY, (user_id,))
+			summary_row = await cursor.fetchone()
+			await cursor.close()
+
+			covered_seq = summary_row[1] if summary_row else HISTORY_SEED_MESSAGES - 1
+			cursor = await db.execute(SQL_SELECT_TAIL, (user_id, covered_seq, HISTORY_MAX_MESSAGES))
+			tail_rows = await cursor.fetchall()
+			await cursor.close()
+
+		seeds = [msg for _, msg in _decode_rows(seed_rows)]
+		tail = _decode_rows(tail_rows)  # від найновішого до найстарішого
+	except (aiosqlite.Error, ValueError) as e:
+		logger.error("Помилка при завантаженні вікна історії користувача %d: %s", user_id, e)
+		return HistoryWindow([], None, None)
+
+	prefix = seeds + (summary_turns(summary_row[0]) if summary_row else [])
+	remaining = token_budget - sum(estimate_tokens(msg) for msg in prefix)
+	keep_budget = remaining * HISTORY_COMPACT_KEEP_RATIO
+
+	kept: List[Dict[str, Any]] = []
+	used = 0
+	overflow = False
+	compact_until_seq = None
+	for seq, msg in tail:
+		cost = estimate_tokens(msg)
+		if used + cost > remaining:
+			overflow = True
+		if not overflow:
+			kept.append(msg)
+		# Межа стиснення: усе старше за ту частину, що вміщується в keep_budget
+		if compact_until_seq is None and used + cost > keep_budget and msg["role"] == "model":
+			compact_until_seq = seq
+		used += cost
+		if overflow and compact_until_seq is not None:
+			break
+
+	# Вікно має починатися з повідомлення користувача, щоб ролі чергувалися
+	while kept and kept[-1]["role"] == "model":
+		kept.pop()
+	kept.reverse()
+
+	if not overflow:
+		compact_until_seq = None
+
+	return HistoryWindow(prefix + kept, role_row[0], compact_until_seq)
+
+# --- Повідомлення, які потрібно стиснути в підсумок ---
+async def get_messages_for_summary(
+	user_id: int,
+	until_seq: int,
+	limit: int = HISTORY_MAX_MESSAGES
+) -> Tuple[Optional[str], List[Dict[str, Any]], Optional[int]]:
+	"""
+	Повертає поточний підсумок, найстаріші `limit` ще не стиснутих повідомлень до `until_seq`
+	включно та seq останнього з них (None, якщо стискати нічого). Підсумок зберігається саме
+	до цього seq — решта потрапить у наступну порцію.
+	"""
+	async with db_pool.reader() as db:
+		cursor = await db.execute(SQL_SELECT_SUMMARY, (user_id,))
+		summary_row = await cursor.fetchone()
+		await cursor.close()
+
+		covered_seq = summary_row[1] if summary_row else HISTORY_SEED_MESSAGES - 1
+		cursor = await db.execute(SQL_SELECT_RANGE, (user_id, covered_seq, until_seq, limit))
+		rows = await cursor.fetchall()
+		await cursor.close()
+
+	decoded = _decode_rows(rows)
+	last_seq = decoded[-1][0] if decoded else None
+	return (summary_row[0] if summary_row else None), [msg for _, msg in decoded], last_seq
+
+# --- Збереження підсумку ---
+async def save_summary_to_db(user_id: int, summary: str, covered_seq: int) -> bool:
+	"""
+	Зберігає підсумок, що покриває повідомлення до `covered_seq`.
+	Нічого не робить, якщо історію тим часом скинули або вже є новіший підсумок.
+	"""
+	async with db_pool.writer() as db:
+		cursor = await db.execute(SQL_MESSAGE_EXISTS, (user_id, covered_seq))
+		exists = await cursor.fetchone()
+		await cursor.close()
+		if not exists:
+			return False
+		await db.execute(SQL_UPSERT_SUMMARY, (user_id, summary, covered_seq, time.time()))
+	logger.debug("Підсумок історії користувача %d оновлено до seq=%d.", user_id, covered_seq)
+	return True
+
+# --- Повне перезаписування історії (ініціалізація або зміна ролі) ---
+async def save_user_history_to_db(user_id: int, history: List[Dict[str, Any]], user_role: str):
+	"""Замінює всю історію чату та роль для конкретного користувача."""
+	now = time.time()
+	try:
+		async with db_pool.writer() as db:
+			await db.execute(SQL_UPSERT_ROLE, (user_id, user_role, now))
+			await db.execute(SQL_DELETE_MESSAGES, (user_id,))
+			await db.execute(SQL_DELETE_SUMMARY, (user_id,))
+			await db.executemany(SQL_INSERT_MESSAGE, _message_rows(user_id, 0, history, now))
+		logger.debug("Історія та роль '%s' для користувача %d перезаписана.", user_role, user_id)
+	except aiosqlite.Error as e:
+		logger.error("Помилка при збереженні історії для користувача %d у '%s': %s", user_id, DB_NAME, e)
+
+# --- Дописування нових повідомлень у кінець історії ---
+async def append_messages_to_db(user_id: int, messages: List[Dict[str, Any]], user_role: str):
+	"""Додає повідомлення в кінець історії користувача, не переписуючи наявні рядки."""
+	now = time.time()
+	try:
+		async with db_pool.writer() as db:
+			# Повідомлення користувача можуть надходити з різних чатів, тобто й з різних воркерів:
+			# BEGIN IMMEDIATE не дає іншому процесу отримати той самий seq між читанням і записом
+			await db.execute(SQL_BEGIN_IMMEDIATE)
+			cursor = await db.execute(SQL_NEXT_SEQ, (user_id,))
+			(next_seq,) = await cursor.fetchone()
+			await cursor.close()
+			await db.execute(SQL_UPSERT_ROLE, (user_id, user_role, now))
+			await db.executemany(SQL_INSERT_MESSAGE, _message_rows(user_id, next_seq, messages, now))
+		logger.debug("Додано %d повідомлень в історію користувача %d.", len(messages), user_id)
+	except aiosqlite.Error as e:
+		logger.error("Помилка при дописуванні історії для користувача %d у '%s': %s", user_id, DB_NAME, e)
+
+# --- Видалення історії користувача з бази даних ---
+async def delete_user_history_from_db(user_id: int):
+	"""Видаляє історію чату для конкретного користувача з бази даних."""
+	try:
+		async with db_pool.writer() as db:
+			await db.execute(SQL_DELETE_MESSAGES, (user_id,))
+			await db.execute(SQL_DELETE_SUMMARY, (user_id,))
+			await db.execute(SQL_DELETE_USER, (user_id,))
+		logger.info("Історія для користувача %d видалена з '%s'.", user_id, DB_NAME)
+	except aiosqlite.Error as e:
+		logger.error("Помилка при видаленні історії для користувача %d: %s", user_id, e)
+
+# --- Обслуговування: неактивні розмови ---
+async def get_idle_users(idle_before: float, limit: int) -> List[int]:
+	"""Користувачі, чия історія не змінювалась з `idle_before` (спершу найдавніші)."""
+	async with db_pool.reader() as db:
+		cursor = await db.execute(SQL_SELECT_IDLE_USERS, (idle_before, limit))
+		rows = await cursor.fetchall()
+		await cursor.close()
+	return [user_id for (user_id,) in rows]
+
+async def retire_user_history(user_id: int, idle_before: float, archive: bool) -> bool:
+	"""
+	Видаляє історію неактивного користувача; з `archive` спершу зберігає її одним стиснутим
+	записом у chat_archive. Нічого не робить, якщо користувач тим часом повернувся.
+	"""
+	async with db_pool.writer() as db:
+		await db.execute(SQL_BEGIN_IMMEDIATE)  # інший воркер не допише історію між перевіркою та видаленням
+		cursor = await db.execute(SQL_SELECT_USER_IF_IDLE, (user_id, idle_before))
+		user_row = await cursor.fetchone()
+		await cursor.close()
+		if not user_row:
+			return False
+
+		if archive:
+			cursor = await db.execute(SQL_SELECT_ALL_MESSAGES, (user_id,))
+			rows = await cursor.fetchall()
+			await cursor.close()
+			cursor = await db.execute(SQL_SELECT_SUMMARY, (user_id,))
+			summary_row = await cursor.fetchone()
+			await cursor.close()
+			payload = {
+				"history": [msg for _, msg in _decode_rows(rows)],
+				"summary": summary_row[0] if summary_row else None,
+				"summary_covered_seq": summary_row[1] if summary_row else None,
+			}
+			await db.execute(
+				SQL_INSERT_ARCHIVE,
+				(user_id, time.time(), user_row[0], user_row[1], compress_json(payload, min_bytes=0))
+			)
+
+		await db.execute(SQL_DELETE_MESSAGES, (user_id,))
+		await db.execute(SQL_DELETE_SUMMARY, (user_id,))
+		await db.execute(SQL_DELETE_USER, (user_id,))
+	return True
+
+# --- Обслуговування: стиснення повідомлень, збережених текстом до ввімкнення стиснення ---
+async def compress_stored_messages(
+	after: Tuple[int, int],
+	limit: int
+) -> Tuple[Optional[Tuple[int, int]], int, int]:
+	"""
+	Стискає наступні `limit` нестиснутих повідомлень після ключа `after` = (user_id, seq).
+	Повертає ключ для наступного виклику (None — таблицю пройдено), кількість стиснутих рядків і зекономлені байти.
+	"""
+	if _active_compression() == "none":
+		return None, 0, 0
+	async with db_pool.writer() as db:
+		cursor = await db.execute(SQL_SELECT_UNCOMPRESSED_AFTER, (*after, HISTORY_COMPRESS_MIN_BYTES, limit))
+		rows = await cursor.fetchall()
+		await cursor.close()
+		updates = []
+		saved = 0
+		for user_id, seq, parts in rows:
+			try:
+				packed = compress_json(json.loads(parts))
+			except ValueError:
+				continue
+			if isinstance(packed, bytes):
+				updates.append((packed, user_id, seq))
+				saved += len(parts.encode("utf-8")) - len(packed)
+		if updates:
+			await db.executemany(SQL_UPDATE_PARTS, updates)
+	next_key = (rows[-1][0], rows[-1][1]) if len(rows) == limit else None
+	return next_key, len(updates), saved
@@ -0,0 +1,134 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import asyncio
+import contextlib
+import logging
+import time
+from typing import AsyncIterator, List, Optional
+
+import aiosqlite
+
+from metrics import DB_SECONDS
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# --- Налаштування з'єднань ---
+STATEMENT_CACHE_SIZE = 256  # Кеш підготовлених виразів sqlite3 на кожне з'єднання
+BUSY_TIMEOUT_MS = 5000
+
+# --- Пул з'єднань SQLite: один writer + обмежений пул readers ---
+class SQLitePool:
+	"""
+	Довгоживучий менеджер з'єднань до однієї бази SQLite.
+	Відкриває одне з'єднання для запису (з серіалізацією через asyncio.Lock)
+	та обмежений пул з'єднань для читання. Усі з'єднання працюють у режимі WAL,
+	тож читачі не блокуються записом. sqlite3 кешує підготовлені вирази
+	для однакового SQL-тексту, тому запити варто тримати в константах.
+	"""
+
+	def __init__(self, path: str, readers: int = 4):
+		self.path = path
+		self.readers_count = max(1, readers)
+		self._writer: Optional[aiosqlite.Connection] = None
+		self._write_lock = asyncio.Lock()
+		self._readers: "asyncio.Queue[aiosqlite.Connection]" = asyncio.Queue()
+		self._all_readers: List[aiosqlite.Connection] = []
+		self._opened = False
+
+	@property
+	def is_open(self) -> bool:
+		return self._opened
+
+	async def _connect(self, read_only: bool) -> aiosqlite.Connection:
+		db = await aiosqlite.connect(self.path, cached_statements=STATEMENT_CACHE_SIZE)
+		await db.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+		await db.execute("PRAGMA synchronous = NORMAL")
+		if read_only:
+			await db.execute("PRAGMA query_only = ON")
+		return db
+
+	async def open(self):
+		"""Відкриває writer та пул readers. Повторний виклик нічого не робить."""
+		if self._opened:
+			return
+
+		self._writer = await self._connect(read_only=False)
+		cursor = await self._writer.execute("PRAGMA journal_mode = WAL")
+		mode = await cursor.fetchone()
+		if mode and str(mode[0]).lower() != "wal":
+			logger.warning("SQLite '%s' не перейшла в режим WAL (поточний: %s).", self.path, mode[0])
+
+		for _ in range(self.readers_count):
+			reader = await self._connect(read_only=True)
+			self._all_readers.append(reader)
+			self._readers.put_nowait(reader)
+
+		self._opened = True
+		logger.info("Пул SQLite '%s' відкрито: 1 writer, %d readers.", self.path, self.readers_count)
+
+	def _ensure_open(self):
+		if not self._opened:
+			raise RuntimeError(f"Пул SQLite '{self.path}' не відкрито. Викличте init_db().")
+
+	@contextlib.asynccontextmanager
+	async def reader(self) -> AsyncIterator[aiosqlite.Connection]:
+		"""Позичає з'єднання для читання з пулу (чекає, якщо всі зайняті)."""
+		self._ensure_open()
+		db = await self._readers.get()
+		started = time.perf_counter()
+		try:
+			with span("sqlite.reader"):
+				yield db
+		finally:
+			self._readers.put_nowait(db)
+			DB_SECONDS.observe(time.perf_counter() - started, "reader")
+
+	@contextlib.asynccontextmanager
+	async def writer(self) -> AsyncIterator[aiosqlite.Connection]:
+		"""
+		Ексклюзивний доступ до з'єднання для запису.
+		Транзакція комітиться при виході з блоку або відкочується при помилці.
+		"""
+		self._ensure_open()
+		async with self._write_lock:
+			started = time.perf_counter()
+			try:
+				with span("sqlite.writer"):
+					yield self._writer
+					await self._writer.commit()
+			except BaseException:
+				with contextlib.suppress(Exception):
+					await self._writer.rollback()
+				raise
+			finally:
+				DB_SECONDS.observe(time.perf_counter() - started, "writer")
+
+	async def close(self):
+		"""
+		Дочікується поточного запису, переносить WAL в основний файл бази і закриває всі
+		з'єднання пулу. Безпечно викликати кілька разів.
+		"""
+		if not self._opened:
+			return
+		self._opened = False
+
+		async with self._write_lock:
+			try:
+				await self._writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+			except Exception as e:
+				logger.warning("Не вдалося виконати checkpoint WAL для '%s': %s", self.path, e)
+			for db in [*self._all_readers, self._writer]:
+				if db is None:
+					continue
+				try:
+					await db.close()
+				except Exception as e:
+					logger.warning("Не вдалося закрити з'єднання SQLite '%s': %s", self.path, e)
+
+		self._writer = None
+		self._all_readers.clear()
+		self._readers = asyncio.Queue()
+		logger.info("Пул SQLite '%s' закрито.", self.path)
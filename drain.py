@@ -0,0 +1,110 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Set, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+import config
+from background import background_tasks
+
+logger = logging.getLogger("yuki.drain")
+
+# --- Налаштування зупинки ---
+SHUTDOWN_DRAIN_TIMEOUT = getattr(config, "SHUTDOWN_DRAIN_TIMEOUT", 20.0)  # скільки чекати на незавершену роботу (сек)
+SHUTDOWN_CANCEL_GRACE = 5.0  # скільки дати скасованим задачам на їхні finally (видалення файлів, відкат транзакцій)
+
+# --- Апдейти, що обробляються зараз: задача -> (опис, час початку) ---
+in_flight_updates: Dict[asyncio.Task, Tuple[str, float]] = {}
+
+# --- Дії при перериванні (наприклад, зупинити потоки yt-dlp, які скасування задачі не зупиняє) ---
+_abort_hooks: List[Callable[[], Any]] = []
+
+def on_abort(hook: Callable[[], Any]) -> Callable[[], Any]:
+	"""Реєструє функцію, яку drain() викличе перед скасуванням задач, що не встигли завершитись."""
+	_abort_hooks.append(hook)
+	return hook
+
+def describe_update(update: Update) -> str:
+	"""Короткий опис апдейта для звіту: тип, команда або дані кнопки, чат."""
+	event = update.event
+	chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+	detail = ""
+	text = getattr(event, "text", None) or getattr(event, "caption", None)
+	if text:
+		detail = text.split(maxsplit=1)[0][:32] if text.startswith("/") else "текст"
+	elif getattr(event, "data", None):
+		detail = f"кнопка {event.data[:32]}"
+	elif getattr(event, "photo", None):
+		detail = "фото"
+	parts = [update.event_type, detail, f"чат {chat.id}" if chat else ""]
+	return " ".join(part for part in parts if part)
+
+class InFlightMiddleware(BaseMiddleware):
+	"""Outer-middleware для dp.update: запам'ятовує задачу кожного апдейта, поки він обробляється."""
+
+	async def __call__(
+		self,
+		handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+		event: TelegramObject,
+		data: Dict[str, Any],
+	) -> Any:
+		task = asyncio.current_task()
+		if task is None or task in in_flight_updates:
+			return await handler(event, data)
+		in_flight_updates[task] = (describe_update(event), time.monotonic())
+		try:
+			return await handler(event, data)
+		finally:
+			in_flight_updates.pop(task, None)
+
+# --- Очікування та скасування ---
+def _describe_task(task: asyncio.Task, now: float) -> str:
+	label, started = in_flight_updates.get(task, (None, None))
+	if label is not None:
+		return f"{label} (триває {now - started:.1f} сек)"
+	return f"фонова задача {task.get_name()}"
+
+def _unfinished(exclude: asyncio.Task) -> Set[asyncio.Task]:
+	return {task for task in (*in_flight_updates, *background_tasks) if task is not exclude and not task.done()}
+
+async def drain(timeout: float = SHUTDOWN_DRAIN_TIMEOUT) -> List[str]:
+	"""
+	Дає апдейтам, що вже обробляються, і фоновим задачам (черга Yuki, стиснення історії) до
+	`timeout` секунд на завершення; задачі, запущені за цей час, теж чекаємо. Решту скасовує
+	(спершу викликавши хуки on_abort) і повертає їхні описи. Нові апдейти має бути зупинено до виклику.
+	"""
+	loop = asyncio.get_running_loop()
+	current = asyncio.current_task()
+	deadline = loop.time() + timeout
+	pending = _unfinished(current)
+	if pending:
+		logger.info("Очікуємо завершення %d задач (до %.0f сек)…", len(pending), timeout)
+	while pending and loop.time() < deadline:
+		await asyncio.wait(pending, timeout=deadline - loop.time())
+		pending = _unfinished(current)
+
+	if not pending:
+		logger.info("Уся незавершена робота виконана.")
+		return []
+
+	now = time.monotonic()
+	cut_off = sorted(_describe_task(task, now) for task in pending)
+	for hook in _abort_hooks:
+		try:
+			hook()
+		except Exception as e:
+			logger.warning("Помилка хука переривання %s: %s", getattr(hook, "__name__", hook), e)
+	for task in pending:
+		task.cancel()
+	await asyncio.wait(pending, timeout=SHUTDOWN_CANCEL_GRACE)
+
+	logger.warning("Дедлайн зупинки (%.0f сек) минув, перервано %d задач:", timeout, len(cut_off))
+	for description in cut_off:
+		logger.warning("  ✂️ %s", description)
+	return cut_off
@@ -0,0 +1,382 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import asyncio
+import collections
+import contextlib
+import logging
+import random
+import time
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+import config
+from lazy_imports import lazy_import
+from metrics import track_dependency
+
+# --- google-generativeai і grpc імпортуються (~0.5 сек) при першому запиті або під час warm_up ---
+genai = lazy_import("google.generativeai")
+glm = lazy_import("google.ai.generativelanguage")
+grpc_aio = lazy_import("grpc.aio")
+grpc_transports = lazy_import("google.ai.generativelanguage_v1beta.services.generative_service.transports.grpc_asyncio")
+api_exceptions = lazy_import("google.api_core.exceptions")
+
+logger = logging.getLogger("yuki.gemini")
+
+# --- Обмеження одночасних запитів та тайм-аути ---
+GEMINI_MAX_CONCURRENCY = getattr(config, "GEMINI_MAX_CONCURRENCY", 8)
+GEMINI_QUEUE_TIMEOUT = getattr(config, "GEMINI_QUEUE_TIMEOUT", 30)  # скільки чекати вільного слота
+GEMINI_REQUEST_TIMEOUT = getattr(config, "GEMINI_REQUEST_TIMEOUT", 60)  # загальний час на запит разом з перемиканнями
+GEMINI_ATTEMPT_TIMEOUT = getattr(config, "GEMINI_ATTEMPT_TIMEOUT", 30)  # час на одну спробу одного бекенда
+
+# --- Бекенди: ключі та моделі (перша модель — основна, решта — запасні) ---
+GEMINI_API_KEYS = getattr(config, "GEMINI_API_KEYS", [config.GEMINI_API_KEY])
+GEMINI_MODELS = getattr(config, "GEMINI_MODELS", ["gemini-2.0-flash"])
+GEMINI_BACKENDS = getattr(config, "GEMINI_BACKENDS", None)  # явний список словників, див. README
+
+# --- Автоматичний вимикач (circuit breaker) ---
+GEMINI_BREAKER_THRESHOLD = getattr(config, "GEMINI_BREAKER_THRESHOLD", 3)    # послідовних збоїв до розмикання
+GEMINI_BREAKER_COOLDOWN = getattr(config, "GEMINI_BREAKER_COOLDOWN", 30)     # пауза після 429/таймаутів (сек)
+GEMINI_DISABLED_COOLDOWN = getattr(config, "GEMINI_DISABLED_COOLDOWN", 600)  # пауза після SERVICE_DISABLED (сек)
+GEMINI_BREAKER_MAX_COOLDOWN = 3600
+
+GENERATION_CONFIG = {
+	"temperature": 0.9,
+	"top_p": 1,
+	"top_k": 1,
+	"max_output_tokens": 2048,
+}
+# Назви замість переліків HarmCategory/HarmBlockThreshold — SDK перетворює їх сам, а імпорт не потрібен
+SAFETY_SETTINGS = [
+	{"category": "HARM_CATEGORY_HARASSMENT", "threshold": "BLOCK_NONE"},
+	{"category": "HARM_CATEGORY_HATE_SPEECH", "threshold": "BLOCK_NONE"},
+	{"category": "HARM_CATEGORY_SEXUALLY_EXPLICIT", "threshold": "BLOCK_NONE"},
+	{"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
+]
+
+_semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+_in_flight = 0  # зайняті слоти (для метрик)
+
+# --- Помилки черги та тайм-аутів ---
+class GeminiBusyError(Exception):
+	"""Усі слоти для запитів до Gemini зайняті довше, ніж GEMINI_QUEUE_TIMEOUT."""
+
+class GeminiUnavailableError(GeminiBusyError):
+	"""Усі бекенди Gemini розімкнені вимикачем або вичерпали квоту."""
+
+class GeminiTimeoutError(Exception):
+	"""Виклик Gemini не завершився за GEMINI_REQUEST_TIMEOUT."""
+
+# --- Класифікація помилок бекенда ---
+def _failure_cooldown(error: BaseException) -> Optional[float]:
+	"""
+	Для помилок, після яких варто перейти на інший бекенд, повертає рекомендовану паузу
+	(0 — рахувати як звичайний збій до порогу). None — помилка запиту, а не бекенда.
+	"""
+	if isinstance(error, api_exceptions.PermissionDenied) and "SERVICE_DISABLED" in str(error):
+		return GEMINI_DISABLED_COOLDOWN
+	if isinstance(error, (api_exceptions.ResourceExhausted, api_exceptions.TooManyRequests)):
+		return GEMINI_BREAKER_COOLDOWN
+	if isinstance(error, (
+		asyncio.TimeoutError,
+		api_exceptions.DeadlineExceeded,
+		api_exceptions.ServiceUnavailable,
+		api_exceptions.InternalServerError,
+		api_exceptions.Unauthenticated,
+		api_exceptions.PermissionDenied,
+	)):
+		return 0
+	return None
+
+# --- Запит generateContent (той самий, що будує genai.GenerativeModel) ---
+def _build_request(model_name: str, history: List[Dict[str, Any]], content: Any) -> "glm.GenerateContentRequest":
+	user_turn = {"role": "user", "parts": content if isinstance(content, list) else [content]}
+	return glm.GenerateContentRequest(
+		model=model_name if "/" in model_name else f"models/{model_name}",
+		contents=genai.types.content_types.to_contents([*history, user_turn]),
+		generation_config=GENERATION_CONFIG,
+		safety_settings=SAFETY_SETTINGS,
+	)
+
+# --- Один бекенд: ключ + модель ---
+class GeminiBackend:
+	"""
+	Пара (API-ключ, модель) зі своїм клієнтом, вагою, квотою запитів на хвилину
+	та станом вимикача. `endpoint` дозволяє спрямувати бекенд на локальний
+	сервер без TLS (наприклад, bench/fake_gemini.py).
+	"""
+
+	def __init__(
+		self,
+		api_key: str,
+		model: str,
+		weight: float = 1.0,
+		tier: int = 0,
+		rpm: Optional[int] = None,
+		endpoint: Optional[str] = None
+	):
+		self.api_key = api_key
+		self.model_name = model
+		self.weight = weight
+		self.tier = tier
+		self.rpm = rpm
+		self.endpoint = endpoint
+		self.name = f"{model}@…{api_key[-4:]}" if api_key else model
+		if endpoint:
+			self.name += f"[{endpoint}]"
+
+		self._client: "Optional[glm.GenerativeServiceAsyncClient]" = None
+		self._recent: Deque[float] = collections.deque()
+		self.failures = 0
+		self.open_until = 0.0
+		self.cooldown = GEMINI_BREAKER_COOLDOWN
+		self.half_open_probe = False
+		self.requests = 0
+		self.errors = 0
+
+	@property
+	def client(self) -> "glm.GenerativeServiceAsyncClient":
+		# Клієнт створюється в циклі подій: канал grpc.aio прив'язується до нього.
+		# genai.GenerativeModel бере один клієнт на процес (genai.configure), тому запити
+		# йдуть напряму через власний клієнт бекенда — зі своїм ключем або endpoint
+		if self._client is None:
+			if self.endpoint:
+				transport = grpc_transports.GenerativeServiceGrpcAsyncIOTransport(channel=grpc_aio.insecure_channel(self.endpoint))
+				self._client = glm.GenerativeServiceAsyncClient(transport=transport)
+			else:
+				self._client = glm.GenerativeServiceAsyncClient(client_options={"api_key": self.api_key})
+		return self._client
+
+	async def generate(self, history: List[Dict[str, Any]], content: Any, stream: bool = False):
+		"""
+		generateContent з історією `history` і новим ходом користувача `content` (текст або
+		список частин, зокрема PIL-зображень). Повертає AsyncGenerateContentResponse, як і SDK.
+		"""
+		request = _build_request(self.model_name, history, content)
+		if stream:
+			# Дедлайн gRPC діє на весь потік: GEMINI_ATTEMPT_TIMEOUT обмежує лише перший шматок
+			# (у GeminiPool.run), а потік загалом — GEMINI_REQUEST_TIMEOUT
+			iterator = await self.client.stream_generate_content(request, timeout=GEMINI_REQUEST_TIMEOUT)
+			return await genai.types.AsyncGenerateContentResponse.from_aiterator(iterator)
+		response = await self.client.generate_content(request, timeout=GEMINI_ATTEMPT_TIMEOUT)
+		return genai.types.AsyncGenerateContentResponse.from_response(response)
+
+	def available(self, now: float) -> bool:
+		if self.open_until > now:
+			return False
+		if self.open_until and self.half_open_probe:
+			return False  # напіввідкритий: пробний запит уже в дорозі
+		if self.rpm:
+			while self._recent and now - self._recent[0] > 60:
+				self._recent.popleft()
+			if len(self._recent) >= self.rpm:
+				return False
+		return True
+
+	def on_start(self, now: float):
+		self.requests += 1
+		self._recent.append(now)
+		if self.open_until:
+			self.half_open_probe = True
+
+	def on_success(self):
+		if self.open_until:
+			logger.info("Бекенд Gemini %s відновився, вимикач замкнено.", self.name)
+		self.failures = 0
+		self.open_until = 0.0
+		self.cooldown = GEMINI_BREAKER_COOLDOWN
+		self.half_open_probe = False
+
+	def on_failure(self, cooldown: float, error: BaseException):
+		self.errors += 1
+		self.failures += 1
+		was_probe = self.half_open_probe
+		self.half_open_probe = False
+		if cooldown or was_probe or self.failures >= GEMINI_BREAKER_THRESHOLD:
+			if was_probe:
+				self.cooldown = min(self.cooldown * 2, GEMINI_BREAKER_MAX_COOLDOWN)
+			pause = max(cooldown, self.cooldown)
+			self.open_until = time.monotonic() + pause
+			logger.warning("Бекенд Gemini %s вимкнено на %d сек: %s: %s", self.name, pause, type(error).__name__, error)
+
+	def stats(self) -> Dict[str, Any]:
+		now = time.monotonic()
+		return {
+			"backend": self.name,
+			"tier": self.tier,
+			"requests": self.requests,
+			"errors": self.errors,
+			"open": self.open_until > now,
+			"last_minute": len(self._recent),
+		}
+
+# --- Пул бекендів ---
+class GeminiPool:
+	"""
+	Вибирає бекенд для кожного запиту: серед доступних бекендів найнижчого рівня
+	(основна модель, потім запасні) — випадково з урахуванням ваги. Бекенди, що
+	повертають 429, SERVICE_DISABLED або не відповідають, тимчасово виключаються,
+	а запит повторюється на наступному.
+	"""
+
+	def __init__(self, backends: List[GeminiBackend]):
+		if not backends:
+			raise ValueError("Потрібен хоча б один бекенд Gemini.")
+		self.backends = backends
+
+	def pick(self, exclude: List[GeminiBackend]) -> Optional[GeminiBackend]:
+		now = time.monotonic()
+		candidates = [b for b in self.backends if b not in exclude and b.available(now)]
+		if not candidates:
+			return None
+		tier = min(b.tier for b in candidates)
+		candidates = [b for b in candidates if b.tier == tier]
+		return random.choices(candidates, weights=[b.weight for b in candidates])[0]
+
+	async def run(self, attempt_factory):
+		"""
+		Виконує `attempt_factory(backend)` з перемиканням між бекендами.
+		Загальний час обмежений GEMINI_REQUEST_TIMEOUT, кожна спроба — GEMINI_ATTEMPT_TIMEOUT.
+		"""
+		loop = asyncio.get_running_loop()
+		deadline = loop.time() + GEMINI_REQUEST_TIMEOUT
+		tried: List[GeminiBackend] = []
+		last_error: Optional[BaseException] = None
+
+		while (backend := self.pick(tried)) is not None:
+			remaining = deadline - loop.time()
+			if remaining <= 0:
+				break
+			tried.append(backend)
+			backend.on_start(time.monotonic())
+			try:
+				with track_dependency("gemini", backend.model_name):
+					result = await asyncio.wait_for(attempt_factory(backend), timeout=min(remaining, GEMINI_ATTEMPT_TIMEOUT))
+			except Exception as e:
+				cooldown = _failure_cooldown(e)
+				if cooldown is None:
+					backend.on_success()  # сам бекенд працює, помилка в запиті
+					raise
+				backend.on_failure(cooldown, e)
+				last_error = e
+				continue
+			backend.on_success()
+			if len(tried) > 1:
+				logger.info("Запит до Gemini виконано через запасний бекенд %s.", backend.name)
+			return result
+
+		if isinstance(last_error, asyncio.TimeoutError):
+			raise GeminiTimeoutError(f"Gemini не відповів за {GEMINI_REQUEST_TIMEOUT} сек.") from None
+		if last_error is not None:
+			raise last_error
+		raise GeminiUnavailableError("Усі бекенди Gemini тимчасово недоступні.")
+
+	def stats(self) -> List[Dict[str, Any]]:
+		return [b.stats() for b in self.backends]
+
+def _backends_from_config() -> List[GeminiBackend]:
+	if GEMINI_BACKENDS:
+		return [GeminiBackend(**spec) for spec in GEMINI_BACKENDS]
+	return [
+		GeminiBackend(api_key=key, model=model, tier=tier)
+		for tier, model in enumerate(GEMINI_MODELS)
+		for key in GEMINI_API_KEYS
+	]
+
+gemini_pool = GeminiPool(_backends_from_config())
+
+# --- Слот для одного запиту ---
+@contextlib.asynccontextmanager
+async def _gemini_slot():
+	try:
+		await asyncio.wait_for(_semaphore.acquire(), timeout=GEMINI_QUEUE_TIMEOUT)
+	except asyncio.TimeoutError:
+		raise GeminiBusyError(f"Немає вільного слота Gemini за {GEMINI_QUEUE_TIMEOUT} сек.") from None
+	global _in_flight
+	_in_flight += 1
+	try:
+		yield
+	finally:
+		_in_flight -= 1
+		_semaphore.release()
+
+def share_limits(workers: int):
+	"""
+	Ділить ліміти між `workers` процесами з тими самими ключами: GEMINI_MAX_CONCURRENCY
+	і rpm кожного бекенда. Викликати до першого запиту до Gemini.
+	"""
+	global _semaphore
+	_semaphore = asyncio.Semaphore(max(1, GEMINI_MAX_CONCURRENCY // workers))
+	for backend in gemini_pool.backends:
+		if backend.rpm:
+			backend.rpm = max(1, backend.rpm // workers)
+
+def gemini_in_flight() -> int:
+	"""Скільки слотів Gemini зайнято зараз (для метрик)."""
+	return _in_flight
+
+async def _call(attempt_factory):
+	async with _gemini_slot():
+		return await gemini_pool.run(attempt_factory)
+
+# --- Публічний API ---
+async def send_chat_message(history: List[Dict[str, Any]], content: Any):
+	"""
+	Надсилає повідомлення в чат-сесію з заданою історією через асинхронний API,
+	не блокуючи цикл подій. Кількість одночасних викликів обмежена семафором,
+	а бекенд (ключ і модель) вибирається пулом з автоматичним перемиканням.
+	"""
+	return await _call(lambda backend: backend.generate(history, content))
+
+async def generate_content(prompt: Any):
+	"""Одноразовий запит до моделі без історії (наприклад, для підсумків)."""
+	return await _call(lambda backend: backend.generate([], prompt))
+
+# --- Потокова відповідь ---
+class GeminiStream:
+	"""
+	Потокова відповідь Gemini: `async for text in stream` повертає шматки тексту
+	в міру генерації. Слот семафора утримується до кінця потоку, а весь потік
+	обмежений GEMINI_REQUEST_TIMEOUT. Перемикання на інший бекенд можливе лише
+	до першого шматка. Після завершення `response` містить зібрану відповідь.
+	"""
+
+	def __init__(self, history: List[Dict[str, Any]], content: Any):
+		self._history = history
+		self._content = content
+		self.response: Optional[Any] = None
+
+	async def _open(self, backend: GeminiBackend):
+		"""Відкриває потік і чекає перший шматок (щоб збій бекенда стався ще в межах пулу)."""
+		response = await backend.generate(self._history, self._content, stream=True)
+		chunks = response.__aiter__()
+		try:
+			first = await chunks.__anext__()
+		except StopAsyncIteration:
+			first = None
+		return response, chunks, first
+
+	async def __aiter__(self) -> AsyncIterator[str]:
+		async with _gemini_slot():
+			loop = asyncio.get_running_loop()
+			deadline = loop.time() + GEMINI_REQUEST_TIMEOUT
+			self.response, chunks, chunk = await gemini_pool.run(self._open)
+			try:
+				while chunk is not None:
+					try:
+						text = chunk.text
+					except ValueError:
+						# Шматок без тексту (наприклад, лише причина блокування)
+						text = ""
+					if text:
+						yield text
+					try:
+						chunk = await asyncio.wait_for(chunks.__anext__(), timeout=max(0.0, deadline - loop.time()))
+					except StopAsyncIteration:
+						chunk = None
+			except asyncio.TimeoutError:
+				raise GeminiTimeoutError(f"Gemini не завершив потік за {GEMINI_REQUEST_TIMEOUT} сек.") from None
+
+def stream_chat_message(history: List[Dict[str, Any]], content: Any) -> GeminiStream:
+	"""Як send_chat_message, але повертає відповідь частинами в міру генерації."""
+	return GeminiStream(history, content)
@@ -0,0 +1,88 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import hashlib
+import logging
+import time
+from typing import Optional
+
+import aiosqlite
+
+import config
+from chat_history import db_pool
+
+logger = logging.getLogger("yuki.image_cache")
+
+# --- Максимальна кількість описів у кеші (найдавніше використані видаляються першими) ---
+IMAGE_CACHE_MAX_ENTRIES = getattr(config, "IMAGE_CACHE_MAX_ENTRIES", 5000)
+
+# --- SQL-запити ---
+SQL_CREATE_IMAGE_CACHE = '''
+	CREATE TABLE IF NOT EXISTS image_descriptions (
+		cache_key TEXT PRIMARY KEY,
+		description TEXT NOT NULL,
+		created_at REAL NOT NULL,
+		last_used REAL NOT NULL
+	)
+'''
+SQL_CREATE_IMAGE_CACHE_LRU_INDEX = "CREATE INDEX IF NOT EXISTS idx_image_descriptions_last_used ON image_descriptions (last_used)"
+SQL_SELECT_DESCRIPTION = "SELECT description FROM image_descriptions WHERE cache_key = ?"
+SQL_TOUCH_DESCRIPTION = "UPDATE image_descriptions SET last_used = ? WHERE cache_key = ?"
+SQL_UPSERT_DESCRIPTION = '''
+	INSERT INTO image_descriptions (cache_key, description, created_at, last_used) VALUES (?, ?, ?, ?)
+	ON CONFLICT(cache_key) DO UPDATE SET description = excluded.description, last_used = excluded.last_used
+'''
+SQL_EVICT_LRU = '''
+	DELETE FROM image_descriptions WHERE cache_key IN (
+		SELECT cache_key FROM image_descriptions ORDER BY last_used DESC LIMIT -1 OFFSET ?
+	)
+'''
+
+# --- Ключ кешу: файл Telegram + відбиток промпта і ролі ---
+def image_cache_key(file_unique_id: str, *fingerprint_parts: str) -> str:
+	"""
+	file_unique_id однаковий для того самого файлу в усіх чатах, тож переслані мем-картинки
+	отримують один ключ. Відбиток промпта інвалідовує кеш, якщо змінився спосіб опису.
+	"""
+	fingerprint = hashlib.sha1("\x1f".join(fingerprint_parts).encode("utf-8")).hexdigest()[:16]
+	return f"{file_unique_id}:{fingerprint}"
+
+# --- Ініціалізація таблиці ---
+async def init_image_cache():
+	"""Створює таблицю кешу описів зображень (пул має бути вже відкритий)."""
+	try:
+		async with db_pool.writer() as db:
+			await db.execute(SQL_CREATE_IMAGE_CACHE)
+			await db.execute(SQL_CREATE_IMAGE_CACHE_LRU_INDEX)
+	except aiosqlite.Error as e:
+		logger.error("Помилка ініціалізації кешу зображень: %s", e)
+
+# --- Читання опису з кешу ---
+async def get_cached_description(cache_key: str) -> Optional[str]:
+	"""Повертає збережений опис і позначає його як нещодавно використаний."""
+	try:
+		async with db_pool.reader() as db:
+			cursor = await db.execute(SQL_SELECT_DESCRIPTION, (cache_key,))
+			row = await cursor.fetchone()
+			await cursor.close()
+		if not row:
+			return None
+		async with db_pool.writer() as db:
+			await db.execute(SQL_TOUCH_DESCRIPTION, (time.time(), cache_key))
+		logger.debug("Опис зображення %s взято з кешу.", cache_key)
+		return row[0]
+	except aiosqlite.Error as e:
+		logger.warning("Помилка читання кешу зображень (%s): %s", cache_key, e)
+		return None
+
+# --- Збереження опису з витісненням найдавніших ---
+async def store_description(cache_key: str, description: str):
+	"""Зберігає опис і обрізає кеш до IMAGE_CACHE_MAX_ENTRIES записів (LRU)."""
+	now = time.time()
+	try:
+		async with db_pool.writer() as db:
+			await db.execute(SQL_UPSERT_DESCRIPTION, (cache_key, description, now, now))
+			await db.execute(SQL_EVICT_LRU, (IMAGE_CACHE_MAX_ENTRIES,))
+	except aiosqlite.Error as e:
+		logger.warning("Помилка запису в кеш зображень (%s): %s", cache_key, e)
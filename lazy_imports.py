@@ -0,0 +1,71 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import asyncio
+import importlib
+import logging
+import threading
+import time
+from types import ModuleType
+from typing import List, Optional
+
+logger = logging.getLogger("yuki.lazy_imports")
+
+# --- Відкладений імпорт важких залежностей ---
+class LazyModule:
+	"""
+	Замінник модуля, що імпортує його при першому зверненні до атрибута.
+	`yt_dlp = lazy_import("yt_dlp")` на рівні модуля нічого не завантажує, а `yt_dlp.YoutubeDL`
+	в обробнику — завантажує (один раз). Анотації типів з такими модулями пишемо в лапках.
+	"""
+
+	def __init__(self, name: str):
+		self.__name = name
+		self.__module: Optional[ModuleType] = None
+		self.__lock = threading.Lock()
+
+	def load(self) -> ModuleType:
+		if self.__module is None:
+			with self.__lock:
+				if self.__module is None:
+					started = time.perf_counter()
+					self.__module = importlib.import_module(self.__name)
+					logger.debug("Модуль %s імпортовано за %.0f мс.", self.__name, (time.perf_counter() - started) * 1000)
+		return self.__module
+
+	@property
+	def loaded(self) -> bool:
+		return self.__module is not None
+
+	def __getattr__(self, attr: str):
+		return getattr(self.load(), attr)
+
+	def __repr__(self) -> str:
+		state = "завантажено" if self.loaded else "не завантажено"
+		return f"<LazyModule {self.__name} ({state})>"
+
+_lazy_modules: List[LazyModule] = []
+
+def lazy_import(name: str) -> LazyModule:
+	"""Реєструє модуль для відкладеного імпорту та фонового прогріву (warm_up)."""
+	module = LazyModule(name)
+	_lazy_modules.append(module)
+	return module
+
+# --- Фоновий прогрів після старту ---
+async def warm_up():
+	"""
+	Імпортує всі зареєстровані модулі в потоці, щоб перший /get_yuki чи /qdl не чекав на них.
+	Запускається вже після старту прийому апдейтів — /start і /ping обробляються одразу.
+	"""
+	loop = asyncio.get_running_loop()
+	started = time.perf_counter()
+	for module in _lazy_modules:
+		if module.loaded:
+			continue
+		try:
+			await loop.run_in_executor(None, module.load)
+		except Exception as e:
+			logger.warning("Не вдалося попередньо імпортувати %r: %s", module, e)
+	logger.info("Важкі залежності прогріто за %.2f сек.", time.perf_counter() - started)
@@ -0,0 +1,191 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import atexit
+import contextlib
+import contextvars
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+import config
+
+# --- Налаштування логування ---
+LOG_LEVEL = getattr(config, "LOG_LEVEL", "INFO")
+LOG_FORMAT = getattr(config, "LOG_FORMAT", "text")  # "text" або "json"
+LOG_FILE = getattr(config, "LOG_FILE", None)
+# Рівні для окремих модулів (додаються до типових): {"yuki.chat_history": "DEBUG"}
+LOG_LEVELS = {"yt_dlp": "CRITICAL", **getattr(config, "LOG_LEVELS", {})}
+# Частка записів нижче WARNING, що потрапляє в лог, для модулів з великим потоком
+LOG_SAMPLING = {"aiogram.event": 0.1, **getattr(config, "LOG_SAMPLING", {})}
+
+CONTEXT_FIELDS = ("uid", "cid", "handler", "latency")
+
+_log_context: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("log_context", default={})
+_listener: Optional[logging.handlers.QueueListener] = None
+
+# --- Контекст запиту (uid, cid, handler) для всіх записів усередині ---
+@contextlib.contextmanager
+def log_context(**fields: Any) -> Iterator[None]:
+	"""Додає поля до всіх записів логу в межах блоку (і в задачах, створених у ньому)."""
+	token = _log_context.set({**_log_context.get(), **fields})
+	try:
+		yield
+	finally:
+		_log_context.reset(token)
+
+def bind_log_context(**fields: Any):
+	"""Додає поля до контексту поточної задачі (обробник кожного апдейта — окрема задача)."""
+	_log_context.set({**_log_context.get(), **fields})
+
+class LogContextMiddleware(BaseMiddleware):
+	"""Зовнішній middleware диспетчера: uid і cid апдейта потрапляють у всі записи його обробки."""
+
+	async def __call__(
+		self,
+		handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+		event: TelegramObject,
+		data: Dict[str, Any]
+	) -> Any:
+		fields = {}
+		if (user := data.get("event_from_user")) is not None:
+			fields["uid"] = user.id
+		if (chat := data.get("event_chat")) is not None:
+			fields["cid"] = chat.id
+		with log_context(**fields):
+			return await handler(event, data)
+
+class ContextFilter(logging.Filter):
+	def filter(self, record: logging.LogRecord) -> bool:
+		for key, value in _log_context.get().items():
+			if not hasattr(record, key):
+				setattr(record, key, value)
+		return True
+
+# --- Вибірка: з кожного місця виклику пропускається лише кожен N-й запис ---
+class SamplingFilter(logging.Filter):
+	def __init__(self, rates: Dict[str, float]):
+		super().__init__()
+		self.rates = rates
+		self._every: Dict[str, int] = {}
+		self._counters: Dict[Tuple[str, int], int] = {}
+
+	def _every_for(self, name: str) -> int:
+		every = self._every.get(name)
+		if every is None:
+			every = 1
+			prefix = name
+			while prefix:
+				if prefix in self.rates:
+					rate = self.rates[prefix]
+					every = max(1, round(1 / rate)) if rate > 0 else 0
+					break
+				prefix = prefix.rpartition(".")[0]
+			self._every[name] = every
+		return every
+
+	def filter(self, record: logging.LogRecord) -> bool:
+		if record.levelno >= logging.WARNING:
+			return True
+		every = self._every_for(record.name)
+		if every == 1:
+			return True
+		if every == 0:
+			return False
+		key = (record.pathname, record.lineno)
+		count = self._counters.get(key, 0)
+		self._counters[key] = count + 1
+		return count % every == 0
+
+# --- Черга: форматування та запис у файл/stderr — у фоновому потоці ---
+class _QueueHandler(logging.handlers.QueueHandler):
+	def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+		# Виконується в потоці виклику (циклі подій): текст повідомлення й traceback збираються
+		# одразу, поки аргументи не змінились. На відміну від стандартного prepare, зберігає поля
+		# запису для JSON-форматера
+		record = logging.makeLogRecord(record.__dict__)
+		record.msg = record.getMessage()
+		record.args = None
+		if record.exc_info:
+			record.exc_text = logging.Formatter().formatException(record.exc_info)
+			record.exc_info = None
+		return record
+
+# --- Форматери ---
+class TextFormatter(logging.Formatter):
+	def __init__(self):
+		super().__init__("%(asctime)s - %(levelname)s - %(name)s - %(message)s")
+
+	def format(self, record: logging.LogRecord) -> str:
+		text = super().format(record)
+		fields = " ".join(f"{key}={getattr(record, key)}" for key in CONTEXT_FIELDS if hasattr(record, key))
+		if not fields:
+			return text
+		head, sep, tail = text.partition("\n")
+		return f"{head} [{fields}]{sep}{tail}"
+
+class JsonFormatter(logging.Formatter):
+	def format(self, record: logging.LogRecord) -> str:
+		entry = {
+			"ts": datetime.datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+			"level": record.levelname,
+			"logger": record.name,
+			"msg": record.getMessage(),
+		}
+		for key in CONTEXT_FIELDS:
+			if hasattr(record, key):
+				entry[key] = getattr(record, key)
+		if record.exc_text:
+			entry["exc"] = record.exc_text
+		return json.dumps(entry, ensure_ascii=False, default=str)
+
+# --- Єдина точка налаштування ---
+def setup_logging():
+	"""
+	Налаштовує логування для всього бота: записи з циклу подій лише кладуться в чергу,
+	а форматування та запис у термінал/файл виконує окремий потік (QueueListener).
+	Повторний виклик нічого не робить.
+	"""
+	global _listener
+	if _listener is not None:
+		return
+
+	formatter = JsonFormatter() if LOG_FORMAT == "json" else TextFormatter()
+	handlers = [logging.StreamHandler(sys.stderr)]
+	if LOG_FILE:
+		handlers.append(logging.handlers.WatchedFileHandler(LOG_FILE, encoding="utf-8"))
+	for handler in handlers:
+		handler.setFormatter(formatter)
+
+	log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+	queue_handler = _QueueHandler(log_queue)
+	queue_handler.addFilter(SamplingFilter(LOG_SAMPLING))
+	queue_handler.addFilter(ContextFilter())
+
+	root = logging.getLogger()
+	for handler in root.handlers[:]:
+		root.removeHandler(handler)
+	root.addHandler(queue_handler)
+	root.setLevel(LOG_LEVEL)
+	for name, level in LOG_LEVELS.items():
+		logging.getLogger(name).setLevel(level)
+	logging.captureWarnings(True)
+
+	_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+	_listener.start()
+	atexit.register(stop_logging)
+
+def stop_logging():
+	"""Дописує всі записи з черги та зупиняє фоновий потік."""
+	global _listener
+	if _listener is not None:
+		_listener.stop()
+		_listener = None
@@ -7,8 +7,6 @@ import re
 import html
 import logging
 import asyncio
-import requests
-import markdown2
 import time
 import sys
 
@@ -23,10 +21,21 @@ from aiogram.types import (
 )
 from aiogram.filters import Command
 
+from lazy_imports import lazy_import
+from metrics import track_dependency
+from state_store import StateNamespace
+
+requests = lazy_import("requests")
+markdown2 = lazy_import("markdown2")
+
 # --- Конфігурація ---
 MODULES_PER_PAGE = 5
+MODULES_CACHE_TTL = 600  # сек між повторними завантаженнями modules.json
 JSON_URL = "https://raw.githubusercontent.com/Magisk-Modules-Alt-Repo/json/main/modules.json"
-magic_cache = {}
+GITHUB_API_URL = "https://api.github.com"
+magic_state = StateNamespace("magic_pages", ttl=3600)  # chat_id -> {"page", "last_keyboard_msg_id"}
+auto_clear_tasks: dict[int, asyncio.Task] = {}         # таймери автовидалення клавіатури (задачі не зберігаються в базі)
+_modules_cache = {"modules": None, "fetched_at": 0.0}  # спільний для всіх чатів список модулів
 
 # --- Ініціалізація magic router ---
 magic_router = Router()
@@ -35,11 +44,12 @@ logger = logging.getLogger(__name__)
 
 # --- Функція завантаження останнього релізу з GitHub ---
 def download_latest_release(repo: str, asset_keyword: str):
-	url = f"https://api.github.com/repos/{repo}/releases/latest"
+	url = f"{GITHUB_API_URL}/repos/{repo}/releases/latest"
 	headers = {"User-Agent": "Mozilla/5.0"}
 
 	try:
-		resp = requests.get(url, headers=headers, timeout=10)
+		with track_dependency("github", "latest_release"):
+			resp = requests.get(url, headers=headers, timeout=10)
 		resp.raise_for_status()
 		data = resp.json()
 
@@ -55,7 +65,7 @@ def download_latest_release(repo: str, asset_keyword: str):
 				download_url = asset['browser_download_url']
 				filename = asset['name']
 
-				with requests.get(download_url, stream=True, timeout=30) as r:
+				with track_dependency("github", "release_asset"), requests.get(download_url, stream=True, timeout=30) as r:
 					r.raise_for_status()
 					with open(filename, 'wb') as f:
 						for chunk in r.iter_content(8192):
@@ -88,10 +98,7 @@ def download_latest_release(repo: str, asset_keyword: str):
 # --- Команда /magisk — завантаження останнього Magisk ---
 @magic_router.message(Command("magisk"))
 async def cmd_magisk(message: Message):
-	cache = magic_cache.get(message.chat.id)
-	if cache and "auto_clear_task" in cache and cache["auto_clear_task"]:
-		cache["auto_clear_task"].cancel()
-		cache["auto_clear_task"] = None
+	cancel_auto_clear(message.chat.id)
 
 	try:
 		await message.delete()
@@ -135,10 +142,7 @@ async def cmd_magisk(message: Message):
 # --- Команда /ksu_next — завантаження останнього KernelSU-Next ---
 @magic_router.message(Command("ksu_next"))
 async def cmd_ksu_next(message: Message):
-	cache = magic_cache.get(message.chat.id)
-	if cache and "auto_clear_task" in cache and cache["auto_clear_task"]:
-		cache["auto_clear_task"].cancel()
-		cache["auto_clear_task"] = None
+	cancel_auto_clear(message.chat.id)
 
 	try:
 		await message.delete()
@@ -181,10 +185,7 @@ async def cmd_ksu_next(message: Message):
 # --- Команда /modules — показ списку модулів ---
 @magic_router.message(Command("modules"))
 async def cmd_modules(message: Message):
-	cache = magic_cache.get(message.chat.id)
-	if cache and "auto_clear_task" in cache and cache["auto_clear_task"]:
-		cache["auto_clear_task"].cancel()
-		cache["auto_clear_task"] = None
+	cancel_auto_clear(message.chat.id)
 
 	try:
 		await message.delete()
@@ -199,35 +200,58 @@ async def cmd_modules(message: Message):
 async def cb_show_all(callback: CallbackQuery):
 	await show_all_modules(callback.message)
 
+# --- Таймери автоочистки клавіатури ---
+def cancel_auto_clear(chat_id: int):
+	task = auto_clear_tasks.pop(chat_id, None)
+	if task:
+		task.cancel()
+
+def schedule_auto_clear(chat_id: int, msg_id: int, bot: Bot):
+	"""Скасовує попередній таймер чату і запускає новий для повідомлення msg_id."""
+	cancel_auto_clear(chat_id)
+	task = asyncio.create_task(auto_remove_keyboard_message_task(chat_id, msg_id, bot))
+	auto_clear_tasks[chat_id] = task
+
+	def forget(done: asyncio.Task):
+		if auto_clear_tasks.get(chat_id) is done:
+			del auto_clear_tasks[chat_id]
+	task.add_done_callback(forget)
+
 # --- Функція для автоочистки повідомлення З КЛАВІАТУРОЮ (тобто видалення його) ---
 async def auto_remove_keyboard_message_task(chat_id: int, msg_id: int, bot: Bot, delay: int = 15):
 	await asyncio.sleep(delay)
-	cache = magic_cache.get(chat_id)
+	state = await magic_state.get(chat_id)
 
-	if cache and cache.get("last_keyboard_msg_id") == msg_id:
+	if state and state.get("last_keyboard_msg_id") == msg_id:
 		try:
 			await bot.delete_message(chat_id=chat_id, message_id=msg_id)
 			logging.info(f"Автоматично видалено повідомлення з клавіатурою {msg_id} у чаті {chat_id}")
-			cache["last_keyboard_msg_id"] = None
-			cache["auto_clear_task"] = None
+			await magic_state.set(chat_id, {**state, "last_keyboard_msg_id": None})
 		except Exception as e:
 			logging.warning(f"Автовидалення повідомлення з клавіатурою {msg_id} не вдалося у чаті {chat_id}: {e}")
 
+# --- Список модулів (кешується на MODULES_CACHE_TTL для всіх чатів) ---
+def fetch_modules() -> list:
+	now = time.monotonic()
+	if _modules_cache["modules"] is None or now - _modules_cache["fetched_at"] > MODULES_CACHE_TTL:
+		with track_dependency("github", "modules_json"):
+			resp = requests.get(JSON_URL)
+		resp.raise_for_status()
+		modules = resp.json().get("modules", [])
+		modules.sort(key=lambda x: x.get('stars', 0), reverse=True)
+		_modules_cache.update(modules=modules, fetched_at=now)
+	return _modules_cache["modules"]
+
 # --- Допоміжна функція для показу всіх модулів ---
 async def show_all_modules(message: types.Message, page: int = 0):
 	current_keyboard_msg_id = None
 
 	try:
-		resp = requests.get(JSON_URL)
-		resp.raise_for_status()
-		data = resp.json()
-		modules = data.get("modules", [])
+		modules = fetch_modules()
 		if not modules:
 			await message.answer("Немає модулів для показу.")
 			return None
 
-		modules.sort(key=lambda x: x.get('stars', 0), reverse=True)
-
 		start = page * MODULES_PER_PAGE
 		end = start + MODULES_PER_PAGE
 		current_page_modules = modules[start:end]
@@ -248,60 +272,41 @@ async def show_all_modules(message: types.Message, page: int = 0):
 
 		page_text = f"Сторінка {page + 1} з {((len(modules) - 1) // MODULES_PER_PAGE) + 1}"
 
-		cache = magic_cache.get(message.chat.id)
-		if cache:
-			last_keyboard_msg_id_from_cache = cache.get("last_keyboard_msg_id")
+		state = await magic_state.get(message.chat.id)
+		last_keyboard_msg_id_from_state = state.get("last_keyboard_msg_id") if state else None
 
-			if last_keyboard_msg_id_from_cache:
+		if last_keyboard_msg_id_from_state:
+			try:
+				sent_message = await message.bot.edit_message_text(
+					chat_id=message.chat.id,
+					message_id=last_keyboard_msg_id_from_state,
+					text=page_text,
+					reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
+				)
+				current_keyboard_msg_id = sent_message.message_id
+				await magic_state.set(message.chat.id, {"page": page, "last_keyboard_msg_id": current_keyboard_msg_id})
+
+				# Скасувати попередній таймер і запустити новий для відредагованого повідомлення
+				schedule_auto_clear(message.chat.id, current_keyboard_msg_id, message.bot)
+				return current_keyboard_msg_id
+
+			except Exception as e:
+				logging.warning(f"Не вдалося відредагувати повідомлення (ID: {last_keyboard_msg_id_from_state}): {e}")
+				# Якщо повідомлення не можна відредагувати, видалити його і надіслати нове.
 				try:
-					sent_message = await message.bot.edit_message_text(
-						chat_id=message.chat.id,
-						message_id=last_keyboard_msg_id_from_cache,
-						text=page_text,
-						reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
-					)
-					current_keyboard_msg_id = sent_message.message_id
-					magic_cache[message.chat.id]["page"] = page
-					magic_cache[message.chat.id]["modules"] = modules
-					magic_cache[message.chat.id]["last_keyboard_msg_id"] = current_keyboard_msg_id
-
-					# Скасувати попередній таймер і запустити новий для відредагованого повідомлення
-					if "auto_clear_task" in cache and cache["auto_clear_task"]:
-						cache["auto_clear_task"].cancel()
-						logging.debug(f"Скасовано попередній таймер для чату {message.chat.id}")
-					cache["auto_clear_task"] = asyncio.create_task(
-						auto_remove_keyboard_message_task(message.chat.id, current_keyboard_msg_id, message.bot)
-					)
-					return current_keyboard_msg_id
-
-				except Exception as e:
-					logging.warning(f"Не вдалося відредагувати повідомлення (ID: {last_keyboard_msg_id_from_cache}): {e}")
-					# Якщо повідомлення не можна відредагувати, видалити його з кешу і надіслати нове.
-					try:
-						await message.bot.delete_message(chat_id=message.chat.id, message_id=last_keyboard_msg_id_from_cache)
-					except Exception:
-						pass
-					magic_cache[message.chat.id]["last_keyboard_msg_id"] = None
+					await message.bot.delete_message(chat_id=message.chat.id, message_id=last_keyboard_msg_id_from_state)
+				except Exception:
+					pass
 
 		sent_message = await message.answer(
 			page_text,
 			reply_markup=InlineKeyboardMarkup(inline_keyboard=keyboard)
 		)
 		current_keyboard_msg_id = sent_message.message_id
-
-		magic_cache[message.chat.id] = {
-			"modules": modules,
-			"page": page,
-			"last_keyboard_msg_id": current_keyboard_msg_id
-		}
+		await magic_state.set(message.chat.id, {"page": page, "last_keyboard_msg_id": current_keyboard_msg_id})
 
 		# Скасувати попередній таймер і запускаємо новий для щойно відправленого повідомлення
-		if cache and "auto_clear_task" in cache and cache["auto_clear_task"]:
-			cache["auto_clear_task"].cancel()
-			logging.debug(f"Скасовано попередній таймер для чату {message.chat.id}")
-		magic_cache[message.chat.id]["auto_clear_task"] = asyncio.create_task(
-			auto_remove_keyboard_message_task(message.chat.id, current_keyboard_msg_id, message.bot)
-		)
+		schedule_auto_clear(message.chat.id, current_keyboard_msg_id, message.bot)
 
 		return current_keyboard_msg_id
 
@@ -313,20 +318,14 @@ async def show_all_modules(message: types.Message, page: int = 0):
 # --- Команда /modules — показ списку модулів ---
 @magic_router.message(Command("modules"))
 async def cmd_modules(message: Message):
-	cache = magic_cache.get(message.chat.id)
-	if cache and "auto_clear_task" in cache and cache["auto_clear_task"]:
-		cache["auto_clear_task"].cancel()
-		cache["auto_clear_task"] = None
+	cancel_auto_clear(message.chat.id)
 
 	await show_all_modules(message)
 
 # --- Callback: показати всі модулі ---
 @magic_router.callback_query(F.data == "show_all")
 async def cb_show_all(callback: CallbackQuery):
-	cache = magic_cache.get(callback.message.chat.id)
-	if cache and "auto_clear_task" in cache and cache["auto_clear_task"]:
-		cache["auto_clear_task"].cancel()
-		cache["auto_clear_task"] = None
+	cancel_auto_clear(callback.message.chat.id)
 
 	await callback.answer()
 	await show_all_modules(callback.message)
@@ -334,21 +333,18 @@ async def cb_show_all(callback: CallbackQuery):
 # --- Callback: пагінація — наступна або попередня сторінка ---
 @magic_router.callback_query(F.data.in_({"next_page", "prev_page"}))
 async def cb_pagination(callback: CallbackQuery):
-	cache = magic_cache.get(callback.message.chat.id)
-	if not cache:
+	state = await magic_state.get(callback.message.chat.id)
+	if not state:
 		await callback.message.answer("Сесія недоступна або застаріла.")
 		return
 
-	if "auto_clear_task" in cache and cache["auto_clear_task"]:
-		cache["auto_clear_task"].cancel()
-		cache["auto_clear_task"] = None
+	cancel_auto_clear(callback.message.chat.id)
 
-	page = cache.get("page", 0)
+	page = state.get("page", 0)
 	if callback.data == "next_page":
 		page += 1
 	elif callback.data == "prev_page" and page > 0:
 		page -= 1
-	cache["page"] = page
 
 	await show_all_modules(callback.message, page=page)
 	await callback.answer()
@@ -356,19 +352,20 @@ async def cb_pagination(callback: CallbackQuery):
 # --- Callback: показ детальної інформації про модуль ---
 @magic_router.callback_query(lambda c: c.data.startswith("mod_"))
 async def cb_module_detail(callback: CallbackQuery):
-	cache = magic_cache.get(callback.message.chat.id)
-	if not cache:
+	state = await magic_state.get(callback.message.chat.id)
+	if not state:
 		await callback.message.answer("Сесія недоступна або застаріла.")
 		await callback.answer()
 		return
 
 	# Скасувати таймер для повідомлення зі сторінками, оскільки ми збираємося його видалити
-	if "auto_clear_task" in cache and cache["auto_clear_task"]:
-		cache["auto_clear_task"].cancel()
-		cache["auto_clear_task"] = None
-		logging.debug(f"Скасовано таймер для повідомлення зі сторінками у чаті {callback.message.chat.id}")
+	cancel_auto_clear(callback.message.chat.id)
 
-	modules = cache.get("modules", [])
+	try:
+		modules = fetch_modules()
+	except Exception as e:
+		logging.warning(f"Не вдалося отримати список модулів: {e}")
+		modules = []
 	mod_id = callback.data.replace("mod_", "")
 	mod = next((m for m in modules if m['id'] == mod_id), None)
 	if not mod:
@@ -379,7 +376,8 @@ async def cb_module_detail(callback: CallbackQuery):
 	readme_summary = ""
 	if "notes_url" in mod:
 		try:
-			readme_resp = requests.get(mod["notes_url"])
+			with track_dependency("github", "module_readme"):
+				readme_resp = requests.get(mod["notes_url"])
 			readme_resp.raise_for_status()
 			readme_text = readme_resp.text.strip()
 			readme_text = re.sub(r'!.*?.*?', '', readme_text)
@@ -423,18 +421,19 @@ async def cb_module_detail(callback: CallbackQuery):
 		logging.warning(f"Не вдалося очистити inline-клавіатуру: {e}")
 
 	# Видалення попереднього повідомлення "Сторінка N з M" разом із клавіатурою
-	last_keyboard_msg_id = cache.get("last_keyboard_msg_id")
+	last_keyboard_msg_id = state.get("last_keyboard_msg_id")
 	if last_keyboard_msg_id:
 		try:
 			await callback.bot.delete_message(chat_id=callback.message.chat.id, message_id=last_keyboard_msg_id)
 			logging.info(f"Видалено попереднє повідомлення 'Сторінка N з M': {last_keyboard_msg_id}")
 		except Exception as e:
 			logging.warning(f"Не вдалося видалити попереднє повідомлення 'Сторінка N з M': {e}")
-	cache["last_keyboard_msg_id"] = None # Скинути, оскільки повідомлення вже видалено
+	await magic_state.set(callback.message.chat.id, {**state, "last_keyboard_msg_id": None}) # Скинути, оскільки повідомлення вже видалено
 
 	# Завантаження ZIP
 	try:
-		zip_resp = requests.get(mod['zip_url'], stream=True)
+		with track_dependency("github", "module_zip"):
+			zip_resp = requests.get(mod['zip_url'], stream=True)
 		zip_resp.raise_for_status()
 		MAX_SIZE = 50 * 1024 * 1024
 		zip_name = f"{mod['id']}.zip"
@@ -469,10 +468,17 @@ async def cb_module_detail(callback: CallbackQuery):
 			FSInputFile(zip_name),
 			caption=f"Модуль: {mod['id']}"
 		)
-		os.remove(zip_name)
 
 	except Exception as e:
 		logging.error(f"Помилка при завантаженні модуля {mod['id']}: {e}")
 		await callback.message.answer(f"Не вдалося завантажити модуль {mod['id']}: {e}")
 
+	finally:
+		# Прибрати ZIP і тоді, коли надсилання перервано (наприклад, зупинкою бота)
+		if os.path.exists(f"{mod['id']}.zip"):
+			try:
+				os.remove(f"{mod['id']}.zip")
+			except OSError:
+				pass
+
 	await callback.answer()
@@ -14,25 +14,49 @@ from aiogram import Bot, Dispatcher, Router
 from aiogram.enums import ParseMode
 from aiogram.filters import Command
 from aiogram.types import Message
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.client.default import DefaultBotProperties
 from aiogram.exceptions import TelegramNetworkError, RestartingTelegram
-from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError, TelegramRetryAfter
 
 from magic import magic_router
 from waifu import waifu_router
-from ai_router import yuki_router, init_db, DB_NAME
+from ai_router import yuki_router, init_db, close_db, DB_NAME, yuki_message_queue
 from qdl import qdl_router
+from prompts import reload_prompts
+from send_scheduler import send_scheduler
+from log_setup import LogContextMiddleware, setup_logging, stop_logging
+from tracing import TracingMiddleware, setup_tracing, stop_tracing
+from webhook import run_webhook
+from sharding import WORKER_PROCESSES, Supervisor
+from state_store import StateStoreStorage
+from background import background_tasks, spawn
+from drain import InFlightMiddleware, drain
+from lazy_imports import warm_up
+from maintenance import start_maintenance
+from gemini_client import gemini_in_flight
+from metrics import (
+	BACKGROUND_TASKS,
+	QUEUE_DEPTH,
+	HandlerMetricsMiddleware,
+	TelegramMetricsMiddleware,
+	start_metrics_server,
+)
 
 # --- Імпортувати з config ---
 BOT_TOKEN = config.BOT_TOKEN
+BOT_MODE = getattr(config, "BOT_MODE", "polling")  # "polling" або "webhook"
 
 bot = Bot(
 	token=BOT_TOKEN,
 	default=DefaultBotProperties(parse_mode=ParseMode.HTML)
 )
+# Усі вихідні запити проходять через спільний планувальник з лімітами Telegram
+bot.session.middleware(send_scheduler)
+# Час самого запиту до Bot API (без очікування в планувальнику)
+bot.session.middleware(TelegramMetricsMiddleware())
+
 # --- Диспетчери та підключені роутери ---
-dp = Dispatcher(storage=MemoryStorage())
+dp = Dispatcher(storage=StateStoreStorage())
 main_router = Router()
 
 dp.include_router(main_router)
@@ -41,13 +65,39 @@ dp.include_router(qdl_router)
 dp.include_router(waifu_router)
 dp.include_router(yuki_router)
 
-# --- Логування ---
-logging.basicConfig(
-	level=logging.INFO,
-	format="%(asctime)s [%(levelname)s] %(message)s"
-)
+# --- Метрики обробників і черг ---
+for router_name, router in (
+	("main", main_router),
+	("magic", magic_router),
+	("qdl", qdl_router),
+	("waifu", waifu_router),
+	("yuki", yuki_router),
+):
+	router.message.middleware(HandlerMetricsMiddleware(router_name))
+	router.callback_query.middleware(HandlerMetricsMiddleware(router_name))
+
+QUEUE_DEPTH.set_function(lambda: len(yuki_message_queue), "yuki_messages")
+QUEUE_DEPTH.set_function(lambda: len(send_scheduler), "telegram_send")
+QUEUE_DEPTH.set_function(gemini_in_flight, "gemini_in_flight")
+BACKGROUND_TASKS.set_function(lambda: len(background_tasks))
+
+# --- Логування (єдина точка налаштування — log_setup) ---
+setup_logging()
+# Трасування апдейтів (TRACE_EXPORT): спани Telegram API, SQLite, Gemini, HTTP та yt-dlp
+# Першим — облік апдейтів, що обробляються, для коректної зупинки (drain)
+dp.update.outer_middleware(InFlightMiddleware())
+if setup_tracing():
+	dp.update.outer_middleware(TracingMiddleware())
+dp.update.outer_middleware(LogContextMiddleware())
 logger = logging.getLogger(__name__)
 
+# --- Важкі залежності (Gemini SDK, yt-dlp, Pillow) імпортуються у фоні, коли апдейти вже приймаються;
+# щоденне обслуговування бази планується на години найменшого навантаження ---
+@dp.startup()
+async def on_startup():
+	spawn(warm_up(), name="warm-up")
+	start_maintenance()
+
 # --- Підтримувані команди ---
 @main_router.message(Command("start"))
 async def cmd_start(message: Message):
@@ -99,9 +149,8 @@ async def ping_handler(message: Message):
 	try:
 		sent_msg = await message.answer("🏓 Перевіряю зв'язок…")
 	except TelegramRetryAfter as e:
-		retry_after = e.retry_after or 10
-		logger.warning(f"Flood control 🫣 — чекаю {retry_after} сек...")
-		await asyncio.sleep(retry_after)
+		# Планувальник уже поставив чат на паузу — повторна спроба дочекається її кінця
+		logger.warning(f"Flood control 🫣 — повтор через {e.retry_after} сек...")
 		sent_msg = await message.answer("🏓 Повторна спроба після flood control…")
 
 	end = time.perf_counter()
@@ -112,21 +161,29 @@ async def ping_handler(message: Message):
 		parse_mode="HTML"
 	)
 
-# --- Реалізувати захист від нестабільних мереж ---
-async def run_polling():
+# --- Ініціалізація бази даних перед прийомом апдейтів ---
+async def prepare_database() -> bool:
 	logger.info(f"Спроба ініціалізації бази даних: {DB_NAME}")
 	try:
 		await init_db()
 		logger.info("База даних ініціалізована/перевірена успішно.")
+		return True
 	except Exception as e:
 		logger.critical(f"КРИТИЧНА ПОМИЛКА: Не вдалося ініціалізувати базу даних. Бот не зможе працювати без неї. Деталі: {e}")
+		return False
 
+# --- Реалізувати захист від нестабільних мереж ---
+async def run_polling():
+	if not await prepare_database():
 		return
 
 	while True:
 		try:
 			logger.info("🚀 Запуск бота…")
-			await dp.start_polling(bot)
+			# getUpdates не працює, поки зареєстровано webhook (наприклад, після BOT_MODE = "webhook")
+			await bot.delete_webhook()
+			# Сигнали і закриття сесії — у shutdown(): сесія потрібна апдейтам, що ще обробляються
+			await dp.start_polling(bot, handle_signals=False, close_bot_session=False)
 			logger.info("✅ Polling завершено без помилок.")
 			break
 		except (aiohttp.ClientConnectorError, TelegramNetworkError, asyncio.TimeoutError) as net_err:
@@ -142,30 +199,99 @@ async def run_polling():
 			logger.exception(f"[Фатальна помилка] {e}")
 			await asyncio.sleep(5)
 
+# --- Режим webhook: апдейти приходять на власний HTTP-сервер ---
+async def run_webhook_server():
+	if not await prepare_database():
+		return
+
+	logger.info("🚀 Запуск бота у режимі webhook…")
+	try:
+		await run_webhook(dp, bot)
+	except asyncio.CancelledError:
+		logger.info("🛑 Отримано сигнал скасування. Зупиняємо webhook-сервер.")
+	except Exception as e:
+		logger.critical(f"Не вдалося запустити webhook: {e}")
+
+# --- Кілька процесів: супервізор отримує апдейти, воркери їх обробляють ---
+async def run_supervisor():
+	logger.info(f"🚀 Запуск супервізора з {WORKER_PROCESSES} воркерами…")
+	try:
+		await Supervisor(WORKER_PROCESSES).run(bot, dp)
+	except asyncio.CancelledError:
+		logger.info("🛑 Отримано сигнал скасування. Зупиняємо воркерів.")
+	except Exception as e:
+		logger.critical(f"Супервізор завершився з помилкою: {e}")
+
+def select_runner():
+	if BOT_MODE == "webhook":
+		if WORKER_PROCESSES > 1:
+			logger.warning("WORKER_PROCESSES ігнорується в режимі webhook — апдейти обробляє один процес.")
+		return run_webhook_server()
+	if WORKER_PROCESSES > 1:
+		return run_supervisor()
+	return run_polling()
+
 # --- Реалізувати правильне завершення роботи ---
-async def shutdown(loop, polling_task):
-	logger.info("🛑 Завершення: зупинити polling…")
+_shutting_down = False
+
+async def shutdown(loop, polling_task, metrics_runner=None):
+	global _shutting_down
+	if _shutting_down:
+		logger.info("🛑 Зупинка вже триває…")
+		return
+	_shutting_down = True
+
+	logger.info("🛑 Завершення: припинити прийом апдейтів…")
 	polling_task.cancel()
 	with contextlib.suppress(asyncio.CancelledError):
 		await polling_task
+	# Дочекатися обробників і фонових задач (до SHUTDOWN_DRAIN_TIMEOUT), решту скасувати
+	cut_off = await drain()
+	if cut_off:
+		logger.warning(f"⚠️ Перервано незавершених задач: {len(cut_off)}")
+	if metrics_runner is not None:
+		await metrics_runner.cleanup()
+	await send_scheduler.close()
 	await bot.session.close()
 	logger.info("✅ Сесію бота закрито.")
-	loop.stop()
+	await close_db()
+	logger.info("✅ З'єднання з базою даних закрито.")
 	logger.info("✅ Завершено коректно.")
+	stop_tracing()
+	stop_logging()
 
 # --- Запуск і обробка сигналів завершення ---
 async def main():
 	loop = asyncio.get_running_loop()
 
-	polling_task = asyncio.create_task(run_polling())
+	# Локальний ендпоінт /metrics (лише якщо задано METRICS_PORT)
+	try:
+		metrics_runner = await start_metrics_server()
+	except OSError as e:
+		logger.error(f"Не вдалося запустити сервер метрик: {e}")
+		metrics_runner = None
+
+	polling_task = asyncio.create_task(select_runner())
+	shutdown_tasks = []
+
+	def request_shutdown():
+		shutdown_tasks.append(asyncio.create_task(shutdown(loop, polling_task, metrics_runner)))
 
 	for sig in (signal.SIGINT, signal.SIGTERM):
-		loop.add_signal_handler(sig, lambda s=sig: asyncio.create_task(shutdown(loop, polling_task)))
+		loop.add_signal_handler(sig, request_shutdown)
+
+	# SIGHUP — перечитати системні промпти без перезапуску
+	if hasattr(signal, "SIGHUP"):
+		loop.add_signal_handler(signal.SIGHUP, lambda: logger.info(f"🔄 Промпти перезавантажено: {reload_prompts()}"))
 
 	try:
 		await polling_task
 	except asyncio.CancelledError:
 		pass
+	# Скасування polling — лише перший крок зупинки: дочекатися drain і закриття ресурсів,
+	# інакше asyncio.run скасує shutdown разом з рештою задач
+	if shutdown_tasks:
+		await asyncio.gather(*shutdown_tasks)
 
 if __name__ == "__main__":
 	try:
@@ -0,0 +1,304 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import asyncio
+import contextlib
+import datetime
+import logging
+import os
+import time
+from typing import List, NamedTuple, Optional, Tuple
+
+import aiosqlite
+
+import config
+from chat_history import (
+	DB_NAME,
+	HISTORY_COMPRESSION,
+	ZSTD_AVAILABLE,
+	compress_stored_messages,
+	db_pool,
+	get_idle_users,
+	retire_user_history,
+)
+from drain import in_flight_updates
+
+logger = logging.getLogger("yuki.maintenance")
+
+# --- Налаштування обслуговування бази ---
+MAINTENANCE_HOUR = getattr(config, "MAINTENANCE_HOUR", 4)                         # година (місцевий час) щоденного обслуговування; None — вимкнено
+HISTORY_RETENTION_DAYS = getattr(config, "HISTORY_RETENTION_DAYS", 90)            # через скільки днів тиші прибирати розмову; 0 — ніколи
+HISTORY_RETENTION_ACTION = getattr(config, "HISTORY_RETENTION_ACTION", "archive")  # "archive" (стиснутий запис у chat_archive) або "delete"
+MAINTENANCE_QUIET_WAIT = 1800     # скільки чекати (сек) моменту без апдейтів в обробці, перш ніж почати все одно
+MAINTENANCE_BATCH = 200           # користувачів / рядків за одну транзакцію: writer вивільняється між пачками
+VACUUM_STEP_PAGES = 2000          # сторінок, що повертаються ОС за один крок incremental_vacuum
+ANALYSIS_LIMIT = 1000             # рядків індексу, які ANALYZE переглядає (наближена статистика замість повного проходу)
+
+# --- SQL-запити ---
+SQL_AUTO_VACUUM = "PRAGMA auto_vacuum"
+SQL_SET_AUTO_VACUUM_INCREMENTAL = "PRAGMA auto_vacuum = INCREMENTAL"
+SQL_VACUUM = "VACUUM"
+SQL_INCREMENTAL_VACUUM = f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES})"
+SQL_FREELIST_COUNT = "PRAGMA freelist_count"
+SQL_PAGE_COUNT = "PRAGMA page_count"
+SQL_PAGE_SIZE = "PRAGMA page_size"
+SQL_ANALYSIS_LIMIT = f"PRAGMA analysis_limit = {ANALYSIS_LIMIT}"
+SQL_ANALYZE = "ANALYZE"
+SQL_CHECKPOINT = "PRAGMA wal_checkpoint(TRUNCATE)"
+SQL_TABLE_SIZES = '''
+	SELECT name, SUM(pgsize) FROM dbstat
+	GROUP BY name ORDER BY SUM(pgsize) DESC LIMIT ?
+'''
+SQL_MESSAGE_STATS = '''
+	SELECT COUNT(*), COALESCE(SUM(typeof(parts) = 'blob'), 0), COALESCE(SUM(length(CAST(parts AS BLOB))), 0)
+	FROM chat_messages
+'''
+SQL_COUNT_USERS = "SELECT COUNT(*) FROM chat_users"
+SQL_COUNT_ARCHIVE = "SELECT COUNT(*), COALESCE(SUM(length(payload)), 0) FROM chat_archive"
+
+AUTO_VACUUM_MODES = {0: "NONE", 1: "FULL", 2: "INCREMENTAL"}
+
+# --- Результат прогону та статистика ---
+class MaintenanceReport(NamedTuple):
+	started_at: float
+	duration: float
+	retired_users: int
+	compressed_messages: int
+	compressed_bytes_saved: int
+	freed_pages: int
+	page_size: int
+
+	def describe(self) -> str:
+		when = datetime.datetime.fromtimestamp(self.started_at).strftime("%Y-%m-%d %H:%M")
+		action = "заархівовано" if HISTORY_RETENTION_ACTION == "archive" else "видалено"
+		return (
+			f"{when} ({self.duration:.1f} сек): розмов {action} {self.retired_users}, "
+			f"стиснуто повідомлень {self.compressed_messages} (−{_format_bytes(self.compressed_bytes_saved)}), "
+			f"повернуто ОС {_format_bytes(self.freed_pages * self.page_size)}"
+		)
+
+class DbStats(NamedTuple):
+	file_bytes: int
+	wal_bytes: int
+	page_size: int
+	page_count: int
+	freelist_count: int
+	auto_vacuum: str
+	table_bytes: List[Tuple[str, int]]  # порожній, якщо SQLite зібрано без dbstat
+	users: int
+	messages: int
+	compressed_messages: int
+	message_bytes: int
+	archived: int
+	archive_bytes: int
+
+def _format_bytes(size: float) -> str:
+	for unit in ("Б", "КБ", "МБ"):
+		if abs(size) < 1024:
+			return f"{size:.0f} {unit}" if unit == "Б" else f"{size:.1f} {unit}"
+		size /= 1024
+	return f"{size:.1f} ГБ"
+
+last_report: Optional[MaintenanceReport] = None
+_run_lock = asyncio.Lock()
+# _run_lock діє лише в межах процесу, тому з кількома воркерами прогони (і /yuki_db run) виконує тільки воркер 0
+_disabled = False
+
+async def _pragma_value(db: aiosqlite.Connection, sql: str) -> int:
+	cursor = await db.execute(sql)
+	row = await cursor.fetchone()
+	await cursor.close()
+	return row[0] if row else 0
+
+# --- Кроки обслуговування ---
+async def _retire_idle_histories() -> int:
+	if not HISTORY_RETENTION_DAYS:
+		return 0
+	idle_before = time.time() - HISTORY_RETENTION_DAYS * 86400
+	archive = HISTORY_RETENTION_ACTION == "archive"
+	retired = 0
+	while True:
+		user_ids = await get_idle_users(idle_before, MAINTENANCE_BATCH)
+		if not user_ids:
+			break
+		for user_id in user_ids:
+			if await retire_user_history(user_id, idle_before, archive):
+				retired += 1
+	if retired:
+		logger.info("Прибрано розмов, неактивних понад %d дн.: %d (%s).", HISTORY_RETENTION_DAYS, retired, HISTORY_RETENTION_ACTION)
+	return retired
+
+async def _compress_old_messages() -> Tuple[int, int]:
+	key: Optional[Tuple[int, int]] = (-(2 ** 63), -1)
+	compressed = saved = 0
+	while key is not None:
+		key, count, batch_saved = await compress_stored_messages(key, MAINTENANCE_BATCH)
+		compressed += count
+		saved += batch_saved
+	if compressed:
+		logger.info("Стиснуто %d збережених повідомлень, звільнено %s.", compressed, _format_bytes(saved))
+	return compressed, saved
+
+async def _vacuum_and_analyze() -> Tuple[int, int]:
+	"""
+	Повертає вільні сторінки ОС кроками incremental_vacuum (writer вивільняється між кроками),
+	оновлює статистику планувальника і обрізає WAL. База без auto_vacuum = INCREMENTAL
+	переводиться в цей режим одним повним VACUUM — лише вперше.
+	"""
+	async with db_pool.writer() as db:
+		page_size = await _pragma_value(db, SQL_PAGE_SIZE)
+		if await _pragma_value(db, SQL_AUTO_VACUUM) != 2:
+			logger.info("Переведення '%s' в auto_vacuum = INCREMENTAL (одноразовий повний VACUUM)…", DB_NAME)
+			before = await _pragma_value(db, SQL_PAGE_COUNT)
+			await db.execute(SQL_SET_AUTO_VACUUM_INCREMENTAL)
+			await db.execute(SQL_VACUUM)
+			freed = max(0, before - await _pragma_value(db, SQL_PAGE_COUNT))
+		else:
+			freed = 0
+
+	while True:
+		async with db_pool.writer() as db:
+			free_pages = await _pragma_value(db, SQL_FREELIST_COUNT)
+			if not free_pages:
+				break
+			# incremental_vacuum звільняє по сторінці на кожен отриманий рядок — результат треба дочитати
+			cursor = await db.execute(SQL_INCREMENTAL_VACUUM)
+			await cursor.fetchall()
+			await cursor.close()
+			freed += free_pages - await _pragma_value(db, SQL_FREELIST_COUNT)
+
+	async with db_pool.writer() as db:
+		await db.execute(SQL_ANALYSIS_LIMIT)
+		await db.execute(SQL_ANALYZE)
+	async with db_pool.writer() as db:
+		cursor = await db.execute(SQL_CHECKPOINT)
+		await cursor.fetchall()
+		await cursor.close()
+	return freed, page_size
+
+async def run_maintenance() -> MaintenanceReport:
+	"""
+	Один прогін обслуговування: прибирання неактивних розмов, стиснення історії,
+	збережених текстом, incremental VACUUM та ANALYZE. Одночасно виконується лише один прогін.
+	"""
+	global last_report
+	async with _run_lock:
+		started_at = time.time()
+		started = time.perf_counter()
+		retired = await _retire_idle_histories()
+		compressed, saved = await _compress_old_messages()
+		freed, page_size = await _vacuum_and_analyze()
+		report = MaintenanceReport(started_at, time.perf_counter() - started, retired, compressed, saved, freed, page_size)
+	last_report = report
+	logger.info("Обслуговування бази завершено: %s", report.describe())
+	return report
+
+def maintenance_running() -> bool:
+	return _run_lock.locked()
+
+def disable_maintenance():
+	"""Цей процес не обслуговує базу: ні за розкладом, ні на запит (воркери, крім 0)."""
+	global _disabled
+	_disabled = True
+
+def maintenance_enabled() -> bool:
+	return not _disabled
+
+# --- Статистика для /yuki_db ---
+async def get_db_stats(top_tables: int = 8) -> DbStats:
+	async with db_pool.reader() as db:
+		page_size = await _pragma_value(db, SQL_PAGE_SIZE)
+		page_count = await _pragma_value(db, SQL_PAGE_COUNT)
+		freelist_count = await _pragma_value(db, SQL_FREELIST_COUNT)
+		auto_vacuum = AUTO_VACUUM_MODES.get(await _pragma_value(db, SQL_AUTO_VACUUM), "?")
+		try:
+			cursor = await db.execute(SQL_TABLE_SIZES, (top_tables,))
+			table_bytes = [(name, size) for name, size in await cursor.fetchall()]
+			await cursor.close()
+		except aiosqlite.Error:
+			table_bytes = []
+		cursor = await db.execute(SQL_MESSAGE_STATS)
+		messages, compressed_messages, message_bytes = await cursor.fetchone()
+		await cursor.close()
+		users = await _pragma_value(db, SQL_COUNT_USERS)
+		cursor = await db.execute(SQL_COUNT_ARCHIVE)
+		archived, archive_bytes = await cursor.fetchone()
+		await cursor.close()
+
+	def file_size(path: str) -> int:
+		with contextlib.suppress(OSError):
+			return os.path.getsize(path)
+		return 0
+
+	return DbStats(
+		file_size(DB_NAME), file_size(f"{DB_NAME}-wal"), page_size, page_count, freelist_count, auto_vacuum,
+		table_bytes, users, messages, compressed_messages, message_bytes, archived, archive_bytes,
+	)
+
+def format_db_stats(stats: DbStats) -> str:
+	compression = HISTORY_COMPRESSION if HISTORY_COMPRESSION != "zstd" or ZSTD_AVAILABLE else "zlib (zstandard не встановлено)"
+	lines = [
+		f"🗄 {DB_NAME}: {_format_bytes(stats.file_bytes)} + WAL {_format_bytes(stats.wal_bytes)}",
+		f"Сторінки: {stats.page_count:,} × {stats.page_size} Б, вільних {stats.freelist_count:,} "
+		f"({_format_bytes(stats.freelist_count * stats.page_size)}), auto_vacuum {stats.auto_vacuum}",
+		f"Історія: {stats.users:,} користувачів, {stats.messages:,} повідомлень "
+		f"({_format_bytes(stats.message_bytes)}), стиснуто {stats.compressed_messages:,} ({compression})",
+		f"Архів: {stats.archived:,} розмов ({_format_bytes(stats.archive_bytes)})",
+	]
+	if stats.table_bytes:
+		lines.append("Найбільші таблиці та індекси:")
+		lines.extend(f"  {name}: {_format_bytes(size)}" for name, size in stats.table_bytes)
+	retention = f"через {HISTORY_RETENTION_DAYS} дн. тиші ({HISTORY_RETENTION_ACTION})" if HISTORY_RETENTION_DAYS else "вимкнено"
+	schedule = f"щодня о {MAINTENANCE_HOUR:02d}:00" if MAINTENANCE_HOUR is not None else "вимкнено"
+	lines.append(f"Прибирання розмов: {retention}; обслуговування: {schedule}")
+	if maintenance_running():
+		lines.append("⏳ Обслуговування виконується зараз.")
+	elif last_report is not None:
+		lines.append(f"Останнє обслуговування: {last_report.describe()}")
+	return "\n".join(lines)
+
+# --- Щоденний запуск у години найменшого навантаження ---
+def seconds_until_off_peak(now: Optional[datetime.datetime] = None) -> float:
+	now = now or datetime.datetime.now()
+	next_run = now.replace(hour=MAINTENANCE_HOUR, minute=0, second=0, microsecond=0)
+	if next_run <= now:
+		next_run += datetime.timedelta(days=1)
+	return (next_run - now).total_seconds()
+
+async def _wait_until_quiet():
+	"""Чекає, поки жоден апдейт не обробляється (але не довше MAINTENANCE_QUIET_WAIT)."""
+	loop = asyncio.get_running_loop()
+	deadline = loop.time() + MAINTENANCE_QUIET_WAIT
+	while in_flight_updates and loop.time() < deadline:
+		await asyncio.sleep(10)
+
+async def _maintenance_loop():
+	while True:
+		await asyncio.sleep(seconds_until_off_peak())
+		await _wait_until_quiet()
+		try:
+			await run_maintenance()
+		except Exception as e:
+			logger.error("Помилка обслуговування бази '%s': %s", DB_NAME, e, exc_info=True)
+
+# Не через background.spawn: drain() чекав би на нескінченний цикл до дедлайну зупинки
+_maintenance_task: Optional[asyncio.Task] = None
+
+def start_maintenance():
+	"""Запускає щоденне обслуговування. У кількох процесах — лише в одному (воркер 0)."""
+	global _maintenance_task
+	if MAINTENANCE_HOUR is None or _disabled or _maintenance_task is not None:
+		return
+	_maintenance_task = asyncio.create_task(_maintenance_loop(), name="db-maintenance")
+	logger.info("Обслуговування бази заплановано на %02d:00 (через %.1f год).", MAINTENANCE_HOUR, seconds_until_off_peak() / 3600)
+
+async def stop_maintenance():
+	"""Скасовує розклад (і прогін, якщо він триває: кожна пачка — окрема транзакція)."""
+	global _maintenance_task
+	task, _maintenance_task = _maintenance_task, None
+	if task is None:
+		return
+	task.cancel()
+	with contextlib.suppress(asyncio.CancelledError):
+		await task
@@ -0,0 +1,192 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import re
+from typing import List, NamedTuple, Optional
+
+# --- Екранування MarkdownV2 (https://core.telegram.org/bots/api#markdownv2-style) ---
+_ESCAPE_RE = re.compile(r"([_*\[\]()~`>#+\-=|{}.!\\])")
+
+def escape_text(text: str) -> str:
+	"""Екранує всі спеціальні символи MarkdownV2 у звичайному тексті."""
+	return _ESCAPE_RE.sub(r"\\\1", text)
+
+def escape_code(text: str) -> str:
+	"""Екранування всередині `code` та ```pre```: лише ` і \\."""
+	return text.replace("\\", "\\\\").replace("`", "\\`")
+
+def escape_url(text: str) -> str:
+	"""Екранування всередині (...) посилання: лише ) і \\."""
+	return text.replace("\\", "\\\\").replace(")", "\\)")
+
+# --- Інлайн-розмітка Gemini ---
+_INLINE_RE = re.compile(r"""
+	(?P<code>`(?P<code_body>[^`\n]+)`)
+	| (?P<link>\[(?P<link_text>[^\]\n]+)\]\((?P<link_url>[^)\s]+)\))
+	| (?P<bold>\*\*(?P<bold_body>\S(?:[^\n]*?\S)?)\*\*)
+	| (?P<ubold>(?<![\w_])__(?P<ubold_body>\S(?:[^\n]*?\S)?)__(?![\w_]))
+	| (?P<strike>~~(?P<strike_body>\S(?:[^\n]*?\S)?)~~)
+	| (?P<spoiler>\|\|(?P<spoiler_body>\S(?:[^\n]*?\S)?)\|\|)
+	| (?P<italic>(?<![\w*])\*(?P<italic_body>[^\s*](?:[^*\n]*?[^\s*])?)\*(?![\w*]))
+	| (?P<uitalic>(?<![\w_])_(?P<uitalic_body>[^\s_](?:[^_\n]*?[^\s_])?)_(?![\w_]))
+""", re.VERBOSE)
+
+_WRAPPERS = {
+	"bold": ("*", "*"),
+	"ubold": ("*", "*"),
+	"strike": ("~", "~"),
+	"spoiler": ("||", "||"),
+	"italic": ("_", "_"),
+	"uitalic": ("_", "_"),
+}
+
+def render_inline(text: str, _inside: frozenset = frozenset()) -> str:
+	"""
+	Рендерить один рядок: розпізнані сутності перетворюються у MarkdownV2,
+	все інше (включно з непарними маркерами) екранується як звичайний текст.
+	Вкладені однакові сутності не створюються — Telegram їх не приймає.
+	"""
+	out = []
+	pos = 0
+	for match in _INLINE_RE.finditer(text):
+		kind = match.lastgroup
+		if kind in _inside or (kind in ("bold", "ubold") and {"bold", "ubold"} & _inside) \
+				or (kind in ("italic", "uitalic") and {"italic", "uitalic"} & _inside):
+			continue
+		out.append(escape_text(text[pos:match.start()]))
+		if kind == "code":
+			out.append("`" + escape_code(match.group("code_body")) + "`")
+		elif kind == "link":
+			out.append(
+				"[" + render_inline(match.group("link_text"), _inside | {"link"}) + "]"
+				+ "(" + escape_url(match.group("link_url")) + ")"
+			)
+		else:
+			left, right = _WRAPPERS[kind]
+			body = render_inline(match.group(f"{kind}_body"), _inside | {kind})
+			out.append(left + body + right)
+		pos = match.end()
+	out.append(escape_text(text[pos:]))
+	return "".join(out)
+
+# --- Блочна розмітка ---
+_FENCE_RE = re.compile(r"^\s*```\s*([\w+\-#.]*)\s*$")
+_HEADING_RE = re.compile(r"^\s{0,3}#{1,6}\s+(.*?)\s*#*\s*$")
+_BULLET_RE = re.compile(r"^(\s*)[*+\-]\s+(.*)$")
+_NUMBERED_RE = re.compile(r"^(\s*)(\d+)[.)]\s+(.*)$")
+_QUOTE_RE = re.compile(r"^\s*>\s?(.*)$")
+_RULE_RE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+
+def render_line(line: str) -> str:
+	"""Рендерить один рядок тексту поза блоком коду."""
+	if _RULE_RE.match(line):
+		return "——————"
+	heading = _HEADING_RE.match(line)
+	if heading:
+		content = heading.group(1).replace("**", "").replace("__", "")
+		return "*" + render_inline(content, frozenset({"bold", "ubold"})) + "*" if content else ""
+	bullet = _BULLET_RE.match(line)
+	if bullet:
+		return bullet.group(1) + "• " + render_inline(bullet.group(2))
+	numbered = _NUMBERED_RE.match(line)
+	if numbered:
+		return numbered.group(1) + numbered.group(2) + "\\. " + render_inline(numbered.group(3))
+	quote = _QUOTE_RE.match(line)
+	if quote:
+		return ">" + render_inline(quote.group(1))
+	return render_inline(line)
+
+# --- Готова частина повідомлення ---
+class RenderedPart(NamedTuple):
+	text: str                 # MarkdownV2 для надсилання
+	plain: str                # відповідний сирий текст (для fallback без розмітки)
+	end: int                  # скільки символів вхідного тексту покриває ця частина
+	open_code: Optional[str]  # мова відкритого блоку коду на межі частини (None — блок закритий)
+
+def _split_long(raw: str, render, budget: int) -> List[str]:
+	"""Ріже надто довгий рядок по пробілах так, щоб кожен шматок після рендеру вміщувався в budget."""
+	pieces = []
+	while raw:
+		cut = min(len(raw), budget)
+		while cut > 1:
+			if cut < len(raw):
+				space = raw.rfind(" ", 0, cut)
+				if space > cut // 2:
+					cut = space + 1
+			size = len(render(raw[:cut]))
+			if size <= budget:
+				break
+			# Екранування лише подовжує текст, тож зменшуємо пропорційно перевищенню
+			cut = max(1, min(cut - 1, cut * budget // size))
+		pieces.append(raw[:cut])
+		raw = raw[cut:]
+	return pieces
+
+def render_markdown_v2(text: str, max_length: int = 4096) -> List[RenderedPart]:
+	"""
+	Один прохід по тексту Gemini: кожен рядок токенізується й рендериться у валідний
+	MarkdownV2, а результат ділиться на частини не довші за max_length лише по межах
+	рядків. Інлайн-сутності не переходять між рядками, тож межа рядка завжди безпечна;
+	блок коду на межі частини закривається і знову відкривається в наступній.
+	"""
+	parts: List[RenderedPart] = []
+	buf: List[str] = []
+	plain: List[str] = []
+	size = 0
+	code_lang: Optional[str] = None
+	part_code_lang: Optional[str] = None
+
+	def flush(end: int):
+		nonlocal buf, plain, size, part_code_lang
+		if not buf:
+			return
+		body = "\n".join(buf)
+		if part_code_lang is not None:
+			body = f"```{part_code_lang}\n" + body
+		if code_lang is not None:
+			body += "\n```"
+		parts.append(RenderedPart(body, "\n".join(plain), end, code_lang))
+		buf, plain, size = [], [], 0
+		part_code_lang = code_lang
+
+	pos = 0
+	for raw_line in text.split("\n"):
+		fence = _FENCE_RE.match(raw_line)
+		if fence:
+			next_lang = fence.group(1) if code_lang is None else None
+			pieces = [(raw_line, "```" + fence.group(1) if code_lang is None else "```")]
+		else:
+			next_lang = code_lang
+			render = escape_code if code_lang is not None else render_line
+			rendered = render(raw_line)
+			budget = max_length - (len(code_lang) + 8 if code_lang is not None else 0)
+			if len(rendered) > budget:
+				pieces = [(piece, render(piece)) for piece in _split_long(raw_line, render, budget)]
+			else:
+				pieces = [(raw_line, rendered)]
+
+		for raw_piece, rendered in pieces:
+			prefix_len = len(part_code_lang) + 4 if part_code_lang is not None else 0
+			close_len = 4 if next_lang is not None else 0
+			if buf and prefix_len + size + len(rendered) + close_len > max_length:
+				flush(pos)
+			buf.append(rendered)
+			plain.append(raw_piece)
+			size += len(rendered) + 1
+			pos += len(raw_piece)
+		code_lang = next_lang
+		pos += 1  # символ переносу рядка
+
+	flush(len(text))
+	return parts
+
+# --- Обрізання сирого тексту ---
+def truncate_markdown(text: str, max_length: int, suffix: str = "\n\n... (відповідь обрізана)") -> str:
+	"""Обрізає сирий текст до max_length по межі рядка; рендерер сам закриє відкритий блок коду."""
+	if len(text) <= max_length:
+		return text
+	cut = text.rfind("\n", 0, max_length - len(suffix))
+	if cut <= 0:
+		cut = max_length - len(suffix)
+	return text[:cut] + suffix
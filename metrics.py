@@ -0,0 +1,226 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import bisect
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject
+
+import config
+from tracing import span
+
+logger = logging.getLogger("yuki.metrics")
+
+# --- Налаштування HTTP-ендпоінта (None — вимкнено) ---
+METRICS_PORT = getattr(config, "METRICS_PORT", None)
+METRICS_HOST = getattr(config, "METRICS_HOST", "127.0.0.1")
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+LabelValues = Tuple[str, ...]
+
+def _escape(value: str) -> str:
+	return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+	pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+	if extra:
+		pairs.append(extra)
+	return "{" + ",".join(pairs) + "}" if pairs else ""
+
+# --- Метрики у форматі Prometheus (text exposition 0.0.4) ---
+class _Metric(ABC):
+	kind = ""
+
+	def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+		self.name = name
+		self.documentation = documentation
+		self.labelnames = tuple(labelnames)
+		registry.append(self)
+
+	def _key(self, values: Sequence[Any]) -> LabelValues:
+		if len(values) != len(self.labelnames):
+			raise ValueError(f"{self.name}: очікується {len(self.labelnames)} міток, отримано {len(values)}")
+		return tuple(str(value) for value in values)
+
+	def render(self) -> List[str]:
+		return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}", *self._samples()]
+
+	@abstractmethod
+	def _samples(self) -> List[str]:
+		"""Рядки значень метрики (без HELP/TYPE)."""
+
+class Counter(_Metric):
+	kind = "counter"
+
+	def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+		super().__init__(name, documentation, labelnames)
+		self._values: Dict[LabelValues, float] = {}
+
+	def inc(self, *labels: Any, amount: float = 1.0):
+		key = self._key(labels)
+		self._values[key] = self._values.get(key, 0.0) + amount
+
+	def _samples(self) -> List[str]:
+		return [f"{self.name}{_labels(self.labelnames, key)} {value}" for key, value in self._values.items()]
+
+class Gauge(_Metric):
+	"""Значення зчитується функцією в момент запиту /metrics (черги, фонові задачі)."""
+	kind = "gauge"
+
+	def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+		super().__init__(name, documentation, labelnames)
+		self._callbacks: Dict[LabelValues, Callable[[], float]] = {}
+
+	def set_function(self, func: Callable[[], float], *labels: Any):
+		self._callbacks[self._key(labels)] = func
+
+	def _samples(self) -> List[str]:
+		samples = []
+		for key, func in self._callbacks.items():
+			try:
+				samples.append(f"{self.name}{_labels(self.labelnames, key)} {float(func())}")
+			except Exception as e:
+				logger.debug("Не вдалося зчитати %s%s: %s", self.name, key, e)
+		return samples
+
+class Histogram(_Metric):
+	kind = "histogram"
+
+	def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS):
+		super().__init__(name, documentation, labelnames)
+		self.buckets = tuple(sorted(buckets))
+		self._values: Dict[LabelValues, List[float]] = {}  # лічильники кошиків + [сума, кількість]
+
+	def observe(self, value: float, *labels: Any):
+		key = self._key(labels)
+		state = self._values.get(key)
+		if state is None:
+			state = self._values[key] = [0.0] * (len(self.buckets) + 2)
+		index = bisect.bisect_left(self.buckets, value)
+		if index < len(self.buckets):
+			state[index] += 1
+		state[-2] += value
+		state[-1] += 1
+
+	def _samples(self) -> List[str]:
+		samples = []
+		for key, state in self._values.items():
+			cumulative = 0.0
+			for bound, count in zip(self.buckets, state):
+				cumulative += count
+				le = 'le="%s"' % bound
+				samples.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+			le = 'le="+Inf"'
+			samples.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {state[-1]}")
+			samples.append(f"{self.name}_sum{_labels(self.labelnames, key)} {state[-2]}")
+			samples.append(f"{self.name}_count{_labels(self.labelnames, key)} {state[-1]}")
+		return samples
+
+registry: List[_Metric] = []
+
+def render_metrics() -> str:
+	return "\n".join(line for metric in registry for line in metric.render()) + "\n"
+
+# --- Метрики бота ---
+HANDLER_SECONDS = Histogram("yuki_handler_seconds", "Тривалість обробників апдейтів", ("router", "handler"))
+HANDLER_ERRORS = Counter("yuki_handler_errors_total", "Необроблені винятки в обробниках", ("router", "handler"))
+DEPENDENCY_SECONDS = Histogram("yuki_dependency_seconds", "Тривалість викликів зовнішніх сервісів", ("dependency", "operation"))
+DEPENDENCY_ERRORS = Counter("yuki_dependency_errors_total", "Помилки викликів зовнішніх сервісів", ("dependency", "operation", "error"))
+DB_SECONDS = Histogram("yuki_db_seconds", "Час утримання з'єднання SQLite", ("mode",), buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1))
+QUEUE_DEPTH = Gauge("yuki_queue_depth", "Кількість елементів у внутрішніх чергах", ("queue",))
+BACKGROUND_TASKS = Gauge("yuki_background_tasks", "Фонові задачі, що виконуються зараз")
+
+# --- Вимірювання викликів зовнішніх сервісів ---
+class track_dependency:
+	"""
+	Контекстний менеджер (звичайний і async) для виклику залежності:
+	час потрапляє в yuki_dependency_seconds, виняток — у yuki_dependency_errors_total,
+	а в трасованому апдейті виклик стає дочірнім спаном.
+	"""
+
+	__slots__ = ("dependency", "operation", "_started", "_span")
+
+	def __init__(self, dependency: str, operation: str):
+		self.dependency = dependency
+		self.operation = operation
+		self._span = span(f"{dependency}.{operation}", dependency=dependency)
+
+	def __enter__(self):
+		self._span.__enter__()
+		self._started = time.perf_counter()
+		return self
+
+	def __exit__(self, exc_type, exc, tb):
+		self._span.__exit__(exc_type, exc, tb)
+		DEPENDENCY_SECONDS.observe(time.perf_counter() - self._started, self.dependency, self.operation)
+		if exc_type is not None:
+			DEPENDENCY_ERRORS.inc(self.dependency, self.operation, exc_type.__name__)
+		return False
+
+	async def __aenter__(self):
+		return self.__enter__()
+
+	async def __aexit__(self, exc_type, exc, tb):
+		return self.__exit__(exc_type, exc, tb)
+
+# --- Middleware для обробників роутерів ---
+class HandlerMetricsMiddleware(BaseMiddleware):
+	"""Внутрішній middleware роутера: тривалість і помилки кожного обробника."""
+
+	def __init__(self, router_name: str):
+		self.router_name = router_name
+
+	async def __call__(
+		self,
+		handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+		event: TelegramObject,
+		data: Dict[str, Any]
+	) -> Any:
+		handler_object = data.get("handler")
+		name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+		started = time.perf_counter()
+		try:
+			with span(f"handler {self.router_name}.{name}"):
+				return await handler(event, data)
+		except Exception:
+			HANDLER_ERRORS.inc(self.router_name, name)
+			raise
+		finally:
+			HANDLER_SECONDS.observe(time.perf_counter() - started, self.router_name, name)
+
+# --- Middleware сесії бота: кожен запит до Telegram Bot API ---
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+	async def __call__(
+		self,
+		make_request: NextRequestMiddlewareType[TelegramType],
+		bot: Bot,
+		method: TelegramMethod[TelegramType],
+	) -> Response[TelegramType]:
+		with track_dependency("telegram", type(method).__name__):
+			return await make_request(bot, method)
+
+# --- HTTP-ендпоінт /metrics ---
+async def _metrics_handler(request: web.Request) -> web.Response:
+	return web.Response(text=render_metrics(), content_type="text/plain", charset="utf-8", headers={"X-Content-Type-Options": "nosniff"})
+
+async def start_metrics_server(port: Optional[int] = METRICS_PORT, host: str = METRICS_HOST) -> Optional[web.AppRunner]:
+	"""Запускає локальний HTTP-сервер метрик, якщо задано METRICS_PORT. Повертає runner для зупинки."""
+	if not port:
+		return None
+	app = web.Application()
+	app.router.add_get("/metrics", _metrics_handler)
+	runner = web.AppRunner(app, access_log=None)
+	await runner.setup()
+	await web.TCPSite(runner, host, port).start()
+	logger.info("Метрики доступні на http://%s:%d/metrics", host, port)
+	return runner
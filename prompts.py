@@ -0,0 +1,109 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Dict, Optional, Tuple
+
+import config
+
+logger = logging.getLogger("yuki.prompts")
+
+# --- Як часто (у секундах) перевіряти mtime файлів промптів ---
+PROMPT_RELOAD_CHECK_INTERVAL = getattr(config, "PROMPT_RELOAD_CHECK_INTERVAL", 2.0)
+
+# --- Запис кешу для одного файлу промптів ---
+class _PromptFile:
+	def __init__(self):
+		self.mtime_ns: Optional[int] = None
+		self.digest: Optional[str] = None
+		self.checked_at = 0.0
+		self.prompts: Dict[str, str] = {}
+		self.error: Optional[str] = None
+
+# --- Реєстр системних промптів ---
+class PromptRegistry:
+	"""
+	Кеш системних промптів у пам'яті процесу.
+	Кожен JSON-файл розбирається один раз, а готові (з'єднані) рядки зберігаються.
+	Файл перечитується лише тоді, коли змінився його mtime і хеш вмісту,
+	тож правки промптів застосовуються без перезапуску бота.
+	"""
+
+	def __init__(self, check_interval: float = PROMPT_RELOAD_CHECK_INTERVAL):
+		self.check_interval = check_interval
+		self._files: Dict[str, _PromptFile] = {}
+
+	def _parse(self, entry: _PromptFile, file_name: str, raw: bytes):
+		prompts_data = json.loads(raw.decode("utf-8"))
+		prompts: Dict[str, str] = {}
+		for key, value in prompts_data.items():
+			if isinstance(value, list):
+				value = "".join(value)
+			if isinstance(value, str):
+				prompts[key] = value
+		entry.prompts = prompts
+		entry.error = None
+		logger.info("Промпти з '%s' завантажено (%d ключів).", file_name, len(prompts))
+
+	def _refresh(self, file_name: str, force: bool = False) -> _PromptFile:
+		entry = self._files.setdefault(file_name, _PromptFile())
+		now = time.monotonic()
+		if not force and entry.checked_at and now - entry.checked_at < self.check_interval:
+			return entry
+		entry.checked_at = now
+
+		try:
+			mtime_ns = os.stat(file_name).st_mtime_ns
+			if not force and mtime_ns == entry.mtime_ns:
+				return entry
+
+			with open(file_name, 'rb') as f:
+				raw = f.read()
+			entry.mtime_ns = mtime_ns
+			digest = hashlib.sha256(raw).hexdigest()
+			if not force and digest == entry.digest:
+				return entry
+
+			self._parse(entry, file_name, raw)
+			entry.digest = digest
+		except FileNotFoundError:
+			entry.error = f"Файл '{file_name}' не знайдено. Переконайтеся, що він існує і шлях правильний."
+			entry.prompts, entry.mtime_ns, entry.digest = {}, None, None
+		except (json.JSONDecodeError, UnicodeDecodeError, AttributeError) as e:
+			# Зберегти останню вдалу версію, але запам'ятати помилку
+			entry.error = f"Помилка декодування JSON у '{file_name}'. Перевірте синтаксис файлу. Деталі: {e}"
+		except Exception as e:
+			entry.error = f"Невідома помилка при завантаженні промпта з '{file_name}': {e}"
+
+		if entry.error:
+			logger.error(entry.error)
+		return entry
+
+	def get(self, file_name: str, key_name: str, default_message: str) -> str:
+		"""Повертає промпт за ключем або default_message, якщо його немає чи він порожній."""
+		entry = self._refresh(file_name)
+		prompt_content = entry.prompts.get(key_name)
+		if not prompt_content:
+			if not entry.error:
+				logger.error("Не вдалося завантажити '%s' з %s. Значення відсутнє або порожнє.", key_name, file_name)
+			return default_message
+		return prompt_content
+
+	def reload(self, file_name: Optional[str] = None) -> Tuple[str, ...]:
+		"""Примусово перечитує один або всі відомі файли промптів. Повертає перелік перечитаних файлів."""
+		names = (file_name,) if file_name else tuple(self._files)
+		for name in names:
+			self._refresh(name, force=True)
+		return names
+
+# --- Спільний реєстр для всього процесу ---
+prompt_registry = PromptRegistry()
+
+def reload_prompts(file_name: Optional[str] = None) -> Tuple[str, ...]:
+	"""Хук для примусового перезавантаження промптів (наприклад, за сигналом SIGHUP)."""
+	return prompt_registry.reload(file_name)
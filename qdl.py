@@ -7,7 +7,9 @@ import re
 import uuid
 import glob
 import asyncio
+import contextvars
 import logging
+import threading
 import traceback
 import urllib.parse
 
@@ -23,23 +25,55 @@ from aiogram.types import (
 )
 
 from aiogram.exceptions import TelegramBadRequest
-from yt_dlp.utils import DownloadError
-import yt_dlp
+
+from drain import on_abort
+from lazy_imports import lazy_import
+from metrics import track_dependency
+from state_store import StateNamespace
 
 # --- Ініціалізація ---
 qdl_router = Router()
-TMP_DIR = "tmp_downloads"
-os.makedirs(TMP_DIR, exist_ok=True)
+TMP_DIR = "tmp_downloads"  # створюється при першому завантаженні
+yt_dlp = lazy_import("yt_dlp")  # тисячі екстракторів — імпорт лише при першому /qdl або у warm_up
 
 logger = logging.getLogger(__name__)
-logging.getLogger("yt_dlp").setLevel(logging.CRITICAL)
 
 # --- Конфігурація ---
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 МБ
-prompt_messages = {} # Зберегти message_id для видалення клавіатури
-pending_queries = {} # Зберегти запити, пов'язані з query_id для колбеків
+PROMPT_TIMEOUT = 15  # сек до автовидалення клавіатури вибору формату
+prompt_messages = StateNamespace("qdl_prompt", ttl=PROMPT_TIMEOUT * 4)  # uid -> message_id клавіатури для видалення
+pending_queries = StateNamespace("qdl_query", ttl=3600)               # query_id -> запит для колбеків кнопок
 pattern_tiktok_photo = re.compile(r"https?://(?:www\.)?tiktok.com/.+/photo/?")
 
+# --- Переривання завантажень при зупинці бота ---
+# Скасування задачі не зупиняє потік yt-dlp, тому він сам перевіряє прапорець у хуках прогресу
+_abort_downloads = threading.Event()
+
+@on_abort
+def abort_downloads():
+	"""Перериває завантаження yt-dlp, що ще тривають (drain() викликає це після дедлайну зупинки)."""
+	_abort_downloads.set()
+
+def _check_abort(progress):
+	if _abort_downloads.is_set():
+		raise yt_dlp.utils.DownloadCancelled("Бот зупиняється")
+
+def remove_download_files(video_id: str):
+	for file in glob.glob(os.path.join(TMP_DIR, f"{video_id}.*")):
+		try:
+			os.remove(file)
+		except Exception as e:
+			logging.warning(f"Не вдалося видалити тимчасовий файл {file}: {e}")
+
+def run_download(ydl_opts: dict, search_query: str, video_id: str):
+	"""Виконується в потоці. Якщо завантаження перервано зупинкою, сам прибирає частково завантажені файли."""
+	try:
+		with yt_dlp.YoutubeDL({**ydl_opts, 'progress_hooks': [_check_abort], 'postprocessor_hooks': [_check_abort]}) as ydl:
+			ydl.download([search_query])
+	finally:
+		if _abort_downloads.is_set():
+			remove_download_files(video_id)
+
 # --- Клас кастомного логера для yt_dlp ---
 class MyLogger:
 	def debug(self, msg):
@@ -85,8 +119,9 @@ def safe_extract_info(url):
 
 	ydl = yt_dlp.YoutubeDL(ydl_opts)
 	try:
-		return ydl.extract_info(url, download=False)
-	except DownloadError as e:
+		with track_dependency("yt_dlp", "extract_info"):
+			return ydl.extract_info(url, download=False)
+	except yt_dlp.utils.DownloadError as e:
 		if "Unsupported URL" in str(e):
 			return {"message": "URL не підтримується aбо посилання не дійсне.", "url": url}
 		logging.error(f"Yt-dlp DownloadError під час extract_info: {e}")
@@ -117,7 +152,7 @@ async def cmd_qdl(message: Message, bot: Bot):
 
 	query = parts[1].strip()
 	query_id = str(uuid.uuid4())
-	pending_queries[query_id] = query
+	await pending_queries.set(query_id, query)
 
 	keyboard = InlineKeyboardMarkup(inline_keyboard=[
 		[
@@ -127,18 +162,23 @@ async def cmd_qdl(message: Message, bot: Bot):
 	])
 
 	prompt_msg = await message.answer("⬇️ Обери формат завантаження:", reply_markup=keyboard)
-	prompt_messages[uid] = prompt_msg.message_id
+	await prompt_messages.set(uid, prompt_msg.message_id)
 
 	# Видалити клавіатуру через 15 секунд
 	async def auto_delete_buttons():
-		await asyncio.sleep(15)
-		if prompt_messages.get(uid) == prompt_msg.message_id:
+		await asyncio.sleep(PROMPT_TIMEOUT)
+		# Забрати запис лише якщо це досі наша клавіатура (колбек чи новий /qdl могли її замінити)
+		matched = False
+		def claim(current):
+			nonlocal matched
+			matched = current == prompt_msg.message_id
+			return None if matched else current
+		await prompt_messages.update(uid, claim)
+		if matched:
 			try:
 				await bot.delete_message(message.chat.id, prompt_msg.message_id)
 			except Exception as e:
 				logging.warning(f"Не вдалося видалити повідомлення з кнопками ({prompt_msg.message_id}): {e}")
-			finally:
-				prompt_messages.pop(uid, None)
 
 	asyncio.create_task(auto_delete_buttons())
 
@@ -148,9 +188,9 @@ async def process_qdl_callback(query: CallbackQuery, bot: Bot):
 	uid = query.from_user.id
 	data = query.data
 	action, query_id = data.split("|", maxsplit=1)
-	input_text = pending_queries.pop(query_id, None)
+	input_text = await pending_queries.pop(query_id)
 
-	prompt_msg_id = prompt_messages.pop(uid, None)
+	prompt_msg_id = await prompt_messages.pop(uid)
 	if prompt_msg_id:
 		try:
 			await bot.delete_message(query.message.chat.id, prompt_msg_id)
@@ -177,6 +217,7 @@ async def process_qdl_callback(query: CallbackQuery, bot: Bot):
 		return
 
 	video_id = str(uuid.uuid4())
+	os.makedirs(TMP_DIR, exist_ok=True)
 	output_template = os.path.join(TMP_DIR, f"{video_id}.%(ext)s")
 
 	# Загальні опції
@@ -212,7 +253,9 @@ async def process_qdl_callback(query: CallbackQuery, bot: Bot):
 	try:
 		# Завантаження
 		loop = asyncio.get_event_loop()
-		await loop.run_in_executor(None, lambda: yt_dlp.YoutubeDL(ydl_opts).download([search_query]))
+		async with track_dependency("yt_dlp", "download"):
+			# Контекст (поточний спан, uid/cid для логів) переноситься в потік завантаження
+			await loop.run_in_executor(None, contextvars.copy_context().run, run_download, ydl_opts, search_query, video_id)
 
 		matches = glob.glob(os.path.join(TMP_DIR, f"{video_id}.*"))
 		if not matches:
@@ -261,8 +304,4 @@ async def process_qdl_callback(query: CallbackQuery, bot: Bot):
 
 	finally:
 		# Очистити тимчасові файли
-		for file in glob.glob(os.path.join(TMP_DIR, f"{video_id}.*")):
-			try:
-				os.remove(file)
-			except Exception as e:
-				logging.warning(f"Не вдалося видалити тимчасовий файл {file}: {e}")
+		remove_download_files(video_id)
@@ -0,0 +1,290 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import asyncio
+import bisect
+import contextlib
+import itertools
+import logging
+import time
+from typing import Dict, List, Optional, Tuple, Union
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import (
+	CopyMessage,
+	DeleteMessage,
+	DeleteMessages,
+	EditMessageCaption,
+	EditMessageMedia,
+	EditMessageReplyMarkup,
+	EditMessageText,
+	ForwardMessage,
+	SendAnimation,
+	SendAudio,
+	SendChatAction,
+	SendDocument,
+	SendMediaGroup,
+	SendMessage,
+	SendPhoto,
+	SendSticker,
+	SendVideo,
+	SendVoice,
+	TelegramMethod,
+)
+from aiogram.methods.base import Response, TelegramType
+
+import config
+
+logger = logging.getLogger("yuki.send_scheduler")
+
+# --- Ліміти Telegram (https://core.telegram.org/bots/faq#my-bot-is-hitting-limits-how-do-i-avoid-this) ---
+SEND_GLOBAL_RATE = getattr(config, "SEND_GLOBAL_RATE", 30.0)          # повідомлень/сек на весь бот
+SEND_GLOBAL_BURST = getattr(config, "SEND_GLOBAL_BURST", 30)
+SEND_PRIVATE_RATE = getattr(config, "SEND_PRIVATE_RATE", 1.0)         # повідомлень/сек в особистий чат
+SEND_PRIVATE_BURST = getattr(config, "SEND_PRIVATE_BURST", 3)
+SEND_GROUP_RATE = getattr(config, "SEND_GROUP_RATE", 20 / 60)         # повідомлень/сек у групу
+SEND_GROUP_BURST = getattr(config, "SEND_GROUP_BURST", 5)
+SEND_EDIT_RATE = getattr(config, "SEND_EDIT_RATE", 1.0)               # редагувань/сек у чат (окремо від повідомлень)
+SEND_EDIT_BURST = getattr(config, "SEND_EDIT_BURST", 3)
+SEND_MAX_RETRIES = getattr(config, "SEND_MAX_RETRIES", 3)             # повтори після RetryAfter
+
+# --- Пріоритетні смуги: менше число обслуговується раніше ---
+LANE_INTERACTIVE = 0  # нові відповіді, файли
+LANE_UPDATE = 1       # редагування, статус "друкує"
+LANE_CLEANUP = 2      # видалення службових повідомлень
+
+_METHOD_LANES = {
+	SendMessage: LANE_INTERACTIVE,
+	SendPhoto: LANE_INTERACTIVE,
+	SendDocument: LANE_INTERACTIVE,
+	SendVideo: LANE_INTERACTIVE,
+	SendAudio: LANE_INTERACTIVE,
+	SendVoice: LANE_INTERACTIVE,
+	SendAnimation: LANE_INTERACTIVE,
+	SendSticker: LANE_INTERACTIVE,
+	SendMediaGroup: LANE_INTERACTIVE,
+	CopyMessage: LANE_INTERACTIVE,
+	ForwardMessage: LANE_INTERACTIVE,
+	EditMessageText: LANE_UPDATE,
+	EditMessageCaption: LANE_UPDATE,
+	EditMessageMedia: LANE_UPDATE,
+	EditMessageReplyMarkup: LANE_UPDATE,
+	SendChatAction: LANE_UPDATE,
+	DeleteMessage: LANE_CLEANUP,
+	DeleteMessages: LANE_CLEANUP,
+}
+
+# --- Бюджети чату: редагування (потокові відповіді) не витрачають ліміт повідомлень групи ---
+BUDGET_MESSAGES = "messages"
+BUDGET_EDITS = "edits"
+
+_METHOD_BUDGETS = {
+	EditMessageText: BUDGET_EDITS,
+	EditMessageCaption: BUDGET_EDITS,
+	EditMessageMedia: BUDGET_EDITS,
+	EditMessageReplyMarkup: BUDGET_EDITS,
+	SendChatAction: None,  # статус "друкує" — лише глобальне відро, без ліміту чату
+}
+
+ChatKey = Union[int, str, None]
+
+# --- Відро токенів ---
+class TokenBucket:
+	"""Класичне відро токенів: `rate` токенів за секунду, не більше `capacity` про запас."""
+
+	__slots__ = ("rate", "capacity", "tokens", "updated")
+
+	def __init__(self, rate: float, capacity: float):
+		self.rate = rate
+		self.capacity = capacity
+		self.tokens = capacity
+		self.updated = time.monotonic()
+
+	def _refill(self, now: float):
+		self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+		self.updated = now
+
+	def delay(self, now: float) -> float:
+		"""Скільки секунд чекати до появи одного токена (0 — можна вже зараз)."""
+		self._refill(now)
+		return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+	def consume(self, now: float):
+		self._refill(now)
+		self.tokens -= 1
+
+	def is_idle(self, now: float) -> bool:
+		self._refill(now)
+		return self.tokens >= self.capacity
+
+# --- Планувальник вихідних запитів ---
+class SendScheduler(BaseRequestMiddleware):
+	"""
+	Middleware сесії бота: кожен запит, що надсилає/змінює/видаляє повідомлення, чекає
+	токен у глобальному відрі та у відрі свого чату (окремому для повідомлень і для
+	редагувань; статус "друкує" чатового відра не має). Черга впорядкована за пріоритетною
+	смугою, тож відповіді користувачам обганяють відкладені видалення, а зайнятий чат
+	не блокує інші. На TelegramRetryAfter чат ставиться на паузу і запит повторюється.
+	Інші методи (get_file, get_chat_member, ...) проходять без черги.
+	"""
+
+	MAX_IDLE_BUCKETS = 10000
+
+	def __init__(self):
+		self.global_bucket = TokenBucket(SEND_GLOBAL_RATE, SEND_GLOBAL_BURST)
+		self._chat_buckets: Dict[Tuple[ChatKey, str], TokenBucket] = {}
+		self._paused_until: Dict[ChatKey, float] = {}
+		self._queue: List[Tuple[int, int, ChatKey, Optional[str], asyncio.Future]] = []
+		self._seq = itertools.count()
+		self._wakeup: Optional[asyncio.Event] = None
+		self._dispatcher: Optional[asyncio.Task] = None
+
+	def __len__(self) -> int:
+		return len(self._queue)
+
+	async def __call__(
+		self,
+		make_request: NextRequestMiddlewareType[TelegramType],
+		bot: Bot,
+		method: TelegramMethod[TelegramType],
+	) -> Response[TelegramType]:
+		lane = _METHOD_LANES.get(type(method))
+		if lane is None:
+			return await make_request(bot, method)
+
+		chat_id = getattr(method, "chat_id", None)
+		budget = _METHOD_BUDGETS.get(type(method), BUDGET_MESSAGES)
+		for attempt in range(SEND_MAX_RETRIES + 1):
+			await self.acquire(chat_id, lane, budget)
+			try:
+				return await make_request(bot, method)
+			except TelegramRetryAfter as e:
+				self.pause(chat_id, e.retry_after)
+				if attempt >= SEND_MAX_RETRIES:
+					raise
+				logger.warning(
+					"Flood control для чату %s (%s): пауза %d сек, повтор %d/%d.",
+					chat_id, type(method).__name__, e.retry_after, attempt + 1, SEND_MAX_RETRIES
+				)
+
+	# --- Черга ---
+	async def acquire(self, chat_id: ChatKey, lane: int = LANE_INTERACTIVE, budget: Optional[str] = BUDGET_MESSAGES):
+		"""
+		Чекає, поки запит до чату `chat_id` у смузі `lane` можна буде надіслати.
+		`budget` — яке відро чату він витрачає (None — лише глобальне).
+		"""
+		loop = asyncio.get_running_loop()
+		if self._wakeup is None:
+			self._wakeup = asyncio.Event()
+		if self._dispatcher is None or self._dispatcher.done():
+			self._dispatcher = loop.create_task(self._dispatch(), name="send-scheduler")
+
+		future = loop.create_future()
+		# seq унікальний, тож порівняння кортежів ніколи не доходить до chat_id/future
+		bisect.insort(self._queue, (lane, next(self._seq), chat_id, budget, future))
+		self._wakeup.set()
+		try:
+			await future
+		except asyncio.CancelledError:
+			if not future.done():
+				future.cancel()
+			raise
+
+	def pause(self, chat_id: ChatKey, seconds: float):
+		"""Не надсилати нічого в чат `chat_id` найближчі `seconds` секунд."""
+		self._paused_until[chat_id] = max(self._paused_until.get(chat_id, 0.0), time.monotonic() + seconds)
+		if self._wakeup is not None:
+			self._wakeup.set()
+
+	def _chat_bucket(self, chat_id: ChatKey, budget: Optional[str]) -> Optional[TokenBucket]:
+		if chat_id is None or budget is None:
+			return None
+		bucket = self._chat_buckets.get((chat_id, budget))
+		if bucket is None:
+			if budget == BUDGET_EDITS:
+				bucket = TokenBucket(SEND_EDIT_RATE, SEND_EDIT_BURST)
+			# Додатні id — особисті чати, від'ємні та @username — групи й канали
+			elif isinstance(chat_id, int) and chat_id > 0:
+				bucket = TokenBucket(SEND_PRIVATE_RATE, SEND_PRIVATE_BURST)
+			else:
+				bucket = TokenBucket(SEND_GROUP_RATE, SEND_GROUP_BURST)
+			self._chat_buckets[(chat_id, budget)] = bucket
+		return bucket
+
+	def _chat_delay(self, chat_id: ChatKey, budget: Optional[str], now: float) -> float:
+		paused = self._paused_until.get(chat_id)
+		if paused is not None:
+			if paused > now:
+				return paused - now
+			del self._paused_until[chat_id]
+		bucket = self._chat_bucket(chat_id, budget)
+		return bucket.delay(now) if bucket else 0.0
+
+	def _prune(self, now: float):
+		if len(self._chat_buckets) > self.MAX_IDLE_BUCKETS:
+			waiting = {(entry[2], entry[3]) for entry in self._queue}
+			for key in [key for key, bucket in self._chat_buckets.items() if key not in waiting and bucket.is_idle(now)]:
+				del self._chat_buckets[key]
+
+	def _grant_next(self, now: float) -> Optional[float]:
+		"""
+		Видає дозвіл першому запиту (в порядку смуг), чий чат готовий. Повертає 0, якщо
+		дозвіл видано, інакше час до найближчої готовності (None — черга порожня).
+		"""
+		if not self._queue:
+			return None
+		global_delay = self.global_bucket.delay(now)
+		if global_delay > 0:
+			return global_delay
+
+		next_delay: Optional[float] = None
+		seen = set()
+		for index, (_, _, chat_id, budget, future) in enumerate(self._queue):
+			if (chat_id, budget) in seen:
+				continue  # порядок у межах одного бюджету чату зберігається
+			seen.add((chat_id, budget))
+			delay = self._chat_delay(chat_id, budget, now)
+			if delay > 0:
+				next_delay = delay if next_delay is None else min(next_delay, delay)
+				continue
+			self.global_bucket.consume(now)
+			bucket = self._chat_bucket(chat_id, budget)
+			if bucket:
+				bucket.consume(now)
+			del self._queue[index]
+			future.set_result(None)
+			return 0.0
+		return next_delay
+
+	async def close(self):
+		"""Зупиняє задачу розподілу; запити, що ще чекають у черзі, скасовуються. Викликається при зупинці."""
+		dispatcher, self._dispatcher = self._dispatcher, None
+		for _, _, _, _, future in self._queue:
+			if not future.done():
+				future.cancel()
+		self._queue.clear()
+		if dispatcher is None or dispatcher.done():
+			return
+		dispatcher.cancel()
+		with contextlib.suppress(asyncio.CancelledError):
+			await dispatcher
+
+	async def _dispatch(self):
+		while True:
+			self._wakeup.clear()
+			now = time.monotonic()
+			self._queue = [entry for entry in self._queue if not entry[4].done()]
+			sleep_for = self._grant_next(now)
+			if sleep_for == 0:
+				await asyncio.sleep(0)
+				continue
+			self._prune(now)
+			try:
+				await asyncio.wait_for(self._wakeup.wait(), timeout=sleep_for)
+			except asyncio.TimeoutError:
+				pass
+
+send_scheduler = SendScheduler()
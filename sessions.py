@@ -0,0 +1,198 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Tuple
+
+import config
+from chat_history import db_pool
+
+# --- Додатковий блок для redis (необов'язковий бекенд) ---
+try:
+	import redis.asyncio as aioredis
+	REDIS_AVAILABLE = True
+except ImportError:
+	REDIS_AVAILABLE = False
+
+logger = logging.getLogger("yuki.sessions")
+
+# --- Налаштування сесій ---
+SESSION_BACKEND = getattr(config, "SESSION_BACKEND", "sqlite")                 # "sqlite" або "redis"
+SESSION_REDIS_URL = getattr(config, "SESSION_REDIS_URL", "redis://localhost:6379/0")
+SESSION_IDLE_TTL = getattr(config, "SESSION_IDLE_TTL", 12 * 3600)             # сесія завершується після стількох секунд тиші
+SESSION_LOCAL_CACHE_TTL = getattr(config, "SESSION_LOCAL_CACHE_TTL", 5.0)     # скільки секунд процес довіряє локальній копії
+
+# --- SQL-запити ---
+SQL_CREATE_SESSIONS = '''
+	CREATE TABLE IF NOT EXISTS yuki_sessions (
+		user_id INTEGER PRIMARY KEY,
+		started_at REAL NOT NULL,
+		last_seen REAL NOT NULL
+	)
+'''
+SQL_CREATE_SESSIONS_LAST_SEEN_INDEX = "CREATE INDEX IF NOT EXISTS idx_yuki_sessions_last_seen ON yuki_sessions (last_seen)"
+SQL_DELETE_EXPIRED = "DELETE FROM yuki_sessions WHERE last_seen < ?"
+SQL_ACTIVATE = '''
+	INSERT INTO yuki_sessions (user_id, started_at, last_seen) VALUES (?, ?, ?)
+	ON CONFLICT(user_id) DO UPDATE SET last_seen = excluded.last_seen
+'''
+SQL_SESSION_EXISTS = "SELECT 1 FROM yuki_sessions WHERE user_id = ? AND last_seen >= ?"
+SQL_TOUCH = "UPDATE yuki_sessions SET last_seen = ? WHERE user_id = ? AND last_seen >= ?"
+SQL_DEACTIVATE = "DELETE FROM yuki_sessions WHERE user_id = ? AND last_seen >= ?"
+
+# --- Інтерфейс сховища сесій ---
+class SessionStore(ABC):
+	"""
+	Спільне для всіх процесів сховище активних сесій Yuki з простроченням за бездіяльністю.
+	Усі методи працюють з user_id і самі враховують ttl (прострочена сесія — неактивна).
+	"""
+
+	async def open(self):
+		pass
+
+	async def close(self):
+		pass
+
+	@abstractmethod
+	async def activate(self, user_id: int, ttl: float) -> bool:
+		"""Вмикає або продовжує сесію. Повертає True, якщо сесія була неактивною."""
+
+	@abstractmethod
+	async def deactivate(self, user_id: int, ttl: float) -> bool:
+		"""Завершує сесію. Повертає True, якщо вона була активною."""
+
+	@abstractmethod
+	async def touch(self, user_id: int, ttl: float) -> bool:
+		"""Продовжує активну сесію. Повертає False, якщо сесії немає або вона прострочена."""
+
+# --- SQLite: спільний файл бази (WAL) для кількох процесів на одній машині ---
+class SQLiteSessionStore(SessionStore):
+	async def open(self):
+		async with db_pool.writer() as db:
+			await db.execute(SQL_CREATE_SESSIONS)
+			await db.execute(SQL_CREATE_SESSIONS_LAST_SEEN_INDEX)
+			await db.execute(SQL_DELETE_EXPIRED, (time.time() - SESSION_IDLE_TTL,))
+
+	async def activate(self, user_id: int, ttl: float) -> bool:
+		now = time.time()
+		async with db_pool.writer() as db:
+			cursor = await db.execute(SQL_SESSION_EXISTS, (user_id, now - ttl))
+			existed = await cursor.fetchone() is not None
+			await cursor.close()
+			await db.execute(SQL_DELETE_EXPIRED, (now - ttl,))
+			await db.execute(SQL_ACTIVATE, (user_id, now, now))
+		return not existed
+
+	async def deactivate(self, user_id: int, ttl: float) -> bool:
+		async with db_pool.writer() as db:
+			cursor = await db.execute(SQL_DEACTIVATE, (user_id, time.time() - ttl))
+			return cursor.rowcount > 0
+
+	async def touch(self, user_id: int, ttl: float) -> bool:
+		now = time.time()
+		async with db_pool.reader() as db:
+			cursor = await db.execute(SQL_SESSION_EXISTS, (user_id, now - ttl))
+			active = await cursor.fetchone() is not None
+			await cursor.close()
+		if active:
+			async with db_pool.writer() as db:
+				cursor = await db.execute(SQL_TOUCH, (now, user_id, now - ttl))
+				active = cursor.rowcount > 0
+		return active
+
+# --- Redis: локальний (або спільний) key-value сервер для кількох процесів/машин ---
+class RedisSessionStore(SessionStore):
+	KEY_PREFIX = "yuki:session:"
+
+	def __init__(self, url: str):
+		if not REDIS_AVAILABLE:
+			raise RuntimeError("Для SESSION_BACKEND = 'redis' потрібен пакет 'redis' (pip install redis).")
+		self.url = url
+		self._client = None
+
+	async def open(self):
+		self._client = aioredis.from_url(self.url)
+		await self._client.ping()
+
+	async def close(self):
+		if self._client is not None:
+			await self._client.aclose()
+			self._client = None
+
+	def _key(self, user_id: int) -> str:
+		return f"{self.KEY_PREFIX}{user_id}"
+
+	async def activate(self, user_id: int, ttl: float) -> bool:
+		created = await self._client.set(self._key(user_id), int(time.time()), ex=int(ttl), nx=True)
+		if not created:
+			await self._client.expire(self._key(user_id), int(ttl))
+		return bool(created)
+
+	async def deactivate(self, user_id: int, ttl: float) -> bool:
+		return await self._client.delete(self._key(user_id)) > 0
+
+	async def touch(self, user_id: int, ttl: float) -> bool:
+		return bool(await self._client.expire(self._key(user_id), int(ttl)))
+
+# --- Реєстр сесій з локальним кешем ---
+class SessionRegistry:
+	"""
+	Обгортка над SessionStore для гарячих перевірок у обробниках повідомлень.
+	is_active() відповідає з локального кешу процесу, а до сховища звертається не частіше
+	ніж раз на local_ttl секунд на користувача (заодно продовжуючи сесію). Зміни, зроблені
+	іншим процесом, стають видимими тут щонайпізніше через local_ttl.
+	"""
+
+	def __init__(self, store: SessionStore, idle_ttl: float, local_ttl: float):
+		self.store = store
+		self.idle_ttl = idle_ttl
+		self.local_ttl = local_ttl
+		self._local: Dict[int, Tuple[bool, float]] = {}
+
+	async def open(self):
+		await self.store.open()
+		logger.info("Сховище сесій %s відкрито (idle TTL %d сек).", type(self.store).__name__, self.idle_ttl)
+
+	async def close(self):
+		await self.store.close()
+		self._local.clear()
+
+	def _remember(self, user_id: int, active: bool):
+		self._local[user_id] = (active, time.monotonic())
+		if len(self._local) > 10000:
+			now = time.monotonic()
+			self._local = {uid: entry for uid, entry in self._local.items() if now - entry[1] < self.local_ttl}
+
+	async def activate(self, user_id: int) -> bool:
+		created = await self.store.activate(user_id, self.idle_ttl)
+		self._remember(user_id, True)
+		return created
+
+	async def deactivate(self, user_id: int) -> bool:
+		existed = await self.store.deactivate(user_id, self.idle_ttl)
+		self._remember(user_id, False)
+		return existed
+
+	async def is_active(self, user_id: int) -> bool:
+		cached = self._local.get(user_id)
+		if cached is not None and time.monotonic() - cached[1] < self.local_ttl:
+			return cached[0]
+		try:
+			active = await self.store.touch(user_id, self.idle_ttl)
+		except Exception as e:
+			logger.warning("Сховище сесій недоступне (%s), використовую локальний стан для %d.", e, user_id)
+			return cached[0] if cached is not None else False
+		self._remember(user_id, active)
+		return active
+
+def _create_store(backend: str) -> SessionStore:
+	if backend == "redis":
+		return RedisSessionStore(SESSION_REDIS_URL)
+	if backend != "sqlite":
+		logger.warning("Невідомий SESSION_BACKEND '%s', використовую sqlite.", backend)
+	return SQLiteSessionStore()
+
+session_registry = SessionRegistry(_create_store(SESSION_BACKEND), SESSION_IDLE_TTL, SESSION_LOCAL_CACHE_TTL)
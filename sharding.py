@@ -0,0 +1,226 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import asyncio
+import bisect
+import contextlib
+import hashlib
+import logging
+import multiprocessing
+import signal
+import sys
+from typing import Any, Dict, List, Optional
+
+from aiogram import Bot, Dispatcher
+from aiogram.exceptions import RestartingTelegram, TelegramNetworkError
+
+import config
+
+logger = logging.getLogger("yuki.sharding")
+
+# --- Налаштування (0 або 1 — усе в одному процесі, як раніше) ---
+WORKER_PROCESSES = getattr(config, "WORKER_PROCESSES", 0)
+WORKER_RESTART_DELAY = getattr(config, "WORKER_RESTART_DELAY", 2.0)  # пауза перед перезапуском впалого воркера (сек)
+WORKER_STOP_TIMEOUT = getattr(config, "WORKER_STOP_TIMEOUT", 30.0)   # скільки чекати на завершення воркерів (сек), більше за SHUTDOWN_DRAIN_TIMEOUT
+HASH_RING_REPLICAS = 160
+
+# --- Узгоджене хешування: чат завжди потрапляє до того самого воркера ---
+def _stable_hash(key: str) -> int:
+	# hash() для рядків відрізняється між процесами (PYTHONHASHSEED), тому — blake2b
+	return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+class HashRing:
+	"""
+	Кільце узгодженого хешування з віртуальними вузлами. На відміну від `chat_id % N`,
+	при зміні кількості воркерів переїжджає лише ~1/N чатів.
+	"""
+
+	def __init__(self, nodes: int, replicas: int = HASH_RING_REPLICAS):
+		points = sorted(
+			(_stable_hash(f"worker-{node}-{replica}"), node)
+			for node in range(nodes)
+			for replica in range(replicas)
+		)
+		self._hashes = [point for point, _ in points]
+		self._nodes = [node for _, node in points]
+
+	def node_for(self, key: Any) -> int:
+		index = bisect.bisect(self._hashes, _stable_hash(str(key))) % len(self._hashes)
+		return self._nodes[index]
+
+def shard_key(update: Dict[str, Any]) -> Any:
+	"""chat_id апдейта; для подій без чату (inline-запити тощо) — id користувача."""
+	for field, event in update.items():
+		if not isinstance(event, dict):
+			continue
+		chat = event.get("chat") or (event.get("message") or {}).get("chat")
+		if chat:
+			return chat["id"]
+		if event.get("from"):
+			return event["from"]["id"]
+	return update.get("update_id", 0)
+
+# --- Воркер: окремий процес зі своїм Dispatcher ---
+def _bot_module():
+	"""
+	Модуль main у процесі воркера. Режим spawn уже виконав main.py як __mp_main__;
+	повторний `import main` підключив би ті самі роутери до другого Dispatcher.
+	"""
+	module = sys.modules.get("__mp_main__")
+	if module is None or not hasattr(module, "dp"):
+		import main as module
+	return module
+
+def _worker_entry(index: int, workers: int, inbox: "multiprocessing.Queue"):
+	# Ctrl+C і SIGTERM від systemd надходять усій групі процесів — зупинкою воркерів керує супервізор
+	signal.signal(signal.SIGINT, signal.SIG_IGN)
+	signal.signal(signal.SIGTERM, signal.SIG_IGN)
+	asyncio.run(_worker_main(index, workers, inbox))
+
+async def _worker_main(index: int, workers: int, inbox: "multiprocessing.Queue"):
+	app = _bot_module()
+	from background import spawn
+	from drain import drain
+	from gemini_client import share_limits
+	from lazy_imports import warm_up
+	from maintenance import disable_maintenance, start_maintenance
+	from metrics import METRICS_PORT, start_metrics_server
+	from send_scheduler import SEND_GLOBAL_BURST, SEND_GLOBAL_RATE, TokenBucket, send_scheduler
+	from usage import disable_totals_cache
+
+	# Глобальний ліміт Telegram діє на весь бот — ділимо його між воркерами
+	send_scheduler.global_bucket = TokenBucket(SEND_GLOBAL_RATE / workers, max(1.0, SEND_GLOBAL_BURST / workers))
+	# Так само ключі Gemini: одночасні запити та rpm кожного бекенда
+	share_limits(workers)
+	# Квоти токенів рахуються всіма воркерами разом — лише з бази, без локальних сум
+	if workers > 1:
+		disable_totals_cache()
+	metrics_runner = None
+	if METRICS_PORT:
+		with contextlib.suppress(OSError):
+			metrics_runner = await start_metrics_server(METRICS_PORT + 1 + index)
+
+	if not await app.prepare_database():
+		return
+	logger.info("Воркер %d запущено.", index)
+	# Воркер не проходить dp.startup — прогріваємо важкі залежності тут
+	spawn(warm_up(), name="warm-up")
+	# Обслуговування бази (VACUUM, прибирання історії) — одне на всю базу
+	if index == 0:
+		start_maintenance()
+	else:
+		disable_maintenance()
+
+	loop = asyncio.get_running_loop()
+	try:
+		while True:
+			update = await loop.run_in_executor(None, inbox.get)
+			if update is None:
+				break
+			spawn(app.dp.feed_raw_update(app.bot, update), name=f"update-{update.get('update_id')}")
+		cut_off = await drain()
+		if cut_off:
+			logger.warning("Воркер %d: перервано незавершених задач: %d", index, len(cut_off))
+	finally:
+		await send_scheduler.close()
+		await app.bot.session.close()
+		await app.close_db()
+		if metrics_runner is not None:
+			await metrics_runner.cleanup()
+		logger.info("Воркер %d зупинено.", index)
+
+# --- Супервізор: отримує апдейти і розподіляє їх між воркерами ---
+class Supervisor:
+	"""
+	Запускає `workers` процесів, сам отримує апдейти через getUpdates і пересилає кожен
+	воркеру, обраному за chat_id (HashRing). Живий стан чату (черги повідомлень, таймери
+	автовидалення клавіатур) завжди в одному процесі. Впалий воркер перезапускається
+	з тією ж чергою, тож апдейти його чатів не губляться.
+	"""
+
+	def __init__(self, workers: int):
+		self.workers = workers
+		self.ring = HashRing(workers)
+		self._context = multiprocessing.get_context("spawn")
+		self._queues = [self._context.Queue() for _ in range(workers)]
+		self._processes: List[Optional[multiprocessing.Process]] = [None] * workers
+		self._stopping = False
+
+	def _start_worker(self, index: int):
+		process = self._context.Process(
+			target=_worker_entry,
+			args=(index, self.workers, self._queues[index]),
+			name=f"yuki-worker-{index}",
+			daemon=False,
+		)
+		process.start()
+		self._processes[index] = process
+		logger.info("Запущено воркер %d (pid %d).", index, process.pid)
+
+	def route(self, update: Dict[str, Any]):
+		self._queues[self.ring.node_for(shard_key(update))].put(update)
+
+	async def _watch_workers(self):
+		while not self._stopping:
+			await asyncio.sleep(WORKER_RESTART_DELAY)
+			for index, process in enumerate(self._processes):
+				if process is not None and not process.is_alive() and not self._stopping:
+					logger.error("Воркер %d завершився з кодом %s — перезапуск.", index, process.exitcode)
+					self._start_worker(index)
+
+	async def _poll(self, bot: Bot, dp: Dispatcher, polling_timeout: int = 30):
+		allowed_updates = dp.resolve_used_update_types()
+		offset: Optional[int] = None
+		webhook_deleted = False
+		while True:
+			try:
+				if not webhook_deleted:
+					await bot.delete_webhook()
+					webhook_deleted = True
+				updates = await bot.get_updates(
+					offset=offset,
+					timeout=polling_timeout,
+					allowed_updates=allowed_updates,
+					request_timeout=int(bot.session.timeout + polling_timeout),
+				)
+			except TelegramNetworkError as e:
+				logger.warning(f"[Мережа] Втрачено з'єднання: {e}. Повтор через 10 сек...")
+				await asyncio.sleep(10)
+				continue
+			except RestartingTelegram as e:
+				logger.info(f"[Telegram] Перезапуск: {e}")
+				await asyncio.sleep(5)
+				continue
+			except Exception as e:
+				# 5xx, конфлікт з іншим getUpdates тощо: як і run_polling, не зупиняємо бот, а повторюємо
+				logger.exception(f"[Фатальна помилка] {e}")
+				await asyncio.sleep(5)
+				continue
+			for update in updates:
+				offset = update.update_id + 1
+				self.route(update.model_dump(mode="json", exclude_unset=True, by_alias=True))
+
+	async def run(self, bot: Bot, dp: Dispatcher):
+		"""Працює до скасування задачі; потім зупиняє воркерів (дочекавшись їхніх апдейтів)."""
+		for index in range(self.workers):
+			self._start_worker(index)
+		watcher = asyncio.create_task(self._watch_workers())
+		try:
+			await self._poll(bot, dp)
+		finally:
+			self._stopping = True
+			watcher.cancel()
+			await self.stop()
+
+	async def stop(self):
+		for queue in self._queues:
+			queue.put(None)
+		loop = asyncio.get_running_loop()
+		for index, process in enumerate(self._processes):
+			if process is None:
+				continue
+			await loop.run_in_executor(None, process.join, WORKER_STOP_TIMEOUT)
+			if process.is_alive():
+				logger.warning("Воркер %d не завершився за %s сек — примусова зупинка.", index, WORKER_STOP_TIMEOUT)
+				process.kill()
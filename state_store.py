@@ -0,0 +1,278 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import json
+import logging
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Mapping, Optional, Tuple
+
+import aiosqlite
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+
+import config
+from chat_history import db_pool
+
+logger = logging.getLogger("yuki.state_store")
+
+# --- Налаштування сховища стану ---
+STATE_BACKEND = getattr(config, "STATE_BACKEND", "sqlite")          # "sqlite" або "memory"
+STATE_MAX_ENTRIES = getattr(config, "STATE_MAX_ENTRIES", 10000)     # записів на простір імен (найдавніше змінені витісняються)
+STATE_PRUNE_INTERVAL = getattr(config, "STATE_PRUNE_INTERVAL", 60)  # не частіше ніж раз на N сек чистити прострочені записи
+
+# --- SQL-запити ---
+SQL_CREATE_STATE = '''
+	CREATE TABLE IF NOT EXISTS kv_state (
+		namespace TEXT NOT NULL,
+		key TEXT NOT NULL,
+		value TEXT NOT NULL,
+		expires_at REAL,
+		updated_at REAL NOT NULL,
+		PRIMARY KEY (namespace, key)
+	)
+'''
+SQL_CREATE_STATE_UPDATED_INDEX = "CREATE INDEX IF NOT EXISTS idx_kv_state_updated ON kv_state (namespace, updated_at)"
+SQL_CREATE_STATE_EXPIRES_INDEX = "CREATE INDEX IF NOT EXISTS idx_kv_state_expires ON kv_state (expires_at) WHERE expires_at IS NOT NULL"
+SQL_BEGIN_IMMEDIATE = "BEGIN IMMEDIATE"
+SQL_SELECT_VALUE = "SELECT value FROM kv_state WHERE namespace = ? AND key = ? AND (expires_at IS NULL OR expires_at > ?)"
+SQL_UPSERT_VALUE = '''
+	INSERT INTO kv_state (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)
+	ON CONFLICT(namespace, key) DO UPDATE SET
+		value = excluded.value, expires_at = excluded.expires_at, updated_at = excluded.updated_at
+'''
+SQL_DELETE_VALUE = "DELETE FROM kv_state WHERE namespace = ? AND key = ?"
+SQL_DELETE_EXPIRED = "DELETE FROM kv_state WHERE expires_at IS NOT NULL AND expires_at <= ?"
+SQL_EVICT_OLDEST = '''
+	DELETE FROM kv_state WHERE namespace = ? AND key IN (
+		SELECT key FROM kv_state WHERE namespace = ? ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+	)
+'''
+
+def _expires_at(ttl: Optional[float], now: float) -> Optional[float]:
+	return now + ttl if ttl else None
+
+# --- Інтерфейс сховища стану ---
+class StateStore(ABC):
+	"""
+	Key-value сховище короткоживучого стану розмов (FSM aiogram, колбеки кнопок, кеші сторінок).
+	Записи згруповані за просторами імен; кожен запис може мати TTL, а простір імен обмежений
+	max_entries записами — при переповненні витісняються найдавніше змінені.
+	Значення мають серіалізуватися в JSON. Ключі — рядки.
+	"""
+
+	async def open(self):
+		pass
+
+	async def close(self):
+		pass
+
+	@abstractmethod
+	async def get(self, namespace: str, key: str) -> Any:
+		"""Повертає значення або None, якщо запису немає чи він прострочений."""
+
+	@abstractmethod
+	async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float], max_entries: int):
+		"""Записує значення з TTL (None — безстроково), витісняючи найдавніші записи понад max_entries."""
+
+	@abstractmethod
+	async def pop(self, namespace: str, key: str) -> Any:
+		"""Видаляє запис і повертає його значення (None, якщо не було)."""
+
+	@abstractmethod
+	async def update(self, namespace: str, key: str, fn: Callable[[Any], Any], ttl: Optional[float], max_entries: int) -> Any:
+		"""
+		Атомарно замінює значення на fn(поточне або None) і повертає нове.
+		Якщо fn повертає None, запис видаляється.
+		"""
+
+# --- Пам'ять процесу: без файлів, стан зникає при перезапуску ---
+class MemoryStateStore(StateStore):
+	def __init__(self):
+		self._namespaces: Dict[str, "OrderedDict[str, Tuple[Any, Optional[float]]]"] = {}
+
+	def _entries(self, namespace: str) -> "OrderedDict[str, Tuple[Any, Optional[float]]]":
+		return self._namespaces.setdefault(namespace, OrderedDict())
+
+	def _read(self, namespace: str, key: str) -> Any:
+		entries = self._entries(namespace)
+		entry = entries.get(key)
+		if entry is None:
+			return None
+		value, expires_at = entry
+		if expires_at is not None and expires_at <= time.time():
+			del entries[key]
+			return None
+		return value
+
+	def _write(self, namespace: str, key: str, value: Any, ttl: Optional[float], max_entries: int):
+		entries = self._entries(namespace)
+		if value is None:
+			entries.pop(key, None)
+			return
+		now = time.time()
+		entries[key] = (value, _expires_at(ttl, now))
+		entries.move_to_end(key)
+		if len(entries) > max_entries:
+			for stale in [k for k, (_, expires_at) in entries.items() if expires_at is not None and expires_at <= now]:
+				del entries[stale]
+			while len(entries) > max_entries:
+				entries.popitem(last=False)
+
+	async def get(self, namespace: str, key: str) -> Any:
+		return self._read(namespace, key)
+
+	async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float], max_entries: int):
+		self._write(namespace, key, value, ttl, max_entries)
+
+	async def pop(self, namespace: str, key: str) -> Any:
+		value = self._read(namespace, key)
+		self._entries(namespace).pop(key, None)
+		return value
+
+	async def update(self, namespace: str, key: str, fn: Callable[[Any], Any], ttl: Optional[float], max_entries: int) -> Any:
+		# Між читанням і записом немає await — для одного циклу подій це атомарно
+		value = fn(self._read(namespace, key))
+		self._write(namespace, key, value, ttl, max_entries)
+		return value
+
+# --- SQLite: спільний файл бази (WAL), стан переживає перезапуск і видимий усім процесам ---
+class SQLiteStateStore(StateStore):
+	def __init__(self, prune_interval: float = STATE_PRUNE_INTERVAL):
+		self.prune_interval = prune_interval
+		self._last_prune = 0.0
+
+	async def open(self):
+		async with db_pool.writer() as db:
+			await db.execute(SQL_CREATE_STATE)
+			await db.execute(SQL_CREATE_STATE_UPDATED_INDEX)
+			await db.execute(SQL_CREATE_STATE_EXPIRES_INDEX)
+			await db.execute(SQL_DELETE_EXPIRED, (time.time(),))
+		self._last_prune = time.monotonic()
+
+	async def _write(self, db: aiosqlite.Connection, namespace: str, key: str, value: Any, ttl: Optional[float], max_entries: int):
+		now = time.time()
+		if value is None:
+			await db.execute(SQL_DELETE_VALUE, (namespace, key))
+			return
+		await db.execute(SQL_UPSERT_VALUE, (namespace, key, json.dumps(value, ensure_ascii=False), _expires_at(ttl, now), now))
+		if time.monotonic() - self._last_prune >= self.prune_interval:
+			self._last_prune = time.monotonic()
+			await db.execute(SQL_DELETE_EXPIRED, (now,))
+		await db.execute(SQL_EVICT_OLDEST, (namespace, namespace, max_entries))
+
+	@staticmethod
+	async def _read(db: aiosqlite.Connection, namespace: str, key: str) -> Any:
+		cursor = await db.execute(SQL_SELECT_VALUE, (namespace, key, time.time()))
+		row = await cursor.fetchone()
+		await cursor.close()
+		return json.loads(row[0]) if row else None
+
+	async def get(self, namespace: str, key: str) -> Any:
+		async with db_pool.reader() as db:
+			return await self._read(db, namespace, key)
+
+	async def set(self, namespace: str, key: str, value: Any, ttl: Optional[float], max_entries: int):
+		async with db_pool.writer() as db:
+			await self._write(db, namespace, key, value, ttl, max_entries)
+
+	async def pop(self, namespace: str, key: str) -> Any:
+		async with db_pool.writer() as db:
+			await db.execute(SQL_BEGIN_IMMEDIATE)
+			value = await self._read(db, namespace, key)
+			await db.execute(SQL_DELETE_VALUE, (namespace, key))
+		return value
+
+	async def update(self, namespace: str, key: str, fn: Callable[[Any], Any], ttl: Optional[float], max_entries: int) -> Any:
+		# BEGIN IMMEDIATE бере блокування запису одразу — інший процес не вклиниться між читанням і записом
+		async with db_pool.writer() as db:
+			await db.execute(SQL_BEGIN_IMMEDIATE)
+			value = fn(await self._read(db, namespace, key))
+			await self._write(db, namespace, key, value, ttl, max_entries)
+		return value
+
+def _create_store(backend: str) -> StateStore:
+	if backend == "memory":
+		return MemoryStateStore()
+	if backend != "sqlite":
+		logger.warning("Невідомий STATE_BACKEND '%s', використовую sqlite.", backend)
+	return SQLiteStateStore()
+
+state_store = _create_store(STATE_BACKEND)
+
+# --- Простір імен з власними TTL та лімітом ---
+class StateNamespace:
+	"""
+	Заміна модульного словника: `await ns.get(key)`, `await ns.set(key, value)`, `await ns.pop(key)`,
+	`await ns.update(key, fn)`. Помилки бази не ламають обробник — записуються в лог,
+	а читання повертає None (як для відсутнього запису).
+	"""
+
+	def __init__(self, name: str, ttl: Optional[float] = None, max_entries: int = STATE_MAX_ENTRIES, store: Optional[StateStore] = None):
+		self.name = name
+		self.ttl = ttl
+		self.max_entries = max_entries
+		self._store = store
+
+	@property
+	def store(self) -> StateStore:
+		return self._store or state_store
+
+	async def get(self, key: Any) -> Any:
+		try:
+			return await self.store.get(self.name, str(key))
+		except aiosqlite.Error as e:
+			logger.warning("Помилка читання стану %s/%s: %s", self.name, key, e)
+			return None
+
+	async def set(self, key: Any, value: Any, ttl: Optional[float] = None):
+		try:
+			await self.store.set(self.name, str(key), value, ttl or self.ttl, self.max_entries)
+		except aiosqlite.Error as e:
+			logger.warning("Помилка запису стану %s/%s: %s", self.name, key, e)
+
+	async def pop(self, key: Any) -> Any:
+		try:
+			return await self.store.pop(self.name, str(key))
+		except aiosqlite.Error as e:
+			logger.warning("Помилка видалення стану %s/%s: %s", self.name, key, e)
+			return None
+
+	async def update(self, key: Any, fn: Callable[[Any], Any], ttl: Optional[float] = None) -> Any:
+		try:
+			return await self.store.update(self.name, str(key), fn, ttl or self.ttl, self.max_entries)
+		except aiosqlite.Error as e:
+			logger.warning("Помилка оновлення стану %s/%s: %s", self.name, key, e)
+			return None
+
+# --- FSM-сховище aiogram поверх StateStore ---
+class StateStoreStorage(BaseStorage):
+	"""Замінює MemoryStorage: стан і дані FSM зберігаються у state_store і переживають перезапуск."""
+
+	def __init__(self, ttl: Optional[float] = None, max_entries: int = STATE_MAX_ENTRIES, key_builder: Optional[KeyBuilder] = None):
+		self.key_builder = key_builder or DefaultKeyBuilder(with_destiny=True)
+		self.states = StateNamespace("fsm_state", ttl, max_entries)
+		self.data = StateNamespace("fsm_data", ttl, max_entries)
+
+	async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+		value = state.state if isinstance(state, State) else state
+		await self.states.set(self.key_builder.build(key, "state"), value)
+
+	async def get_state(self, key: StorageKey) -> Optional[str]:
+		return await self.states.get(self.key_builder.build(key, "state"))
+
+	async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+		await self.data.set(self.key_builder.build(key, "data"), dict(data) or None)
+
+	async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+		return dict(await self.data.get(self.key_builder.build(key, "data")) or {})
+
+	async def update_data(self, key: StorageKey, data: Mapping[str, Any]) -> Dict[str, Any]:
+		updated = await self.data.update(self.key_builder.build(key, "data"), lambda current: {**(current or {}), **data} or None)
+		return updated or {}
+
+	async def close(self) -> None:
+		# Сховище закривається разом із базою (ai_router.close_db)
+		pass
@@ -0,0 +1,291 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import atexit
+import contextvars
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import urllib.request
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+import config
+
+logger = logging.getLogger("yuki.tracing")
+
+# --- Налаштування експорту (None — трасування вимкнено) ---
+TRACE_EXPORT = getattr(config, "TRACE_EXPORT", None)  # "jsonl" або "otlp"
+TRACE_FILE = getattr(config, "TRACE_FILE", "yuki_traces.jsonl")
+TRACE_OTLP_ENDPOINT = getattr(config, "TRACE_OTLP_ENDPOINT", "http://127.0.0.1:4318/v1/traces")
+TRACE_SAMPLE_RATE = getattr(config, "TRACE_SAMPLE_RATE", 1.0)  # частка апдейтів, що трасуються
+TRACE_SERVICE_NAME = getattr(config, "TRACE_SERVICE_NAME", "yuki-bot")
+TRACE_BATCH_SIZE = 256
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+_exporter: Optional["_Exporter"] = None
+
+# --- Спан: один вимірюваний крок обробки апдейта ---
+class Span:
+	__slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "links", "start_ns", "end_ns", "error")
+
+	def __init__(
+		self,
+		name: str,
+		trace_id: str,
+		parent_id: Optional[str],
+		attributes: Dict[str, Any],
+		links: Optional[List[Tuple[str, str]]] = None
+	):
+		self.trace_id = trace_id
+		self.span_id = os.urandom(8).hex()
+		self.parent_id = parent_id
+		self.name = name
+		self.attributes = attributes
+		self.links = links or []  # (trace_id, span_id) пов'язаних спанів з інших трасувань
+		self.start_ns = time.time_ns()
+		self.end_ns = 0
+		self.error: Optional[str] = None
+
+	def set_attribute(self, key: str, value: Any):
+		self.attributes[key] = value
+
+	def to_json(self) -> Dict[str, Any]:
+		entry = {
+			"trace_id": self.trace_id,
+			"span_id": self.span_id,
+			"parent_id": self.parent_id,
+			"name": self.name,
+			"start_ns": self.start_ns,
+			"duration_ms": round((self.end_ns - self.start_ns) / 1e6, 3),
+			"attributes": self.attributes,
+		}
+		if self.links:
+			entry["links"] = [{"trace_id": trace_id, "span_id": span_id} for trace_id, span_id in self.links]
+		if self.error:
+			entry["error"] = self.error
+		return entry
+
+	def to_otlp(self) -> Dict[str, Any]:
+		entry = {
+			"traceId": self.trace_id,
+			"spanId": self.span_id,
+			"name": self.name,
+			"kind": 1 if self.parent_id else 2,  # INTERNAL / SERVER
+			"startTimeUnixNano": str(self.start_ns),
+			"endTimeUnixNano": str(self.end_ns),
+			"attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items()],
+			"status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+		}
+		if self.parent_id:
+			entry["parentSpanId"] = self.parent_id
+		if self.links:
+			entry["links"] = [{"traceId": trace_id, "spanId": span_id} for trace_id, span_id in self.links]
+		return entry
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+	if isinstance(value, bool):
+		return {"key": key, "value": {"boolValue": value}}
+	if isinstance(value, int):
+		return {"key": key, "value": {"intValue": str(value)}}
+	if isinstance(value, float):
+		return {"key": key, "value": {"doubleValue": value}}
+	return {"key": key, "value": {"stringValue": str(value)}}
+
+# --- Відкриття спанів ---
+class span:
+	"""
+	Контекстний менеджер (звичайний і async) для дочірнього спана поточного трасування.
+	Поза трасованим апдейтом (або коли трасування вимкнене) нічого не робить.
+	"""
+
+	__slots__ = ("name", "attributes", "_span", "_token")
+
+	def __init__(self, name: str, **attributes: Any):
+		self.name = name
+		self.attributes = attributes
+		self._span: Optional[Span] = None
+
+	def __enter__(self) -> Optional[Span]:
+		parent = _current_span.get()
+		if parent is None:
+			return None
+		self._span = Span(self.name, parent.trace_id, parent.span_id, self.attributes)
+		self._token = _current_span.set(self._span)
+		return self._span
+
+	def __exit__(self, exc_type, exc, tb):
+		if self._span is None:
+			return False
+		_current_span.reset(self._token)
+		_finish(self._span, exc_type)
+		return False
+
+	async def __aenter__(self) -> Optional[Span]:
+		return self.__enter__()
+
+	async def __aexit__(self, exc_type, exc, tb):
+		return self.__exit__(exc_type, exc, tb)
+
+class linked_span:
+	"""
+	Контекстний менеджер (звичайний і async) для роботи над кількома апдейтами одразу (пачка черги).
+	Відкриває кореневий спан нового трасування з посиланнями на спан кожного апдейта пачки.
+	Якщо жоден з апдейтів не трасувався, прибирає успадкований поточний спан,
+	щоб дочірні спани не потрапили в чуже (можливо, вже завершене) трасування.
+	"""
+
+	__slots__ = ("name", "attributes", "parents", "_span", "_token")
+
+	def __init__(self, name: str, parents: Iterable[Optional[Span]], **attributes: Any):
+		self.name = name
+		self.attributes = attributes
+		self.parents = parents
+		self._span: Optional[Span] = None
+
+	def __enter__(self) -> Optional[Span]:
+		links = [(parent.trace_id, parent.span_id) for parent in self.parents if parent is not None]
+		if links and _exporter is not None:
+			self._span = Span(self.name, os.urandom(16).hex(), None, self.attributes, links)
+		self._token = _current_span.set(self._span)
+		return self._span
+
+	def __exit__(self, exc_type, exc, tb):
+		_current_span.reset(self._token)
+		if self._span is not None:
+			_finish(self._span, exc_type)
+		return False
+
+	async def __aenter__(self) -> Optional[Span]:
+		return self.__enter__()
+
+	async def __aexit__(self, exc_type, exc, tb):
+		return self.__exit__(exc_type, exc, tb)
+
+def current_span() -> Optional[Span]:
+	return _current_span.get()
+
+def _finish(finished: Span, exc_type):
+	finished.end_ns = time.time_ns()
+	if exc_type is not None:
+		finished.error = exc_type.__name__
+	if _exporter is not None:
+		_exporter.submit(finished)
+
+# --- Зовнішній middleware диспетчера: одне трасування на апдейт ---
+class TracingMiddleware(BaseMiddleware):
+	async def __call__(
+		self,
+		handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+		event: TelegramObject,
+		data: Dict[str, Any]
+	) -> Any:
+		if _exporter is None or random.random() >= TRACE_SAMPLE_RATE:
+			return await handler(event, data)
+
+		attributes: Dict[str, Any] = {}
+		if isinstance(event, Update):
+			attributes["update_id"] = event.update_id
+			attributes["event_type"] = event.event_type
+		if (user := data.get("event_from_user")) is not None:
+			attributes["uid"] = user.id
+		if (chat := data.get("event_chat")) is not None:
+			attributes["cid"] = chat.id
+
+		root = Span("update", os.urandom(16).hex(), None, attributes)
+		token = _current_span.set(root)
+		exc_type = None
+		try:
+			return await handler(event, data)
+		except BaseException as e:
+			exc_type = type(e)
+			raise
+		finally:
+			_current_span.reset(token)
+			_finish(root, exc_type)
+
+# --- Експорт: окремий потік, щоб запис у файл чи HTTP не блокував цикл подій ---
+class _Exporter:
+	def __init__(self, mode: str):
+		self.mode = mode
+		self._queue: "queue.SimpleQueue[Optional[Span]]" = queue.SimpleQueue()
+		self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+		self._thread.start()
+
+	def submit(self, finished: Span):
+		self._queue.put(finished)
+
+	def stop(self, timeout: float = 5.0):
+		self._queue.put(None)
+		self._thread.join(timeout)
+
+	def _run(self):
+		running = True
+		while running:
+			batch: List[Span] = []
+			item = self._queue.get()
+			while item is not None:
+				batch.append(item)
+				if len(batch) >= TRACE_BATCH_SIZE:
+					break
+				try:
+					item = self._queue.get_nowait()
+				except queue.Empty:
+					break
+			running = item is not None
+			if not batch:
+				continue
+			try:
+				self._write(batch)
+			except Exception as e:
+				logger.warning("Не вдалося експортувати %d спанів: %s", len(batch), e)
+
+	def _write(self, batch: List[Span]):
+		if self.mode == "otlp":
+			payload = {
+				"resourceSpans": [{
+					"resource": {"attributes": [_otlp_attribute("service.name", TRACE_SERVICE_NAME)]},
+					"scopeSpans": [{"scope": {"name": "yuki"}, "spans": [item.to_otlp() for item in batch]}],
+				}]
+			}
+			request = urllib.request.Request(
+				TRACE_OTLP_ENDPOINT,
+				data=json.dumps(payload).encode("utf-8"),
+				headers={"Content-Type": "application/json"},
+				method="POST",
+			)
+			with urllib.request.urlopen(request, timeout=5) as response:
+				response.read()
+		else:
+			with open(TRACE_FILE, "a", encoding="utf-8") as f:
+				for item in batch:
+					f.write(json.dumps(item.to_json(), ensure_ascii=False, default=str) + "\n")
+
+# --- Запуск і зупинка ---
+def setup_tracing() -> bool:
+	"""Запускає експорт спанів, якщо задано TRACE_EXPORT. Повертає True, якщо трасування увімкнене."""
+	global _exporter
+	if _exporter is not None:
+		return True
+	if TRACE_EXPORT not in ("jsonl", "otlp"):
+		if TRACE_EXPORT:
+			logger.warning("Невідомий TRACE_EXPORT=%r — трасування вимкнено", TRACE_EXPORT)
+		return False
+	_exporter = _Exporter(TRACE_EXPORT)
+	atexit.register(stop_tracing)
+	logger.info("Трасування увімкнено: %s", TRACE_OTLP_ENDPOINT if TRACE_EXPORT == "otlp" else TRACE_FILE)
+	return True
+
+def stop_tracing():
+	"""Дописує спани з черги та зупиняє потік експорту."""
+	global _exporter
+	if _exporter is not None:
+		exporter, _exporter = _exporter, None
+		exporter.stop()
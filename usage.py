@@ -0,0 +1,163 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import datetime
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import aiosqlite
+
+import config
+from chat_history import db_pool
+
+logger = logging.getLogger("yuki.usage")
+
+# --- Денні квоти токенів на роль (None — без обмеження) ---
+USAGE_SOFT_QUOTA = {"TENZO": None, "REGULAR": 150_000, **getattr(config, "USAGE_SOFT_QUOTA", {})}
+USAGE_HARD_QUOTA = {"TENZO": None, "REGULAR": 300_000, **getattr(config, "USAGE_HARD_QUOTA", {})}
+
+# --- SQL-запити ---
+SQL_CREATE_USAGE = '''
+	CREATE TABLE IF NOT EXISTS usage_daily (
+		user_id INTEGER NOT NULL,
+		day TEXT NOT NULL,
+		user_role TEXT,
+		requests INTEGER NOT NULL DEFAULT 0,
+		prompt_tokens INTEGER NOT NULL DEFAULT 0,
+		completion_tokens INTEGER NOT NULL DEFAULT 0,
+		cached_tokens INTEGER NOT NULL DEFAULT 0,
+		PRIMARY KEY (user_id, day)
+	) WITHOUT ROWID
+'''
+SQL_CREATE_USAGE_DAY_INDEX = "CREATE INDEX IF NOT EXISTS idx_usage_daily_day ON usage_daily (day)"
+SQL_RECORD_USAGE = '''
+	INSERT INTO usage_daily (user_id, day, user_role, requests, prompt_tokens, completion_tokens, cached_tokens)
+	VALUES (?, ?, ?, 1, ?, ?, ?)
+	ON CONFLICT(user_id, day) DO UPDATE SET
+		user_role = COALESCE(excluded.user_role, user_role),
+		requests = requests + 1,
+		prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+		completion_tokens = completion_tokens + excluded.completion_tokens,
+		cached_tokens = cached_tokens + excluded.cached_tokens
+'''
+SQL_SELECT_USER_DAY = "SELECT prompt_tokens + completion_tokens FROM usage_daily WHERE user_id = ? AND day = ?"
+SQL_SELECT_TOP = '''
+	SELECT user_id, MAX(user_role), SUM(requests), SUM(prompt_tokens), SUM(completion_tokens), SUM(cached_tokens)
+	FROM usage_daily WHERE day >= ?
+	GROUP BY user_id
+	ORDER BY SUM(prompt_tokens) + SUM(completion_tokens) DESC
+	LIMIT ?
+'''
+
+# --- Стан квоти ---
+class QuotaStatus(NamedTuple):
+	used: int
+	soft_limit: Optional[int]
+	hard_limit: Optional[int]
+
+	@property
+	def soft_exceeded(self) -> bool:
+		return self.soft_limit is not None and self.used >= self.soft_limit
+
+	@property
+	def hard_exceeded(self) -> bool:
+		return self.hard_limit is not None and self.used >= self.hard_limit
+
+class UsageRow(NamedTuple):
+	user_id: int
+	role: Optional[str]
+	requests: int
+	prompt_tokens: int
+	completion_tokens: int
+	cached_tokens: int
+
+	@property
+	def total_tokens(self) -> int:
+		return self.prompt_tokens + self.completion_tokens
+
+# Сьогоднішні суми в пам'яті, щоб перевірка квоти перед запитом не ходила в базу
+_today_totals: Dict[int, Tuple[str, int]] = {}
+_totals_cache_enabled = True
+
+def disable_totals_cache():
+	"""
+	Перевірка квоти завжди читає суму з бази. Потрібно, коли в ту саму базу пишуть кілька
+	процесів (воркери): локальна сума не бачить чужих запитів, і квоту можна перевищити.
+	"""
+	global _totals_cache_enabled
+	_totals_cache_enabled = False
+	_today_totals.clear()
+
+def _today() -> str:
+	return datetime.date.today().isoformat()
+
+def usage_counts(usage_metadata: Any) -> Tuple[int, int, int]:
+	"""(prompt, completion, cached) токенів з usage_metadata відповіді Gemini."""
+	if usage_metadata is None:
+		return 0, 0, 0
+	return (
+		getattr(usage_metadata, "prompt_token_count", 0) or 0,
+		getattr(usage_metadata, "candidates_token_count", 0) or 0,
+		getattr(usage_metadata, "cached_content_token_count", 0) or 0,
+	)
+
+# --- Ініціалізація таблиці ---
+async def init_usage():
+	"""Створює таблицю денного обліку токенів (пул має бути вже відкритий)."""
+	try:
+		async with db_pool.writer() as db:
+			await db.execute(SQL_CREATE_USAGE)
+			await db.execute(SQL_CREATE_USAGE_DAY_INDEX)
+	except aiosqlite.Error as e:
+		logger.error("Помилка ініціалізації обліку токенів: %s", e)
+
+# --- Запис використання ---
+async def record_usage(user_id: int, response: Any, user_role: Optional[str] = None):
+	"""Додає токени з відповіді Gemini до денної суми користувача."""
+	prompt, completion, cached = usage_counts(getattr(response, "usage_metadata", None))
+	day = _today()
+	try:
+		async with db_pool.writer() as db:
+			await db.execute(SQL_RECORD_USAGE, (user_id, day, user_role, prompt, completion, cached))
+	except aiosqlite.Error as e:
+		logger.warning("Не вдалося записати використання токенів для %d: %s", user_id, e)
+		return
+	cached_day, total = _today_totals.get(user_id, (day, None))
+	if _totals_cache_enabled and cached_day == day and total is not None:
+		_today_totals[user_id] = (day, total + prompt + completion)
+
+# --- Перевірка квоти ---
+async def get_quota_status(user_id: int, user_role: str) -> QuotaStatus:
+	"""Скільки токенів користувач використав сьогодні та його ліміти для ролі."""
+	day = _today()
+	cached_day, total = _today_totals.get(user_id, (None, None))
+	if not _totals_cache_enabled or cached_day != day or total is None:
+		total = 0
+		try:
+			async with db_pool.reader() as db:
+				cursor = await db.execute(SQL_SELECT_USER_DAY, (user_id, day))
+				row = await cursor.fetchone()
+				await cursor.close()
+			total = row[0] if row else 0
+		except aiosqlite.Error as e:
+			logger.warning("Не вдалося прочитати використання токенів для %d: %s", user_id, e)
+		if _totals_cache_enabled:
+			if len(_today_totals) > 10000:
+				_today_totals.clear()
+			_today_totals[user_id] = (day, total)
+	return QuotaStatus(total, USAGE_SOFT_QUOTA.get(user_role), USAGE_HARD_QUOTA.get(user_role))
+
+# --- Звіт для адміністратора ---
+async def get_top_consumers(days: int = 1, limit: int = 10) -> List[UsageRow]:
+	"""Користувачі з найбільшою кількістю токенів за останні `days` днів (включно з сьогодні)."""
+	since = (datetime.date.today() - datetime.timedelta(days=max(1, days) - 1)).isoformat()
+	try:
+		async with db_pool.reader() as db:
+			cursor = await db.execute(SQL_SELECT_TOP, (since, limit))
+			rows = await cursor.fetchall()
+			await cursor.close()
+	except aiosqlite.Error as e:
+		logger.error("Не вдалося побудувати звіт використання: %s", e)
+		return []
+	return [UsageRow(*row) for row in rows]
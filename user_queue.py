@@ -0,0 +1,88 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import asyncio
+import logging
+import weakref
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+
+from background import spawn
+from tracing import Span, current_span, linked_span
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# --- Впорядкована черга на кожен ключ зі склеюванням швидких повідомлень ---
+class CoalescingQueue(Generic[T]):
+	"""
+	Для кожного ключа (наприклад, (chat_id, user_id)) обробляє елементи строго по черзі.
+	Елементи, що надходять з паузою меншою за `debounce` секунд, збираються в одну
+	пачку (але не довше за `max_wait`), і обробник викликається один раз для всієї пачки.
+	Поки пачка обробляється, нові елементи накопичуються для наступного виклику.
+	Кожна пачка обробляється у власному спані, пов'язаному з трасуванням кожного її елемента.
+	"""
+
+	def __init__(
+		self,
+		handler: Callable[[Hashable, List[T]], Awaitable[Any]],
+		debounce: float = 1.5,
+		max_wait: float = 5.0,
+		name: str = "queue"
+	):
+		self.handler = handler
+		self.debounce = debounce
+		self.max_wait = max_wait
+		self.name = name
+		self._pending: Dict[Hashable, List[Tuple[T, Optional[Span]]]] = {}
+		self._workers: Dict[Hashable, asyncio.Task] = {}
+
+	def __len__(self) -> int:
+		return sum(len(items) for items in self._pending.values())
+
+	def submit(self, key: Hashable, item: T) -> bool:
+		"""Додає елемент у чергу ключа. Повертає True, якщо для ключа запущено нового обробника."""
+		self._pending.setdefault(key, []).append((item, current_span()))
+		if key in self._workers:
+			return False
+		self._workers[key] = spawn(self._worker(key), name=f"{self.name}-{key}")
+		return True
+
+	async def _collect(self, key: Hashable):
+		loop = asyncio.get_running_loop()
+		started = loop.time()
+		seen = -1
+		while seen != len(self._pending.get(key, ())) and loop.time() - started < self.max_wait:
+			seen = len(self._pending.get(key, ()))
+			await asyncio.sleep(min(self.debounce, max(0.0, self.max_wait - (loop.time() - started))))
+
+	async def _worker(self, key: Hashable):
+		try:
+			while True:
+				await self._collect(key)
+				entries = self._pending.pop(key, [])
+				if not entries:
+					break
+				batch = [item for item, _ in entries]
+				try:
+					async with linked_span(f"queue {self.name}", [parent for _, parent in entries], queue=self.name, batch_size=len(batch)):
+						await self.handler(key, batch)
+				except Exception as e:
+					logger.error("Помилка обробника черги '%s' для %s: %s", self.name, key, e, exc_info=True)
+		finally:
+			self._workers.pop(key, None)
+
+# --- Замки на користувача для атомарного читання/запису історії ---
+class KeyedLocks:
+	"""asyncio.Lock на кожен ключ; невикористані замки звільняються автоматично."""
+
+	def __init__(self):
+		self._locks: "weakref.WeakValueDictionary[Hashable, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+	def get(self, key: Hashable) -> asyncio.Lock:
+		lock = self._locks.get(key)
+		if lock is None:
+			lock = asyncio.Lock()
+			self._locks[key] = lock
+		return lock
@@ -13,66 +13,69 @@ from aiogram.filters import Command
 from aiogram.types import FSInputFile
 from aiogram.exceptions import TelegramForbiddenError
 from waifupics import waifu_sfw
+from state_store import StateNamespace
 import config
 
 logger = logging.getLogger(__name__)
 waifu_router = Router()
 
-# --- Папка з зображеннями ---
+# --- Папка з зображеннями (створюється при першому /waifu) ---
 WAIFU_FOLDER = os.path.join(os.getcwd(), config.WAIFU_FOLDER)
-os.makedirs(WAIFU_FOLDER, exist_ok=True)
 
-# --- Кеш авторизованих користувачів ---
-authorized_users: dict[int, float] = {}
+# --- Авторизовані користувачі (user_id -> час входу), запис живе WAIFU_TIMEOUT сек ---
+authorized_users = StateNamespace("waifu_auth", ttl=config.WAIFU_TIMEOUT)
 
-# --- Шлях до JSON-файлу з історією ---
-WAIFU_HISTORY_FILE = os.path.join(WAIFU_FOLDER, "sent_waifus.json")
+# --- Історія надсилань (user_id -> надіслані файли): у state_store, спільна для всіх воркерів ---
+sent_waifus = StateNamespace("waifu_sent")
 
-# --- Завантаження історії надсилань ---
-def load_sent_history() -> dict[int, set[str]]:
-	if os.path.exists(WAIFU_HISTORY_FILE):
-		try:
-			with open(WAIFU_HISTORY_FILE, "r", encoding="utf-8") as f:
-				raw = json.load(f)
-				return {int(k): set(v) for k, v in raw.items()}
-		except Exception as e:
-			logger.warning(f"Не вдалося завантажити історію waifu: {e}")
-	return {}
-
-# --- Збереження історії надсилань ---
-def save_sent_history():
-	try:
-		with open(WAIFU_HISTORY_FILE, "w", encoding="utf-8") as f:
-			json.dump({str(k): list(v) for k, v in sent_waifus_per_user.items()}, f, indent=2, ensure_ascii=False)
-	except Exception as e:
-		logger.warning(f"Не вдалося зберегти історію waifu: {e}")
+# --- Старий JSON-файл з історією: лише читається для користувачів, яких ще немає в state_store ---
+WAIFU_HISTORY_FILE = os.path.join(WAIFU_FOLDER, "sent_waifus.json")
+_legacy_history: dict[str, list[str]] | None = None
 
-# --- Історія надсилань ---
-sent_waifus_per_user: dict[int, set[str]] = load_sent_history()
+def load_legacy_history() -> dict[str, list[str]]:
+	global _legacy_history
+	if _legacy_history is None:
+		_legacy_history = {}
+		if os.path.exists(WAIFU_HISTORY_FILE):
+			try:
+				with open(WAIFU_HISTORY_FILE, "r", encoding="utf-8") as f:
+					_legacy_history = {str(k): list(v) for k, v in json.load(f).items()}
+			except Exception as e:
+				logger.warning(f"Не вдалося завантажити історію waifu: {e}")
+	return _legacy_history
 
 # --- Отримати випадкове зображення без повторень ---
-def get_random_local_waifu(folder: str, user_id: int) -> str | None:
+async def get_random_local_waifu(folder: str, user_id: int) -> str | None:
 	try:
+		os.makedirs(folder, exist_ok=True)
 		files = [f for f in os.listdir(folder) if f.lower().endswith(config.SUPPORTED_IMAGE_FORMATS)]
-		if not files:
-			logger.info(f"Немає зображень у папці: {folder}")
-			return None
+	except Exception as e:
+		logger.error(f"Помилка при доступі до папки {folder}: {e}")
+		return None
+	if not files:
+		logger.info(f"Немає зображень у папці: {folder}")
+		return None
 
-		sent = sent_waifus_per_user.get(user_id, set())
-		available = list(set(files) - sent)
+	legacy = load_legacy_history().get(str(user_id), [])
+	chosen = None
 
+	def pick(current: list[str] | None) -> list[str]:
+		# Вибір усередині update: читання й запис історії атомарні навіть між процесами
+		nonlocal chosen
+		sent = set(current if current is not None else legacy)
+		available = list(set(files) - sent)
 		if not available:
 			logger.info(f"Користувач {user_id} отримав усі зображення. Скидаємо список.")
-			sent_waifus_per_user[user_id] = set()
+			sent = set()
 			available = files
-
 		chosen = random.choice(available)
-		sent_waifus_per_user.setdefault(user_id, set()).add(chosen)
-		save_sent_history()
-		return os.path.join(folder, chosen)
-	except Exception as e:
-		logger.error(f"Помилка при доступі до папки {folder}: {e}")
-		return None
+		sent.add(chosen)
+		return sorted(sent)
+
+	await sent_waifus.update(user_id, pick)
+	if chosen is None:
+		chosen = random.choice(files)
+	return os.path.join(folder, chosen)
 
 # --- Обробка команди /waifu ---
 @waifu_router.message(Command("waifu"))
@@ -90,11 +93,10 @@ async def waifu_cmd(message: types.Message, bot: Bot, is_internal_call: bool = F
 		except Exception as e:
 			logger.warning(f"Не вдалося видалити повідомлення {message.message_id}: {e}")
 
-	now = time()
-	if user_id in authorized_users and (now - authorized_users[user_id]) < config.WAIFU_TIMEOUT:
+	if await authorized_users.get(user_id):
 		pass
 	elif password == config.WAIFU_PASSWORD:
-		authorized_users[user_id] = now
+		await authorized_users.set(user_id, time())
 	else:
 		if not is_internal_call:
 			try:
@@ -107,7 +109,7 @@ async def waifu_cmd(message: types.Message, bot: Bot, is_internal_call: bool = F
 			logger.error(f"Внутрішній виклик waifu_cmd для користувача %d не спрацював через невірний пароль.", user_id)
 		return
 
-	file_path = get_random_local_waifu(WAIFU_FOLDER, user_id)
+	file_path = await get_random_local_waifu(WAIFU_FOLDER, user_id)
 	if file_path:
 		try:
 			await message.answer_photo(FSInputFile(file_path))
@@ -4,14 +4,18 @@
 # --- Імортувати aiohttp ---
 import aiohttp
 
+from metrics import track_dependency
+
+WAIFU_API_URL = "https://api.waifu.pics"
+
 async def fetch_image(url):
-	async with aiohttp.ClientSession() as session:
+	async with track_dependency("waifu_pics", "fetch_image"), aiohttp.ClientSession() as session:
 		async with session.get(url) as response:
 			data = await response.json()
 			return data['url']
 
 async def waifu_sfw():
-	return await fetch_image('https://api.waifu.pics/sfw/waifu')
+	return await fetch_image(f'{WAIFU_API_URL}/sfw/waifu')
 
 async def waifu_nsfw():
-	return await fetch_image('https://api.waifu.pics/nsfw/waifu')
+	return await fetch_image(f'{WAIFU_API_URL}/nsfw/waifu')
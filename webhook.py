@@ -0,0 +1,88 @@
+# MIT License
+# Copyright (c) 2025 Madara273 <ravenhoxs@gmail.com>
+
+# --- Імпорти ---
+import asyncio
+import logging
+import secrets
+from typing import Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+import config
+
+logger = logging.getLogger("yuki.webhook")
+
+# --- Налаштування режиму webhook ---
+WEBHOOK_URL = getattr(config, "WEBHOOK_URL", None)        # публічна HTTPS-адреса, напр. "https://bot.example.com"
+WEBHOOK_PATH = getattr(config, "WEBHOOK_PATH", "/webhook")
+WEBHOOK_SECRET = getattr(config, "WEBHOOK_SECRET", None)  # None — випадковий секрет на кожен запуск
+WEBHOOK_HOST = getattr(config, "WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = getattr(config, "WEBHOOK_PORT", 8080)
+WEBHOOK_KEEPALIVE = getattr(config, "WEBHOOK_KEEPALIVE", 75)            # сек тримати з'єднання Telegram відкритим
+WEBHOOK_MAX_CONNECTIONS = getattr(config, "WEBHOOK_MAX_CONNECTIONS", 40)  # одночасних з'єднань від Telegram
+
+READY = web.AppKey("ready", asyncio.Event)
+
+# --- Службові маршрути ---
+async def _healthz(request: web.Request) -> web.Response:
+	return web.Response(text="ok")
+
+async def _readyz(request: web.Request) -> web.Response:
+	if request.app[READY].is_set():
+		return web.Response(text="ready")
+	return web.Response(status=503, text="not ready")
+
+def build_webhook_app(dp: Dispatcher, bot: Bot, secret: Optional[str], path: str = WEBHOOK_PATH) -> web.Application:
+	"""
+	Застосунок aiohttp, що приймає апдейти Telegram на `path`.
+	Запит з неправильним X-Telegram-Bot-Api-Secret-Token відхиляється (401); правильний —
+	одразу отримує 200, а апдейт обробляється у фоні. /healthz — процес живий,
+	/readyz — 200 лише після set_webhook (до того й під час зупинки — 503).
+	"""
+	app = web.Application()
+	app[READY] = asyncio.Event()
+	handler = SimpleRequestHandler(dispatcher=dp, bot=bot, secret_token=secret, handle_in_background=True)
+	# Маршрут без handler.register: той додає закриття сесії бота в on_shutdown, а сесію
+	# закриває main.shutdown після drain() — апдейти, що ще обробляються, мають змогу відповісти
+	app.router.add_post(path, handler.handle)
+	app.router.add_get("/healthz", _healthz)
+	app.router.add_get("/readyz", _readyz)
+	setup_application(app, dp, bot=bot)
+	return app
+
+async def start_webhook_server(app: web.Application, host: str = WEBHOOK_HOST, port: int = WEBHOOK_PORT) -> web.AppRunner:
+	"""Запускає HTTP-сервер застосунку. Повертає runner для зупинки."""
+	runner = web.AppRunner(app, access_log=None, keepalive_timeout=WEBHOOK_KEEPALIVE)
+	await runner.setup()
+	await web.TCPSite(runner, host, port).start()
+	logger.info("Webhook-сервер слухає %s:%d", host, port)
+	return runner
+
+# --- Запуск у режимі webhook ---
+async def run_webhook(dp: Dispatcher, bot: Bot):
+	"""
+	Піднімає сервер, реєструє webhook у Telegram і працює до скасування задачі.
+	Webhook не видаляється при зупинці: апдейти, що прийдуть під час перезапуску, Telegram доставить пізніше.
+	"""
+	if not WEBHOOK_URL:
+		raise RuntimeError("Для BOT_MODE = 'webhook' потрібно вказати WEBHOOK_URL у config.py")
+
+	secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+	app = build_webhook_app(dp, bot, secret)
+	runner = await start_webhook_server(app)
+	try:
+		await bot.set_webhook(
+			url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+			secret_token=secret,
+			allowed_updates=dp.resolve_used_update_types(),
+			max_connections=WEBHOOK_MAX_CONNECTIONS,
+		)
+		app[READY].set()
+		logger.info("Webhook зареєстровано: %s%s", WEBHOOK_URL.rstrip("/"), WEBHOOK_PATH)
+		await asyncio.Event().wait()
+	finally:
+		app[READY].clear()
+		await runner.cleanup()